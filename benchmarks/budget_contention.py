@@ -0,0 +1,178 @@
+"""Concurrent co-pay reservations against one province's budget.
+
+Usage::
+
+    python -m benchmarks.budget_contention --reservations 5000 --workers 4
+
+Every reservation is for the same province, so every one of them contends
+for the same budget row. Each simulated worker has its own engine on a
+shared temporary SQLite file, as separate processes would, and the
+reservations are spread over the workers and started all at once. Two
+modes are compared:
+
+* ``row``: every reservation is a conditional UPDATE of the row, the
+  single hot lock the budget pools are meant to avoid
+* ``leased``: ``flasx.core.budget.BudgetPools``, one per worker, reserving
+  from leased allotments, with a final reconcile
+
+The budget covers ``--oversubscribe`` less than what is asked for, so some
+reservations are refused; the run fails if more than the cap was spent.
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+os.environ.setdefault("SQLDB_URL", "sqlite+aiosqlite:///:memory:")
+
+from sqlalchemy import update
+from sqlalchemy.orm import sessionmaker
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from flasx import models
+from flasx.core import budget
+
+PROVINCE_ID = 1
+
+
+async def seed(url: str, cap: int):
+    engine, read_engine = models.build_engines(url)
+    engine.echo = False
+    async with engine.begin() as connection:
+        await connection.run_sync(SQLModel.metadata.create_all)
+    factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with factory() as session:
+        session.add(
+            models.DBProvince(id=PROVINCE_ID, name="Bangkok", tax_reduction_rate=0.5)
+        )
+        session.add(
+            models.DBProvinceBudget(
+                province_id=PROVINCE_ID, period=budget.TOTAL, cap=cap
+            )
+        )
+        await session.commit()
+    await engine.dispose()
+    await read_engine.dispose()
+
+
+async def reserve_row(factory: sessionmaker, amount: int) -> bool:
+    row = models.DBProvinceBudget
+    async with factory() as session:
+        result = await session.exec(
+            update(row)
+            .where(
+                row.province_id == PROVINCE_ID,
+                row.period == budget.TOTAL,
+                row.cap - row.spent >= amount,
+            )
+            .values(spent=row.spent + amount)
+        )
+        await session.commit()
+        return bool(result.rowcount)
+
+
+async def reserve_leased(pools: budget.BudgetPools, amount: int) -> bool:
+    reservation = await pools.reserve(PROVINCE_ID, amount)
+    if reservation is None:
+        return False
+    pools.commit(reservation)
+    return True
+
+
+def row_writes(mode: str, workers: list, reservations: int) -> int:
+    if mode == "row":
+        # Refused or not, every reservation takes the row's write lock
+        return reservations
+    # Leases, plus each worker's final reconcile
+    return sum(pools.allotment(PROVINCE_ID).leases + 1 for pools in workers)
+
+
+async def run(mode: str, directory: str, args) -> dict:
+    url = f"sqlite+aiosqlite:///{os.path.join(directory, f'{mode}.db')}"
+    cap = int(args.reservations * args.amount * (1 - args.oversubscribe))
+    await seed(url, cap)
+
+    engines = []
+    workers = []
+    for _ in range(args.workers):
+        engine, read_engine = models.build_engines(url)
+        engine.echo = False
+        engines += [engine, read_engine]
+        factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        if mode == "row":
+            workers.append(factory)
+        else:
+            workers.append(budget.BudgetPools(factory, lease_amount=args.lease))
+
+    counts = {"granted": 0, "refused": 0, "errors": 0}
+
+    async def reserve(worker):
+        try:
+            if mode == "row":
+                granted = await reserve_row(worker, args.amount)
+            else:
+                granted = await reserve_leased(worker, args.amount)
+        except Exception:
+            counts["errors"] += 1
+            return
+        counts["granted" if granted else "refused"] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(reserve(workers[i % args.workers]) for i in range(args.reservations))
+    )
+    if mode == "leased":
+        for pools in workers:
+            await pools.reconcile(hand_back_all=True)
+    elapsed = time.perf_counter() - started
+
+    factory = sessionmaker(engines[0], class_=AsyncSession, expire_on_commit=False)
+    async with factory() as session:
+        row = await session.get(models.DBProvinceBudget, (PROVINCE_ID, budget.TOTAL))
+        spent = row.spent
+    for engine in engines:
+        await engine.dispose()
+
+    if spent > cap:
+        raise SystemExit(f"{mode}: spent {spent} over the cap of {cap}")
+    return {
+        **counts,
+        "per_second": args.reservations / elapsed,
+        "spent": spent,
+        "cap": cap,
+        "row_writes": row_writes(mode, workers, args.reservations),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", default="row,leased")
+    parser.add_argument("--reservations", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--amount", type=int, default=50_000, help="satang")
+    parser.add_argument("--lease", type=int, default=5_000_000, help="satang")
+    parser.add_argument("--oversubscribe", type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = {}
+    for mode in args.modes.split(","):
+        with tempfile.TemporaryDirectory() as directory:
+            results[mode] = await run(mode, directory, args)
+
+    print(
+        f"{'mode':>6} {'reserve/s':>10} {'granted':>8} {'refused':>8} "
+        f"{'errors':>7} {'row writes':>11} {'spent/cap':>10}"
+    )
+    for mode, result in results.items():
+        print(
+            f"{mode:>6} {result['per_second']:>10.0f} {result['granted']:>8} "
+            f"{result['refused']:>8} {result['errors']:>7} {result['row_writes']:>11} "
+            f"{result['spent'] / result['cap']:>10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,169 @@
+"""Latency of a fresh worker's first requests, with and without warm-up.
+
+Usage::
+
+    python -m benchmarks.cold_start --rounds 20
+
+Each mode runs in a new interpreter in its own temporary directory, so
+nothing is imported or cached beforehand. The child starts the application
+lifespan (creating and seeding the database), inserts a user with the
+standard library's sqlite3, waits for ``/ready`` when warm-up is enabled,
+then times ``--rounds`` rounds of a login plus the hot read endpoints.
+Reported per mode: the first round's total, and the median round after it.
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULT_PREFIX = "COLD-START-RESULT "
+CITIZEN_ID = "1234567890123"
+PASSWORD = "password123"
+
+READ_PATHS = [
+    "/v1/provinces/",
+    "/v1/provinces/search?q=kr",
+    "/v1/user-provinces/my-quota",
+    "/v1/user-provinces/my-provinces",
+    "/v1/user-provinces/available-provinces",
+    "/v1/users/me",
+]
+
+
+def insert_user(password_hash: str):
+    connection = sqlite3.connect("database.db")
+    connection.execute(
+        "INSERT INTO users (email, citizen_id, first_name, last_name, password,"
+        " phone_number, current_address, register_date, updated_date,"
+        " token_version) VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now'),"
+        " datetime('now'), 0)",
+        (
+            "bench@example.com",
+            CITIZEN_ID,
+            "Bench",
+            "User",
+            password_hash,
+            "0800000000",
+            "Bangkok",
+        ),
+    )
+    connection.commit()
+    connection.close()
+
+
+async def child(rounds: int, password_hash: str) -> dict:
+    import asyncio
+
+    import httpx
+
+    started = time.perf_counter()
+    from flasx.main import app
+
+    timings = {"import": time.perf_counter() - started}
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        timings["startup"] = time.perf_counter() - started
+        insert_user(password_hash)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench"
+        ) as client:
+            while (await client.get("/ready")).status_code != 200:
+                await asyncio.sleep(0.01)
+            timings["ready"] = time.perf_counter() - started
+
+            rounds_seconds = []
+            for _ in range(rounds):
+                round_started = time.perf_counter()
+                response = await client.post(
+                    "/v1/token", data={"username": CITIZEN_ID, "password": PASSWORD}
+                )
+                response.raise_for_status()
+                headers = {
+                    "Authorization": f"Bearer {response.json()['access_token']}"
+                }
+                for path in READ_PATHS:
+                    (await client.get(path, headers=headers)).raise_for_status()
+                rounds_seconds.append(time.perf_counter() - round_started)
+
+    timings["first_round"] = rounds_seconds[0]
+    timings["steady_round"] = statistics.median(rounds_seconds[1:] or rounds_seconds)
+    return timings
+
+
+def run_child(warm: bool, rounds: int, password_hash: str) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(
+            os.environ,
+            SQLDB_URL="sqlite+aiosqlite:///database.db",
+            WARMUP_ENABLED=str(warm).lower(),
+            PYTHONPATH=REPO_ROOT,
+        )
+        completed = subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.cold_start",
+                "--child",
+                "--rounds",
+                str(rounds),
+                "--password-hash",
+                password_hash,
+            ],
+            cwd=directory,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    # The engines echo SQL to stdout; the result is the marked line
+    for line in reversed(completed.stdout.splitlines()):
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX) :])
+    raise RuntimeError(f"no result from child:\n{completed.stderr}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--password-hash", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        import asyncio
+
+        timings = asyncio.run(child(args.rounds, args.password_hash))
+        print(RESULT_PREFIX + json.dumps(timings))
+        return
+
+    # Hashed here so neither child pays for it outside its own timings
+    import bcrypt
+
+    password_hash = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt()).decode()
+
+    results = {
+        name: run_child(warm, args.rounds, password_hash)
+        for name, warm in (("cold", False), ("warm-up", True))
+    }
+
+    print(
+        f"{'mode':<8} {'import':>8} {'startup':>8} {'ready':>8} "
+        f"{'1st round':>10} {'steady':>8}   (seconds)"
+    )
+    for name, timings in results.items():
+        print(
+            f"{name:<8} {timings['import']:>8.3f} {timings['startup']:>8.3f} "
+            f"{timings['ready']:>8.3f} {timings['first_round']:>10.3f} "
+            f"{timings['steady_round']:>8.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Throughput of the vectorized co-pay calculation in lines per second.
+
+Usage::
+
+    python -m benchmarks.copay_throughput --lines 10000 --users 2000
+
+Measures `flasx.core.copay.calculate` alone and, for comparison, a plain
+Python loop doing the same work line by line.
+"""
+
+import argparse
+import os
+import time
+
+os.environ.setdefault("SQLDB_URL", "sqlite+aiosqlite:///:memory:")
+
+import numpy as np
+
+from flasx.core import copay
+
+PROVINCES = 77
+
+
+def make_batch(lines: int, users: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    rates = copay.rate_vector(
+        {i: (0.50 if i <= 22 else 0.25) for i in range(1, PROVINCES + 1)}
+    )
+    # Up to five target provinces per user
+    target_users = np.repeat(np.arange(1, users + 1), 5)
+    target_provinces = rng.integers(1, PROVINCES + 1, len(target_users))
+    return dict(
+        user_ids=rng.integers(1, users + 1, lines),
+        province_ids=rng.integers(1, PROVINCES + 1, lines),
+        amounts=rng.uniform(50, 5000, lines).round(2),
+        dates=np.datetime64("2025-07-01") + rng.integers(0, 90, lines),
+        rates=rates,
+        target_user_ids=target_users,
+        target_province_ids=target_provinces,
+        max_reduction_per_user=3000.0,
+    )
+
+
+def python_loop(batch) -> list[float]:
+    targets = set(
+        zip(batch["target_user_ids"].tolist(), batch["target_province_ids"].tolist())
+    )
+    rates = batch["rates"].tolist()
+    lines = sorted(
+        range(len(batch["user_ids"])),
+        key=lambda i: (batch["user_ids"][i], batch["dates"][i], i),
+    )
+    used: dict[int, float] = {}
+    reductions = [0.0] * len(lines)
+    for i in lines:
+        user_id = int(batch["user_ids"][i])
+        province_id = int(batch["province_ids"][i])
+        if (user_id, province_id) not in targets:
+            continue
+        reduction = float(batch["amounts"][i]) * rates[province_id]
+        remaining = batch["max_reduction_per_user"] - used.get(user_id, 0.0)
+        reductions[i] = min(reduction, max(remaining, 0.0))
+        used[user_id] = used.get(user_id, 0.0) + reductions[i]
+    return reductions
+
+
+def timed(function, batch, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(batch)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, default=10_000)
+    parser.add_argument("--users", type=int, default=2_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    batch = make_batch(args.lines, args.users)
+    vectorized = copay.calculate(**batch).reductions
+    assert np.allclose(vectorized, python_loop(batch))
+
+    for name, function in (
+        ("numpy", lambda b: copay.calculate(**b)),
+        ("python loop", python_loop),
+    ):
+        elapsed = timed(function, batch, args.repeat if name == "numpy" else 3)
+        print(
+            f"{name:<12} {elapsed * 1000:8.2f} ms  {args.lines / elapsed:12,.0f} lines/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
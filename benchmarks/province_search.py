@@ -0,0 +1,73 @@
+"""Latency of the in-memory province search index.
+
+Usage::
+
+    python -m benchmarks.province_search --iterations 20000
+
+Builds the index from the catalog seed in flasx/data/provinces.json and
+times prefix, Thai, accented and misspelled queries.
+"""
+
+import argparse
+import json
+import os
+import time
+import types
+
+os.environ.setdefault("SQLDB_URL", "sqlite+aiosqlite:///:memory:")
+
+from flasx.core import province_search
+
+QUERIES = {
+    "prefix": "chiang",
+    "word prefix": "thani",
+    "exact": "Nakhon Ratchasima",
+    "thai": "เชียงใหม่",
+    "accented": "Chiàng Rái",
+    "typo": "bangkk",
+    "no match": "zzzz",
+}
+
+
+def load_catalog():
+    path = os.path.join(
+        os.path.dirname(province_search.__file__), "..", "data", "provinces.json"
+    )
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    provinces = data["primary_provinces"] + data["secondary_provinces"]
+    return [
+        types.SimpleNamespace(id=i, tier=None, **province)
+        for i, province in enumerate(provinces, 1)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20_000)
+    args = parser.parse_args()
+
+    catalog = load_catalog()
+    started = time.perf_counter()
+    index = province_search.build_index(catalog)
+    print(f"index build: {(time.perf_counter() - started) * 1000:.2f} ms")
+
+    print(f"{'query':<12} {'uncached':>11} {'cached':>11}  top result")
+    for name, query in QUERIES.items():
+        # Uncached: normalization plus the trie/trigram lookups on every call
+        started = time.perf_counter()
+        for _ in range(args.iterations):
+            index._search(province_search.normalize(query), 10)
+        uncached = (time.perf_counter() - started) / args.iterations
+
+        started = time.perf_counter()
+        for _ in range(args.iterations):
+            results = index.search(query)
+        cached = (time.perf_counter() - started) / args.iterations
+
+        top = results[0][0].name if results else "-"
+        print(f"{name:<12} {uncached * 1e6:8.1f} us {cached * 1e6:8.1f} us  {top}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Payload size and encode time of JSON, MessagePack and CBOR responses.
+
+Usage::
+
+    python -m benchmarks.response_encoding --repeat 2000
+
+The full province catalog is seeded into a temporary SQLite database, a
+user with two target provinces is created, and each endpoint below is
+requested once per format through the application. Reported per endpoint
+and format: the body size, its gzip size (what a compressing proxy would
+send), and the time to encode the response data, i.e. the step that
+differs between formats; validation and serialization by the response
+model are shared by all of them. CBOR is left out unless ``cbor2`` is
+installed.
+"""
+
+import argparse
+import asyncio
+import gzip
+import os
+import tempfile
+import time
+
+os.environ.setdefault("SQLDB_URL", "sqlite+aiosqlite:///:memory:")
+
+import httpx
+
+from flasx import models
+from flasx.core import encoding
+from flasx.main import app
+
+CITIZEN_ID = "1234567890123"
+PASSWORD = "password123"
+
+ENDPOINTS = [
+    "/v1/provinces/",
+    "/v1/provinces/primary/",
+    "/v1/provinces/search?q=chiang",
+    "/v1/provinces/1/nearby",
+    "/v1/users/me",
+    "/v1/user-provinces/my-quota",
+    "/v1/user-provinces/my-provinces",
+    "/v1/user-provinces/available-provinces",
+]
+
+
+async def seed(directory: str):
+    models.configure_engines(f"sqlite+aiosqlite:///{directory}/bench.db")
+    for shard in models.shards:
+        shard.engine.echo = False
+        shard.read_engine.echo = False
+    await models.create_db_and_tables()
+    await models.init_province_data()
+
+    async with models.shards[0].session() as session:
+        user = models.DBUser(
+            email="bench@example.com",
+            citizen_id=CITIZEN_ID,
+            first_name="Bench",
+            last_name="User",
+            phone_number="0800000000",
+            current_address="Bangkok",
+            password="",
+        )
+        await user.set_password(PASSWORD)
+        session.add(user)
+        await session.commit()
+
+
+def time_encode(data, media_type: str, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        encoding.encode(data, media_type)
+    return (time.perf_counter() - started) / repeat
+
+
+async def run(args) -> dict:
+    results = {}
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://bench"
+    ) as client:
+        response = await client.post(
+            "/v1/token", data={"username": CITIZEN_ID, "password": PASSWORD}
+        )
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        for province_id in (1, 3):
+            response = await client.post(
+                "/v1/user-provinces/target-province",
+                headers=headers,
+                json={"province_id": province_id},
+            )
+            response.raise_for_status()
+
+        for path in ENDPOINTS:
+            data = None
+            for media_type in encoding.RESPONSE_CLASSES:
+                response = await client.get(
+                    path, headers={**headers, "Accept": media_type}
+                )
+                response.raise_for_status()
+                assert response.headers["content-type"] == media_type
+                if data is None:
+                    # The plain data every format encodes
+                    data = response.json()
+                results[path, media_type] = {
+                    "bytes": len(response.content),
+                    "gzip": len(gzip.compress(response.content)),
+                    "encode": time_encode(data, media_type, args.repeat),
+                }
+    return results
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        await seed(directory)
+        results = await run(args)
+        await models.close_db()
+
+    print(
+        f"{'endpoint':<40} {'format':<20} {'bytes':>7} {'vs json':>8} "
+        f"{'gzip':>6} {'encode us':>10}"
+    )
+    for (path, media_type), result in results.items():
+        json_bytes = results[path, encoding.JSON]["bytes"]
+        print(
+            f"{path:<40} {media_type:<20} {result['bytes']:>7} "
+            f"{result['bytes'] / json_bytes:>8.2f} {result['gzip']:>6} "
+            f"{result['encode'] * 1e6:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,125 @@
+"""Mixed read/write throughput as user data is spread over more shards.
+
+Usage::
+
+    python -m benchmarks.sharding_throughput --shards 1,2,4 --seconds 5
+
+For each shard count, the engines are built by `models.configure_engines`
+over that many temporary SQLite files, users are placed the way
+registration places them, and workers loop over the `my-provinces` join
+(reads) and target-province inserts (writes), each on the shard of a random
+user. With the SQLite profile every shard has its own writer connection, so
+writes are what sharding should scale.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+os.environ.setdefault("SQLDB_URL", "sqlite+aiosqlite:///:memory:")
+
+from flasx import models
+from flasx.models import statements
+
+
+async def seed(users: int, provinces: int):
+    await models.create_db_and_tables()
+    for index, shard in enumerate(models.shards):
+        async with shard.session() as session:
+            for i in range(provinces):
+                session.add(
+                    models.DBProvince(name=f"Province {i}", tax_reduction_rate=0.25)
+                )
+            # Ids follow the per-shard sequence registration allocates from
+            for user_id in range(index + 1, users + 1, len(models.shards)):
+                session.add(
+                    models.DBUser(
+                        id=user_id,
+                        email=f"user{user_id}@example.com",
+                        citizen_id=f"{user_id:013d}",
+                        first_name="Bench",
+                        last_name=str(user_id),
+                        phone_number=f"{user_id:010d}",
+                        current_address="Bangkok",
+                        password="x",
+                    )
+                )
+            await session.commit()
+
+
+async def run(shard_count: int, directory: str, args) -> dict:
+    urls = [
+        f"sqlite+aiosqlite:///{os.path.join(directory, f'shard{i}.db')}"
+        for i in range(shard_count)
+    ]
+    models.configure_engines(urls[0], shard_urls=urls[1:])
+    for shard in models.shards:
+        shard.engine.echo = False
+        shard.read_engine.echo = False
+    await seed(args.users, args.provinces)
+
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    deadline = time.perf_counter() + args.seconds
+
+    async def worker(seed_value: int):
+        rng = random.Random(seed_value)
+        while time.perf_counter() < deadline:
+            user_id = rng.randint(1, args.users)
+            shard = models.shards[models.shard_for_user(user_id)]
+            try:
+                if rng.random() < args.write_ratio:
+                    async with shard.session() as session:
+                        session.add(
+                            models.DBUserProvince(
+                                user_id=user_id,
+                                province_id=rng.randint(1, args.provinces),
+                            )
+                        )
+                        await session.commit()
+                    counts["writes"] += 1
+                else:
+                    async with shard.read_session() as session:
+                        result = await session.exec(
+                            statements.USER_PROVINCES, params={"user_id": user_id}
+                        )
+                        result.all()
+                    counts["reads"] += 1
+            except Exception:
+                counts["errors"] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    await models.close_db()
+    return {key: value / elapsed for key, value in counts.items()}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", default="1,2,4")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--provinces", type=int, default=77)
+    args = parser.parse_args()
+
+    results = {}
+    for shard_count in (int(value) for value in args.shards.split(",")):
+        with tempfile.TemporaryDirectory() as directory:
+            results[shard_count] = await run(shard_count, directory, args)
+
+    print(f"{'shards':>6} {'reads/s':>10} {'writes/s':>10} {'errors/s':>10}")
+    for shard_count, rates in results.items():
+        print(
+            f"{shard_count:>6} {rates['reads']:>10.0f} {rates['writes']:>10.0f} "
+            f"{rates['errors']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
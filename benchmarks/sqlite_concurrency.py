@@ -0,0 +1,151 @@
+"""Mixed read/write throughput: default SQLite engine vs the WAL profile.
+
+Usage::
+
+    python -m benchmarks.sqlite_concurrency --seconds 5 --concurrency 32
+
+Each worker loops over the `my-provinces` join (reads) and target-province
+inserts (writes) against a temporary database file, once with the engine
+`init_db` used to create and once with `flasx.models.sqlite.apply_profile`.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+os.environ.setdefault("SQLDB_URL", "sqlite+aiosqlite:///:memory:")
+
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlmodel import SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from flasx import models
+from flasx.models import sqlite
+
+CONNECT_ARGS = {"check_same_thread": False}
+
+
+async def seed(url: str, users: int, provinces: int):
+    engine = create_async_engine(url, connect_args=CONNECT_ARGS)
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    async with AsyncSession(engine) as session:
+        for i in range(provinces):
+            session.add(
+                models.DBProvince(name=f"Province {i}", tax_reduction_rate=0.25)
+            )
+        for i in range(users):
+            session.add(
+                models.DBUser(
+                    email=f"user{i}@example.com",
+                    citizen_id=f"{i:013d}",
+                    first_name="Bench",
+                    last_name=str(i),
+                    phone_number=f"{i:010d}",
+                    current_address="Bangkok",
+                    password="x",
+                )
+            )
+        await session.commit()
+    await engine.dispose()
+
+
+def build_engines(url: str, profile: bool, read_pool_size: int):
+    if not profile:
+        engine = create_async_engine(url, connect_args=CONNECT_ARGS)
+        return engine, engine
+
+    writer = create_async_engine(
+        url, connect_args=CONNECT_ARGS, pool_size=1, max_overflow=0
+    )
+    sqlite.apply_profile(writer)
+    reader = create_async_engine(
+        sqlite.read_only_url(url),
+        connect_args=CONNECT_ARGS,
+        pool_size=read_pool_size,
+        max_overflow=0,
+    )
+    sqlite.apply_profile(reader, read_only=True)
+    return writer, reader
+
+
+async def run(url, profile, args) -> dict:
+    writer, reader = build_engines(url, profile, args.read_pool_size)
+    write_session = sessionmaker(writer, class_=AsyncSession, expire_on_commit=False)
+    read_session = sessionmaker(reader, class_=AsyncSession, expire_on_commit=False)
+
+    # Make sure the writer has switched the file to WAL before readers connect
+    async with write_session() as session:
+        await session.exec(select(models.DBProvince).limit(1))
+
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    deadline = time.perf_counter() + args.seconds
+
+    async def worker(seed_value: int):
+        rng = random.Random(seed_value)
+        while time.perf_counter() < deadline:
+            user_id = rng.randint(1, args.users)
+            try:
+                if rng.random() < args.write_ratio:
+                    async with write_session() as session:
+                        session.add(
+                            models.DBUserProvince(
+                                user_id=user_id,
+                                province_id=rng.randint(1, args.provinces),
+                            )
+                        )
+                        await session.commit()
+                    counts["writes"] += 1
+                else:
+                    async with read_session() as session:
+                        result = await session.exec(
+                            select(models.DBProvince)
+                            .join(models.DBUserProvince)
+                            .where(models.DBUserProvince.user_id == user_id)
+                        )
+                        result.all()
+                    counts["reads"] += 1
+            except Exception:
+                counts["errors"] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    if reader is not writer:
+        await reader.dispose()
+    await writer.dispose()
+    return {key: value / elapsed for key, value in counts.items()}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--read-pool-size", type=int, default=4)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--provinces", type=int, default=77)
+    args = parser.parse_args()
+
+    results = {}
+    for name, profile in (("default", False), ("wal-profile", True)):
+        with tempfile.TemporaryDirectory() as directory:
+            url = f"sqlite+aiosqlite:///{os.path.join(directory, 'bench.db')}"
+            await seed(url, args.users, args.provinces)
+            results[name] = await run(url, profile, args)
+
+    print(f"{'engine':<12} {'reads/s':>10} {'writes/s':>10} {'errors/s':>10}")
+    for name, rates in results.items():
+        print(
+            f"{name:<12} {rates['reads']:>10.0f} {rates['writes']:>10.0f} "
+            f"{rates['errors']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,118 @@
+"""Per-query Python overhead of building statements versus prebuilt ones.
+
+Usage::
+
+    python -m benchmarks.statement_cache --iterations 5000
+
+Runs the my-quota join and the login lookup against an in-memory SQLite
+database three ways: the statement built inline on every call (as the
+routers used to), the prebuilt statement from flasx.models.statements, and
+the inline statement with the compiled cache disabled. The database work is
+the same in all three, so the differences are Python overhead.
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("SQLDB_URL", "sqlite+aiosqlite:///:memory:")
+
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from flasx import models
+from flasx.models import statements
+
+
+def inline_user_provinces(user_id):
+    return (
+        select(models.DBProvince)
+        .join(models.DBUserProvince)
+        .where(models.DBUserProvince.user_id == user_id)
+    ), {}
+
+
+def prebuilt_user_provinces(user_id):
+    return statements.USER_PROVINCES, {"user_id": user_id}
+
+
+def inline_user_lookup(user_id):
+    return select(models.DBUser).where(models.DBUser.citizen_id == "1234567890123"), {}
+
+
+def prebuilt_user_lookup(user_id):
+    return statements.USER_BY_CITIZEN_ID, {"citizen_id": "1234567890123"}
+
+
+QUERIES = {
+    "user provinces": (inline_user_provinces, prebuilt_user_provinces),
+    "login lookup": (inline_user_lookup, prebuilt_user_lookup),
+}
+
+
+async def make_engine(query_cache_size: int):
+    engine = create_async_engine(
+        "sqlite+aiosqlite:///:memory:", query_cache_size=query_cache_size
+    )
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    async with AsyncSession(engine) as session:
+        session.add(
+            models.DBUser(
+                email="bench@example.com",
+                citizen_id="1234567890123",
+                first_name="Bench",
+                last_name="User",
+                phone_number="0800000000",
+                current_address="Bangkok",
+                password="",
+            )
+        )
+        session.add(models.DBProvince(name="Krabi", tax_reduction_rate=0.50))
+        await session.flush()
+        session.add(models.DBUserProvince(user_id=1, province_id=1))
+        await session.commit()
+    return engine
+
+
+async def run(engine, make_statement, iterations: int) -> float:
+    async with AsyncSession(engine) as session:
+        # Warm the compiled cache
+        statement, params = make_statement(1)
+        (await session.exec(statement, params=params)).all()
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            statement, params = make_statement(1)
+            (await session.exec(statement, params=params)).all()
+        return (time.perf_counter() - start) / iterations
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+
+    cached = await make_engine(500)
+    uncached = await make_engine(0)
+    try:
+        for name, (inline, prebuilt) in QUERIES.items():
+            results = {
+                "inline": await run(cached, inline, args.iterations),
+                "prebuilt": await run(cached, prebuilt, args.iterations),
+                "inline, no cache": await run(uncached, inline, args.iterations),
+            }
+            print(name)
+            for label, seconds in results.items():
+                print(f"  {label:<18}{seconds * 1e6:9.1f} us/query")
+            saved = results["inline"] - results["prebuilt"]
+            print(f"  {'saved by prebuilt':<18}{saved * 1e6:9.1f} us/query")
+    finally:
+        await cached.dispose()
+        await uncached.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
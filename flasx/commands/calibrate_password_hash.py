@@ -0,0 +1,91 @@
+"""Pick the password-hash cost that fits a target verify time on this host.
+
+Usage::
+
+    python -m flasx.commands.calibrate_password_hash --target-ms 250
+    python -m flasx.commands.calibrate_password_hash --algorithm scrypt --max-memory-mb 64
+
+Prints the settings to put in ``.env``.
+"""
+
+import argparse
+import statistics
+import time
+
+from flasx.core import passwords
+
+SAMPLE_PASSWORD = "calibration-password"
+
+
+def measure(hashed: str, samples: int) -> float:
+    """Median verify time of ``hashed`` in milliseconds."""
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        passwords.verify_password(SAMPLE_PASSWORD, hashed)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def calibrate_bcrypt(target_ms: float, samples: int) -> dict:
+    best = None
+    # Each extra round doubles the work, so stop at the first one over budget
+    for rounds in range(4, 32):
+        elapsed = measure(passwords.hash_bcrypt(SAMPLE_PASSWORD, rounds), samples)
+        print(f"  bcrypt rounds={rounds}: {elapsed:.1f} ms")
+        if elapsed > target_ms:
+            break
+        best = rounds
+    return {"PASSWORD_HASH_ALGORITHM": "bcrypt", "BCRYPT_ROUNDS": best or 4}
+
+
+def calibrate_scrypt(
+    target_ms: float, samples: int, max_memory_mb: int, r: int, p: int
+) -> dict:
+    best = None
+    for log2_n in range(10, 25):
+        memory_mb = 128 * r * (1 << log2_n) / 2**20
+        if memory_mb > max_memory_mb:
+            break
+        elapsed = measure(passwords.hash_scrypt(SAMPLE_PASSWORD, log2_n, r, p), samples)
+        print(f"  scrypt ln={log2_n} ({memory_mb:.0f} MiB): {elapsed:.1f} ms")
+        if elapsed > target_ms:
+            break
+        best = log2_n
+    return {
+        "PASSWORD_HASH_ALGORITHM": "scrypt",
+        "SCRYPT_LOG2_N": best or 10,
+        "SCRYPT_R": r,
+        "SCRYPT_P": p,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--algorithm", choices=passwords.ALGORITHMS, default="bcrypt")
+    parser.add_argument("--target-ms", type=float, default=250.0)
+    parser.add_argument("--samples", type=int, default=3)
+    parser.add_argument("--max-memory-mb", type=int, default=64)
+    parser.add_argument("--scrypt-r", type=int, default=8)
+    parser.add_argument("--scrypt-p", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"Calibrating {args.algorithm} for a {args.target_ms:.0f} ms verify budget")
+    if args.algorithm == passwords.SCRYPT:
+        result = calibrate_scrypt(
+            args.target_ms,
+            args.samples,
+            args.max_memory_mb,
+            args.scrypt_r,
+            args.scrypt_p,
+        )
+    else:
+        result = calibrate_bcrypt(args.target_ms, args.samples)
+
+    print()
+    for key, value in result.items():
+        print(f"{key}={value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+"""Fill a database with synthetic users and target provinces for scaling tests.
+
+Usage::
+
+    python -m flasx.commands.generate_dataset --users 1M
+    python -m flasx.commands.generate_dataset --users 10M --skew 1.2 --workers 8 \\
+        --database-url postgresql://bench@localhost/flasx
+
+Every generated user has a valid, unique Thai citizen id, an address in one
+of the provinces and target provinces that respect the quota rules (per tier
+and in total) and never match the user's address. All users share one
+password hash, computed once, so hashing does not dominate the run; log in
+with ``--password``.
+
+Rows are generated in parallel worker processes, in chunks, and loaded in
+one transaction per chunk: batched ``executemany`` on SQLite and ``COPY`` on
+PostgreSQL (which needs ``psycopg``). ``--skew`` makes some provinces far more
+popular than others, both as addresses and as targets (0 is uniform).
+"""
+
+import argparse
+import concurrent.futures
+import dataclasses
+import datetime
+import json
+import os
+import time
+
+import numpy as np
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.engine import Connection, make_url
+from sqlmodel import SQLModel
+
+from flasx import models
+from flasx.core import passwords
+from flasx.core import quota
+
+DEFAULT_PASSWORD = "password123"
+
+USER_COLUMNS = (
+    "id",
+    "email",
+    "citizen_id",
+    "first_name",
+    "last_name",
+    "phone_number",
+    "current_address",
+    "password",
+    "register_date",
+    "updated_date",
+    "token_version",
+)
+USER_PROVINCE_COLUMNS = ("user_id", "province_id", "created_date")
+
+# Digit weights of the Thai citizen id check digit, for the first 12 digits
+CITIZEN_ID_WEIGHTS = np.arange(13, 1, -1)
+SUFFIXES = {"k": 10**3, "m": 10**6}
+
+
+def parse_count(value: str) -> int:
+    """``"10k"`` -> 10000, ``"1M"`` -> 1000000."""
+    multiplier = SUFFIXES.get(value[-1:].lower())
+    if multiplier:
+        return int(float(value[:-1]) * multiplier)
+    return int(value)
+
+
+def citizen_id_check_digit(first_12_digits: str) -> int:
+    total = sum(int(d) * w for d, w in zip(first_12_digits, CITIZEN_ID_WEIGHTS))
+    return (11 - total % 11) % 10
+
+
+def is_valid_citizen_id(citizen_id: str) -> bool:
+    return (
+        len(citizen_id) == 13
+        and citizen_id.isdigit()
+        and citizen_id[0] != "0"
+        and citizen_id_check_digit(citizen_id[:12]) == int(citizen_id[12])
+    )
+
+
+def citizen_ids(indexes: np.ndarray) -> list[str]:
+    """Unique valid citizen ids, one per index below 8 * 10**11."""
+    base = (1 + indexes // 10**11 % 8) * 10**11 + indexes % 10**11
+    digits = base[:, None] // 10 ** np.arange(11, -1, -1) % 10
+    check = (11 - digits @ CITIZEN_ID_WEIGHTS % 11) % 10
+    return (base * 10 + check).astype(str).tolist()
+
+
+@dataclasses.dataclass(frozen=True)
+class Catalog:
+    province_ids: np.ndarray
+    names: list[str]
+    # Province popularity, as addresses and as targets
+    weights: np.ndarray
+    # excluded[a, p]: province p may not be chosen by a user living in a
+    excluded: np.ndarray
+    tier_columns: list[np.ndarray]
+    tier_max: list[int]
+    max_total: int
+
+
+def build_catalog(provinces: list[tuple[int, str, int | None]], skew: float) -> Catalog:
+    """``provinces`` are ``(id, name, tier)`` rows, most popular first."""
+    rules = quota.get_rules()
+    names = [name for _, name, _ in provinces]
+    lowered = [name.lower() for name in names]
+    # Same address match as the user-provinces router
+    excluded = np.array(
+        [[p in a or a in p for p in lowered] for a in lowered], dtype=bool
+    )
+    tiers = np.array([tier or 0 for _, _, tier in provinces])
+    weights = 1.0 / np.arange(1, len(provinces) + 1) ** skew
+    return Catalog(
+        province_ids=np.array([province_id for province_id, _, _ in provinces]),
+        names=names,
+        weights=weights / weights.sum(),
+        excluded=excluded,
+        tier_columns=[np.flatnonzero(tiers == tier.id) for tier in rules.tiers],
+        tier_max=[tier.max_provinces for tier in rules.tiers],
+        max_total=rules.max_total_provinces,
+    )
+
+
+@dataclasses.dataclass(frozen=True)
+class Chunk:
+    first_index: int
+    size: int
+    seed: int
+
+
+# Set in each worker by _init_worker, so the catalog is sent once per process
+_catalog: Catalog | None = None
+_password_hash: str = ""
+_fill: float = 0.0
+_created: datetime.datetime | None = None
+
+
+def _init_worker(catalog: Catalog, password_hash: str, fill: float, created):
+    global _catalog, _password_hash, _fill, _created
+    _catalog, _password_hash, _fill, _created = catalog, password_hash, fill, created
+
+
+def generate_chunk(chunk: Chunk) -> tuple[list[tuple], list[tuple]]:
+    catalog = _catalog
+    rng = np.random.default_rng(chunk.seed)
+    indexes = np.arange(chunk.first_index, chunk.first_index + chunk.size)
+    homes = rng.choice(len(catalog.names), size=chunk.size, p=catalog.weights)
+
+    users = [
+        (
+            int(index),
+            f"user{index}@example.com",
+            citizen_id,
+            "User",
+            str(index),
+            f"08{index % 10**8:08d}",
+            catalog.names[home],
+            _password_hash,
+            _created,
+            _created,
+            0,
+        )
+        for index, citizen_id, home in zip(
+            indexes.tolist(), citizen_ids(indexes), homes.tolist()
+        )
+    ]
+
+    # Per tier, pick `count` distinct provinces per user in proportion to
+    # popularity: the top `count` of log(weight) + Gumbel noise
+    room = np.full(chunk.size, catalog.max_total)
+    user_ids, province_ids = [], []
+    for columns, tier_max in zip(catalog.tier_columns, catalog.tier_max):
+        if not len(columns):
+            continue
+        allowed = ~catalog.excluded[homes][:, columns]
+        count = rng.binomial(tier_max, _fill, chunk.size)
+        count = np.minimum(np.minimum(count, allowed.sum(axis=1)), room)
+        room -= count
+
+        keys = np.log(catalog.weights[columns]) + rng.gumbel(
+            size=(chunk.size, len(columns))
+        )
+        keys[~allowed] = -np.inf
+        order = np.argsort(-keys, axis=1)
+        rows, ranks = np.nonzero(np.arange(len(columns)) < count[:, None])
+        user_ids.append(indexes[rows])
+        province_ids.append(catalog.province_ids[columns[order[rows, ranks]]])
+
+    user_provinces = [
+        (user_id, province_id, _created)
+        for user_id, province_id in zip(
+            np.concatenate(user_ids or [np.zeros(0, int)]).tolist(),
+            np.concatenate(province_ids or [np.zeros(0, int)]).tolist(),
+        )
+    ]
+    return users, user_provinces
+
+
+def sync_url(database_url: str) -> str:
+    """The synchronous-driver equivalent of an async database URL."""
+    url = make_url(database_url)
+    if url.get_backend_name() == "sqlite":
+        return url.set(drivername="sqlite").render_as_string(hide_password=False)
+    if url.get_backend_name() == "postgresql":
+        return url.set(drivername="postgresql+psycopg").render_as_string(
+            hide_password=False
+        )
+    raise ValueError(f"Unsupported database: {url.get_backend_name()}")
+
+
+def load_sqlite(conn: Connection, table: str, columns: tuple[str, ...], rows):
+    placeholders = ", ".join("?" for _ in columns)
+    cursor = conn.connection.driver_connection.cursor()
+    cursor.executemany(
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})",
+        [
+            tuple(str(v) if isinstance(v, datetime.datetime) else v for v in row)
+            for row in rows
+        ],
+    )
+
+
+def load_postgres(conn: Connection, table: str, columns: tuple[str, ...], rows):
+    cursor = conn.connection.driver_connection.cursor()
+    with cursor.copy(f"COPY {table} ({', '.join(columns)}) FROM STDIN") as copy:
+        for row in rows:
+            copy.write_row(row)
+
+
+def advance_postgres_sequences(conn: Connection, tables: tuple[str, ...]):
+    """Move id sequences past the ids COPY wrote, so later inserts do not reuse them."""
+    for table in tables:
+        conn.exec_driver_sql(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), max(id)) "
+            f"FROM {table}"
+        )
+
+
+def seed_provinces(conn: Connection):
+    """Insert the province catalog if the database has none yet."""
+    if conn.execute(select(func.count()).select_from(models.DBProvince)).scalar():
+        return
+
+    json_path = os.path.join(
+        os.path.dirname(models.__file__), "..", "data", "provinces.json"
+    )
+    with open(json_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    rules = quota.get_rules()
+    now = datetime.datetime.now()
+    rows = []
+    for province in data["primary_provinces"] + data["secondary_provinces"]:
+        tier = rules.tier_for_rate(province["tax_reduction_rate"])
+        rows.append(
+            dict(
+                name=province["name"],
+                name_th=province.get("name_th"),
+                tax_reduction_rate=province["tax_reduction_rate"],
+                latitude=province.get("latitude"),
+                longitude=province.get("longitude"),
+                tier=tier.id if tier else None,
+                created_date=now,
+                updated_date=now,
+            )
+        )
+    conn.execute(models.DBProvince.__table__.insert(), rows)
+
+
+def generate(
+    database_url: str,
+    users: int,
+    skew: float = 1.0,
+    fill: float = 0.6,
+    workers: int | None = None,
+    chunk_size: int = 50_000,
+    seed: int = 0,
+    password: str = DEFAULT_PASSWORD,
+) -> tuple[int, int]:
+    """Append ``users`` users; returns the users and target provinces written."""
+    engine = create_engine(sync_url(database_url))
+    postgres = engine.dialect.name == "postgresql"
+    load = load_postgres if postgres else load_sqlite
+
+    SQLModel.metadata.create_all(engine)
+    with engine.begin() as conn:
+        if not postgres:
+            conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+        seed_provinces(conn)
+        provinces = conn.execute(
+            select(
+                models.DBProvince.id, models.DBProvince.name, models.DBProvince.tier
+            ).order_by(models.DBProvince.id)
+        ).all()
+        last_id = conn.execute(select(func.max(models.DBUser.id))).scalar()
+        first_index = (last_id or 0) + 1
+
+    catalog = build_catalog([tuple(row) for row in provinces], skew)
+    chunks = [
+        Chunk(first_index + start, min(chunk_size, users - start), seed + number)
+        for number, start in enumerate(range(0, users, chunk_size))
+    ]
+
+    written_users = written_targets = 0
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(
+            catalog,
+            passwords.hash_password(password),
+            fill,
+            datetime.datetime.now(),
+        ),
+    ) as executor:
+        # Keep a bounded number of chunks generated ahead of the loader
+        window = 2 * (workers or os.cpu_count() or 1)
+        pending = [executor.submit(generate_chunk, chunk) for chunk in chunks[:window]]
+        submitted = len(pending)
+        while pending:
+            user_rows, user_province_rows = pending.pop(0).result()
+            if submitted < len(chunks):
+                pending.append(executor.submit(generate_chunk, chunks[submitted]))
+                submitted += 1
+
+            with engine.begin() as conn:
+                if not postgres:
+                    conn.exec_driver_sql("PRAGMA synchronous=OFF")
+                load(conn, "users", USER_COLUMNS, user_rows)
+                load(conn, "user_provinces", USER_PROVINCE_COLUMNS, user_province_rows)
+            written_users += len(user_rows)
+            written_targets += len(user_province_rows)
+            print(f"  {written_users:,} / {users:,} users", flush=True)
+
+    if postgres:
+        with engine.begin() as conn:
+            advance_postgres_sequences(conn, ("users", "user_provinces"))
+
+    engine.dispose()
+    return written_users, written_targets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=parse_count, default=10_000)
+    parser.add_argument("--database-url", default=models.DATABASE_URL)
+    parser.add_argument("--skew", type=float, default=1.0)
+    parser.add_argument(
+        "--fill",
+        type=float,
+        default=0.6,
+        help="chance of each quota slot being used (0-1)",
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=50_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--password", default=DEFAULT_PASSWORD)
+    args = parser.parse_args()
+
+    print(f"Generating {args.users:,} users into {args.database_url}")
+    started = time.perf_counter()
+    users, targets = generate(
+        args.database_url,
+        args.users,
+        skew=args.skew,
+        fill=args.fill,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        seed=args.seed,
+        password=args.password,
+    )
+    elapsed = time.perf_counter() - started
+    print(
+        f"Wrote {users:,} users and {targets:,} target provinces "
+        f"in {elapsed:.1f} s ({users / elapsed:,.0f} users/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
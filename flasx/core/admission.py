@@ -0,0 +1,162 @@
+"""Admission control: shed low-priority requests while the worker is overloaded.
+
+Each worker has a single event loop. Once it falls behind, every request
+waits longer, and clients time out on work the server goes on to finish
+anyway. A background task started in the application lifespan measures how
+late the loop wakes up from a short sleep (event-loop lag), and the
+middleware counts requests in flight. The worker is overloaded while the
+lag is above ``ADMISSION_MAX_LAG_SECONDS`` or ``ADMISSION_MAX_IN_FLIGHT``
+requests are running.
+
+While overloaded, low-priority requests get ``503`` with ``Retry-After``
+before any work is done for them. Always admitted:
+
+* the health and readiness probes
+* GET and HEAD requests carrying a valid access token, which are cheap reads
+  for users already signed in
+
+Everything else, including logins and registrations (a bcrypt hash each),
+is low priority.
+"""
+
+import asyncio
+import collections
+
+import jwt
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.routing import Match
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from . import config
+from . import security
+
+settings = config.get_settings()
+
+ALWAYS_ADMITTED_PATHS = {"/health", "/ready"}
+CHEAP_METHODS = {"GET", "HEAD"}
+# Long-lived streams would otherwise count as in flight for their whole life
+UNCOUNTED_PATHS = {"/v1/provinces/feed"}
+
+LAG = "lag"
+IN_FLIGHT = "in_flight"
+
+
+def has_valid_access_token(headers: Headers) -> bool:
+    scheme, _, token = headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    try:
+        payload = jwt.decode(
+            token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
+        )
+    except jwt.InvalidTokenError:
+        return False
+    return payload.get("type") != security.REFRESH_TOKEN_TYPE
+
+
+def is_high_priority(scope: Scope) -> bool:
+    if scope["path"] in ALWAYS_ADMITTED_PATHS:
+        return True
+    return scope["method"] in CHEAP_METHODS and has_valid_access_token(
+        Headers(scope=scope)
+    )
+
+
+def route_name(scope: Scope) -> str:
+    """Route template of the request, e.g. ``/v1/users/{user_id}``."""
+    app = scope.get("app")
+    for route in getattr(getattr(app, "router", None), "routes", []):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return f"{scope['method']} {route.path}"
+    return f"{scope['method']} (unmatched)"
+
+
+class AdmissionController:
+    def __init__(self, max_lag: float, max_in_flight: int, retry_after: int):
+        self.max_lag = max_lag
+        self.max_in_flight = max_in_flight
+        self.retry_after = retry_after
+        # Latest measurement; a blocked loop shows up once it runs again
+        self.lag = 0.0
+        self.max_lag_seen = 0.0
+        self.in_flight = 0
+        self.max_in_flight_seen = 0
+        self.admitted = 0
+        self.shed_by_reason: collections.Counter[str] = collections.Counter()
+        self.shed_by_route: collections.Counter[str] = collections.Counter()
+
+    def overload_reason(self) -> str | None:
+        if self.lag > self.max_lag:
+            return LAG
+        if self.in_flight >= self.max_in_flight:
+            return IN_FLIGHT
+        return None
+
+    def record_lag(self, lag: float):
+        self.lag = lag
+        self.max_lag_seen = max(self.max_lag_seen, lag)
+
+    def reset_stats(self):
+        self.max_lag_seen = self.lag
+        self.max_in_flight_seen = self.in_flight
+        self.admitted = 0
+        self.shed_by_reason.clear()
+        self.shed_by_route.clear()
+
+    async def monitor(self, interval: float):
+        """Measure event-loop lag every ``interval`` seconds until cancelled."""
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(interval)
+            self.record_lag(max(0.0, loop.time() - started - interval))
+
+
+_controller = AdmissionController(
+    max_lag=settings.ADMISSION_MAX_LAG_SECONDS,
+    max_in_flight=settings.ADMISSION_MAX_IN_FLIGHT,
+    retry_after=settings.ADMISSION_RETRY_AFTER_SECONDS,
+)
+
+
+def get_controller() -> AdmissionController:
+    return _controller
+
+
+class AdmissionMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        controller = get_controller()
+        reason = controller.overload_reason()
+        if reason is not None and not is_high_priority(scope):
+            controller.shed_by_reason[reason] += 1
+            controller.shed_by_route[route_name(scope)] += 1
+            response = JSONResponse(
+                {"detail": "Server is overloaded, retry later"},
+                status_code=503,
+                headers={"Retry-After": str(controller.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        controller.admitted += 1
+        if scope["path"] in UNCOUNTED_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        controller.in_flight += 1
+        controller.max_in_flight_seen = max(
+            controller.max_in_flight_seen, controller.in_flight
+        )
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.in_flight -= 1
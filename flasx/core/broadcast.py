@@ -0,0 +1,138 @@
+"""In-process fan-out of province feed updates to server-sent-event clients.
+
+Routes record changes as they happen: target-province selections and
+removals as per-province count deltas, and catalog updates and deletions.
+Nothing is sent right away. A background task started in the application
+lifespan flushes everything recorded since the last tick as one event,
+encoded once and handed to every subscriber.
+
+Each subscriber has a bounded queue. A client too slow to keep up does not
+hold back the others: when its queue is full, its backlog is replaced by a
+single ``resync`` event telling it to re-fetch the catalog.
+
+Updates only reach clients connected to the worker that recorded them.
+"""
+
+import asyncio
+import collections
+import json
+import logging
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+settings = config.get_settings()
+
+RESYNC = b'event: resync\ndata: {}\n\n'
+
+
+class Subscription:
+    # Kept small: there is one per connected client. A list and a single
+    # future are much lighter than a deque and an asyncio.Event.
+    __slots__ = ("_messages", "_waiter", "max_messages", "resyncs")
+
+    def __init__(self, max_messages: int):
+        self._messages: list[bytes] = []
+        self._waiter: asyncio.Future | None = None
+        self.max_messages = max_messages
+        self.resyncs = 0
+
+    def offer(self, message: bytes):
+        if len(self._messages) >= self.max_messages:
+            self._messages = [RESYNC]
+            self.resyncs += 1
+        else:
+            self._messages.append(message)
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def get(self, timeout: float) -> bytes | None:
+        """Next message, or None if none arrived within ``timeout`` seconds."""
+        if not self._messages:
+            loop = asyncio.get_running_loop()
+            self._waiter = waiter = loop.create_future()
+            timer = loop.call_later(timeout, _wake, waiter)
+            try:
+                await waiter
+            finally:
+                timer.cancel()
+                self._waiter = None
+            if not self._messages:
+                return None
+        return self._messages.pop(0)
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+
+def _wake(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class Broadcaster:
+    def __init__(self, queue_size: int = 16):
+        self.queue_size = queue_size
+        self._subscribers: set[Subscription] = set()
+        self._selections: collections.Counter[int] = collections.Counter()
+        self._catalog: dict[int, str] = {}
+        self.ticks = 0
+        self.messages_sent = 0
+
+    def subscribe(self) -> Subscription:
+        subscription = Subscription(self.queue_size)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscribers.discard(subscription)
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+    def record_selection(self, province_id: int, delta: int):
+        """A user added (``+1``) or removed (``-1``) a target province."""
+        self._selections[province_id] += delta
+
+    def record_catalog_change(self, province_id: int, change: str):
+        self._catalog[province_id] = change
+
+    def flush(self) -> int:
+        """Send what was recorded since the last flush; returns the clients reached."""
+        selections = {
+            str(province_id): delta
+            for province_id, delta in self._selections.items()
+            if delta
+        }
+        catalog = [
+            {"province_id": province_id, "change": change}
+            for province_id, change in self._catalog.items()
+        ]
+        self._selections.clear()
+        self._catalog.clear()
+        self.ticks += 1
+        if not (selections or catalog) or not self._subscribers:
+            return 0
+
+        data = json.dumps({"selections": selections, "catalog": catalog})
+        message = f"event: provinces\ndata: {data}\n\n".encode()
+        for subscription in self._subscribers:
+            subscription.offer(message)
+        self.messages_sent += len(self._subscribers)
+        return len(self._subscribers)
+
+    async def run(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Province feed flush failed")
+
+
+_broadcaster = Broadcaster(queue_size=settings.FEED_QUEUE_SIZE)
+
+
+def get_broadcaster() -> Broadcaster:
+    return _broadcaster
@@ -0,0 +1,293 @@
+"""Per-province co-pay budget pools.
+
+A province can cap the co-pay it hands out, for the whole program or per
+day, with one ``DBProvinceBudget`` row per province and period. Checking
+every claim against that row would make it the hottest lock in the
+database, so each worker leases part of the budget and serves reservations
+from its lease in memory:
+
+* ``reserve`` takes an amount out of the worker's allotment. When the
+  allotment runs short it leases ``BUDGET_LEASE_SATANG`` more (or what the
+  claim needs, if that is more) with one conditional UPDATE that never
+  takes ``leased`` past ``cap``; near the end of a budget, only what the
+  claim needs
+* ``commit`` marks a reservation as spent, ``release`` puts it back in the
+  allotment
+* every ``BUDGET_RECONCILE_SECONDS`` a background task writes what was spent
+  to the rows and hands back allotment above one lease, or all of it for a
+  province with no reservations since the last run. Everything unreserved
+  is handed back on shutdown
+
+The cap holds across workers because a worker only reserves what it has
+leased and the leases never add up to more than the cap. Allotment held by
+a worker that dies is not handed back, so it errs on the side of paying
+out less. Amounts are in satang, so rounding never lets spending creep past
+the cap.
+
+There is no claim flow yet (``/copay/calculate`` only quotes a reduction),
+so nothing calls ``reserve`` outside the tests and the benchmark; admins
+can set budgets and a claim endpoint should reserve, then commit or release.
+"""
+
+import asyncio
+import dataclasses
+import datetime
+import itertools
+import logging
+import typing
+
+from sqlalchemy import update
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from flasx import models
+from . import config
+
+logger = logging.getLogger(__name__)
+
+settings = config.get_settings()
+
+TOTAL = "total"
+SATANG_PER_BAHT = 100
+
+Key = tuple[int, str]
+
+
+def period_of(day: datetime.date | None) -> str:
+    return day.isoformat() if day is not None else TOTAL
+
+
+def to_satang(baht: float) -> int:
+    return round(baht * SATANG_PER_BAHT)
+
+
+def to_baht(satang: int) -> float:
+    return satang / SATANG_PER_BAHT
+
+
+@dataclasses.dataclass(frozen=True)
+class Reservation:
+    id: int
+    province_id: int
+    period: str
+    amount: int
+
+
+@dataclasses.dataclass
+class Allotment:
+    """This worker's lease of one budget."""
+
+    available: int = 0
+    reserved: int = 0
+    # Spent, but not yet added to the row's ``spent``
+    committed: int = 0
+    # Reserved from since the last reconcile
+    used: bool = False
+    leases: int = 0
+    refused: int = 0
+    # Held while leasing, so concurrent reservations lease once
+    lock: asyncio.Lock = dataclasses.field(default_factory=asyncio.Lock)
+
+
+def _row(key: Key):
+    province_id, period = key
+    return (
+        models.DBProvinceBudget.province_id == province_id,
+        models.DBProvinceBudget.period == period,
+    )
+
+
+class BudgetPools:
+    def __init__(
+        self,
+        session_factory: typing.Callable[[], AsyncSession] | None = None,
+        lease_amount: int = 100_000,
+    ):
+        # Budgets live in the primary database, whatever the sharding
+        self._session_factory = session_factory
+        self.lease_amount = lease_amount
+        self._allotments: dict[Key, Allotment] = {}
+        self._reservations: dict[int, Reservation] = {}
+        self._ids = itertools.count(1)
+
+    def session(self) -> AsyncSession:
+        if self._session_factory is not None:
+            return self._session_factory()
+        return models.shards[0].session()
+
+    def allotment(self, province_id: int, period: str = TOTAL) -> Allotment | None:
+        return self._allotments.get((province_id, period))
+
+    def __len__(self) -> int:
+        return len(self._reservations)
+
+    async def _lease(self, key: Key, needed: int) -> int:
+        """Lease at least ``needed`` from the row; returns the amount leased."""
+        budget = models.DBProvinceBudget
+        async with self.session() as session:
+            # A read first, so refusing an exhausted budget takes no write lock
+            result = await session.exec(
+                select(budget.cap - budget.leased).where(*_row(key))
+            )
+            remaining = result.first()
+            await session.commit()
+            if remaining is None or remaining < needed:
+                return 0
+
+            for amount in dict.fromkeys((max(self.lease_amount, needed), needed)):
+                if amount > remaining:
+                    continue
+                result = await session.exec(
+                    update(budget)
+                    .where(*_row(key), budget.cap - budget.leased >= amount)
+                    .values(leased=budget.leased + amount)
+                )
+                await session.commit()
+                if result.rowcount:
+                    return amount
+        return 0
+
+    async def reserve(
+        self, province_id: int, amount: int, day: datetime.date | None = None
+    ) -> Reservation | None:
+        """Reserve ``amount`` satang; ``None`` if the budget cannot cover it."""
+        if amount <= 0:
+            raise ValueError("amount must be positive")
+        key = (province_id, period_of(day))
+        allotment = self._allotments.setdefault(key, Allotment())
+        allotment.used = True
+
+        while allotment.available < amount:
+            async with allotment.lock:
+                if allotment.available >= amount:
+                    break
+                leased = await self._lease(key, amount - allotment.available)
+                if not leased:
+                    allotment.refused += 1
+                    return None
+                allotment.leases += 1
+                allotment.available += leased
+
+        allotment.available -= amount
+        allotment.reserved += amount
+        reservation = Reservation(next(self._ids), province_id, key[1], amount)
+        self._reservations[reservation.id] = reservation
+        return reservation
+
+    def _settle(self, reservation: Reservation) -> Allotment | None:
+        if self._reservations.pop(reservation.id, None) is None:
+            return None
+        allotment = self._allotments[(reservation.province_id, reservation.period)]
+        allotment.reserved -= reservation.amount
+        return allotment
+
+    def commit(self, reservation: Reservation) -> bool:
+        """Spend a reservation; ``False`` if it was already committed or released."""
+        allotment = self._settle(reservation)
+        if allotment is None:
+            return False
+        allotment.committed += reservation.amount
+        return True
+
+    def release(self, reservation: Reservation) -> bool:
+        """Give a reservation back to the allotment."""
+        allotment = self._settle(reservation)
+        if allotment is None:
+            return False
+        allotment.available += reservation.amount
+        return True
+
+    async def reconcile(self, hand_back_all: bool = False) -> int:
+        """Write spending to the rows and hand back spare allotment.
+
+        Returns the number of budgets written.
+        """
+        changes = {}
+        for key, allotment in self._allotments.items():
+            # Leasing right now; picked up next time
+            if allotment.lock.locked():
+                continue
+            if hand_back_all or not allotment.used:
+                spare = allotment.available
+            else:
+                spare = max(0, allotment.available - self.lease_amount)
+            allotment.used = False
+            if allotment.committed or spare:
+                changes[key] = (allotment.committed, spare)
+                allotment.committed = 0
+                allotment.available -= spare
+        if not changes:
+            return 0
+
+        budget = models.DBProvinceBudget
+        try:
+            async with self.session() as session:
+                for key, (spent, spare) in changes.items():
+                    await session.exec(
+                        update(budget)
+                        .where(*_row(key))
+                        .values(
+                            spent=budget.spent + spent, leased=budget.leased - spare
+                        )
+                    )
+                await session.commit()
+        except BaseException:
+            for key, (spent, spare) in changes.items():
+                self._allotments[key].committed += spent
+                self._allotments[key].available += spare
+            raise
+        return len(changes)
+
+    async def run(self, interval: float):
+        """Reconcile every ``interval`` seconds until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reconcile()
+            except Exception:
+                logger.exception("Failed to reconcile co-pay budgets")
+
+    async def set_budget(
+        self, province_id: int, cap: int, day: datetime.date | None = None
+    ) -> models.DBProvinceBudget | None:
+        """Create or change a budget; ``None`` if ``cap`` is below what is leased."""
+        key = (province_id, period_of(day))
+        budget = models.DBProvinceBudget
+        async with self.session() as session:
+            # Conditional, so a lease cannot slip in between check and change
+            result = await session.exec(
+                update(budget).where(*_row(key), budget.leased <= cap).values(cap=cap)
+            )
+            if not result.rowcount:
+                result = await session.exec(select(budget).where(*_row(key)))
+                if result.first() is not None:
+                    return None
+                session.add(budget(province_id=province_id, period=key[1], cap=cap))
+            await session.commit()
+
+            result = await session.exec(select(budget).where(*_row(key)))
+            return result.one()
+
+    async def load_budgets(self) -> list[models.DBProvinceBudget]:
+        async with self.session() as session:
+            result = await session.exec(
+                select(models.DBProvinceBudget).order_by(
+                    models.DBProvinceBudget.province_id, models.DBProvinceBudget.period
+                )
+            )
+            return list(result.all())
+
+
+_pools: BudgetPools | None = None
+
+
+def get_pools() -> BudgetPools:
+    global _pools
+    if _pools is None:
+        _pools = BudgetPools(lease_amount=settings.BUDGET_LEASE_SATANG)
+    return _pools
+
+
+def set_pools(pools: BudgetPools | None):
+    global _pools
+    _pools = pools
@@ -0,0 +1,157 @@
+import logging
+import time
+import typing
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+settings = config.get_settings()
+
+
+class LocalCache:
+    """In-process TTL cache used when no shared backend is configured.
+
+    ``max_entries`` bounds the values stored with ``set``; counters are kept
+    apart and never evicted, since a counter that restarted from 0 would
+    hand out versions already used.
+    """
+
+    def __init__(self, max_entries: int = 100_000):
+        self.max_entries = max_entries
+        self._data: dict[str, tuple[str, float]] = {}
+        self._counters: dict[str, int] = {}
+
+    def _purge(self):
+        now = time.monotonic()
+        for key in [k for k, (_, expires) in self._data.items() if expires <= now]:
+            del self._data[key]
+
+        # Still full after dropping expired keys: evict the oldest insertions
+        overflow = len(self._data) - self.max_entries
+        if overflow >= 0:
+            for key in list(self._data)[: overflow + 1]:
+                del self._data[key]
+
+    async def get(self, key: str) -> str | None:
+        if key in self._counters:
+            return str(self._counters[key])
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires = item
+        if expires <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    async def set(self, key: str, value: str, ttl: float):
+        if key not in self._data and len(self._data) >= self.max_entries:
+            self._purge()
+        self._counters.pop(key, None)
+        self._data[key] = (value, time.monotonic() + ttl)
+
+    async def swap(self, key: str, value: str, ttl: float) -> str | None:
+        """Store ``value`` and return the previous value in one step."""
+        old = await self.get(key)
+        await self.set(key, value, ttl)
+        return old
+
+    async def add(self, key: str, value: str, ttl: float) -> bool:
+        """Store ``value`` only if ``key`` is absent; returns whether it was stored."""
+        if await self.get(key) is not None:
+            return False
+        await self.set(key, value, ttl)
+        return True
+
+    async def get_many(self, keys: list[str]) -> list[str | None]:
+        return [await self.get(key) for key in keys]
+
+    async def incr(self, key: str) -> int:
+        value = int(await self.get(key) or 0) + 1
+        self._data.pop(key, None)
+        self._counters[key] = value
+        return value
+
+    async def delete(self, key: str):
+        self._data.pop(key, None)
+        self._counters.pop(key, None)
+
+    async def close(self):
+        self._data.clear()
+        self._counters.clear()
+
+    def __len__(self) -> int:
+        return len(self._data) + len(self._counters)
+
+
+class RedisCache:
+    """Shared cache backed by Redis, used when ``REDIS_URL`` is set."""
+
+    def __init__(self, url: str):
+        try:
+            from redis import asyncio as redis_asyncio
+        except ImportError as e:
+            raise RuntimeError(
+                "REDIS_URL is set but the 'redis' package is not installed"
+            ) from e
+
+        self._client = redis_asyncio.from_url(url, decode_responses=True)
+
+    async def get(self, key: str) -> str | None:
+        return await self._client.get(key)
+
+    async def set(self, key: str, value: str, ttl: float):
+        await self._client.set(key, value, px=max(1, int(ttl * 1000)))
+
+    async def swap(self, key: str, value: str, ttl: float) -> str | None:
+        """Store ``value`` and return the previous value atomically (SET ... GET)."""
+        return await self._client.set(key, value, px=max(1, int(ttl * 1000)), get=True)
+
+    async def add(self, key: str, value: str, ttl: float) -> bool:
+        """Store ``value`` only if ``key`` is absent (SET ... NX)."""
+        return bool(
+            await self._client.set(key, value, px=max(1, int(ttl * 1000)), nx=True)
+        )
+
+    async def get_many(self, keys: list[str]) -> list[str | None]:
+        if not keys:
+            return []
+        return await self._client.mget(keys)
+
+    async def incr(self, key: str) -> int:
+        return await self._client.incr(key)
+
+    async def delete(self, key: str):
+        await self._client.delete(key)
+
+    async def close(self):
+        await self._client.aclose()
+
+
+Cache = typing.Union[LocalCache, RedisCache]
+
+_cache: Cache | None = None
+
+
+def get_cache() -> Cache:
+    global _cache
+    if _cache is None:
+        if settings.REDIS_URL:
+            _cache = RedisCache(settings.REDIS_URL)
+        else:
+            if settings.WORKERS > 1:
+                logger.warning(
+                    "REDIS_URL is not set, so each of the %d workers keeps its "
+                    "own refresh tokens, revocations and idempotency records",
+                    settings.WORKERS,
+                )
+            _cache = LocalCache(max_entries=settings.CACHE_MAX_ENTRIES)
+    return _cache
+
+
+async def close_cache():
+    global _cache
+    if _cache is not None:
+        await _cache.close()
+        _cache = None
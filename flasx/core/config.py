@@ -1,3 +1,6 @@
+import datetime
+import typing
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -8,6 +11,114 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 5 * 60  # 5 minutes
     REFRESH_TOKEN_EXPIRE_MINUTES: int = 7 * 24 * 60  # 7 days
 
+    # Users allowed on the /v1/admin routes
+    ADMIN_USER_IDS: list[int] = []
+
+    # Optional read replica for read-only routes
+    SQLDB_REPLICA_URL: str | None = None
+    READ_YOUR_WRITES_SECONDS: float = 5.0
+
+    # Extra databases user data is sharded across; SQLDB_URL is shard 0
+    SQLDB_SHARD_URLS: list[str] = []
+
+    # SQLite profile: WAL, one writer connection and a read-only pool
+    SQLITE_HIGH_CONCURRENCY: bool = True
+    SQLITE_READ_POOL_SIZE: int = 4
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_CACHE_SIZE: int = -64000  # negative values are KiB
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+
+    # Compiled SQL statements kept per engine; 0 disables the cache
+    SQL_COMPILED_CACHE_SIZE: int = 500
+
+    # Password hashing; see `python -m flasx.commands.calibrate_password_hash`
+    PASSWORD_HASH_ALGORITHM: typing.Literal["bcrypt", "scrypt"] = "bcrypt"
+    BCRYPT_ROUNDS: int = 12
+    SCRYPT_LOG2_N: int = 15
+    SCRYPT_R: int = 8
+    SCRYPT_P: int = 1
+
+    # How often buffered last-login timestamps are written
+    LAST_LOGIN_FLUSH_SECONDS: float = 5.0
+
+    # Province tiers and quota limits; defaults to flasx/data/quota_rules.json
+    QUOTA_RULES_PATH: str | None = None
+
+    # Co-pay calculator rules; unset means uncapped / no program window
+    COPAY_MAX_REDUCTION_PER_USER: float | None = None
+    COPAY_PROGRAM_START: datetime.date | None = None
+    COPAY_PROGRAM_END: datetime.date | None = None
+
+    # Per-province co-pay budgets; see flasx.core.budget. Each worker leases
+    # this much (in satang) of a budget at a time
+    BUDGET_LEASE_SATANG: int = 100_000
+    BUDGET_RECONCILE_SECONDS: float = 1.0
+
+    # tracemalloc diagnostics under /admin/memory; can also be toggled at
+    # runtime by the admin API or by sending MEMORY_PROFILING_SIGNAL
+    MEMORY_PROFILING: bool = False
+    MEMORY_PROFILING_FRAMES: int = 10
+    MEMORY_PROFILING_SIGNAL: str = "SIGUSR2"
+    MEMORY_SNAPSHOTS_KEPT: int = 10
+
+    # cProfile a request sent with "X-Profile: <PROFILING_SECRET>", or a
+    # random PROFILING_SAMPLE_RATE fraction of all requests
+    PROFILING_SECRET: str | None = None
+    PROFILING_SAMPLE_RATE: float = 0.0
+    PROFILING_DIR: str = "profiles"
+    PROFILES_KEPT: int = 100
+
+    # Province feed (server-sent events) batching and per-client buffering
+    FEED_TICK_SECONDS: float = 1.0
+    FEED_QUEUE_SIZE: int = 16
+    FEED_KEEPALIVE_SECONDS: float = 15.0
+
+    # Idempotency-Key replay for retried POSTs; see flasx.core.idempotency
+    IDEMPOTENCY_TTL_SECONDS: float = 24 * 60 * 60
+    IDEMPOTENCY_LOCK_SECONDS: float = 30.0
+    IDEMPOTENCY_WAIT_SECONDS: float = 10.0
+
+    # Startup warm-up; /ready reports 503 until it finishes
+    WARMUP_ENABLED: bool = True
+    WARMUP_POOL_CONNECTIONS: int = 4
+    WARMUP_PATHS: list[str] = [
+        "/v1/provinces/",
+        "/v1/provinces/primary/",
+        "/v1/provinces/secondary/",
+        "/v1/provinces/search?q=a",
+    ]
+
+    # Load shedding: low-priority requests get 503 while the event loop lags
+    # by more than ADMISSION_MAX_LAG_SECONDS or too many requests are running
+    ADMISSION_CONTROL: bool = True
+    ADMISSION_MAX_LAG_SECONDS: float = 0.2
+    ADMISSION_MAX_IN_FLIGHT: int = 256
+    ADMISSION_RETRY_AFTER_SECONDS: int = 1
+    ADMISSION_LAG_INTERVAL_SECONDS: float = 0.05
+
+    # Blocking-call detection on the event loop; see flasx.core.loop_debug
+    LOOP_DEBUG: bool = False
+    LOOP_SLOW_CALLBACK_SECONDS: float = 0.1
+    LOOP_BLOCKING_CALLS_KEPT: int = 100
+
+    # Rendered my-quota, my-provinces and available-provinces responses kept
+    # per worker; see flasx.core.response_cache
+    RESPONSE_CACHE_MAX_ENTRIES: int = 10_000
+    RESPONSE_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+
+    # Shared cache; falls back to an in-process cache when unset
+    REDIS_URL: str | None = None
+    CACHE_MAX_ENTRIES: int = 100_000
+
+    # Worker processes serving the app; with more than one, state that must
+    # agree across workers needs REDIS_URL
+    WORKERS: int = 1
+
+    # Token revocation
+    REVOCATION_BLOOM_FILTER: bool = False
+    REVOCATION_BLOOM_CAPACITY: int = 100_000
+    REVOCATION_SYNC_SECONDS: float = 1.0
+
     model_config = {"env_file": ".env", "validate_assignment": True, "extra": "allow"}
 
 
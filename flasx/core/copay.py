@@ -0,0 +1,142 @@
+"""Vectorized co-pay (tax reduction) calculation.
+
+Every expense line is one slot in a set of parallel NumPy arrays and no step
+loops over lines in Python:
+
+* the province rate is a gather from a rate vector indexed by province id
+* eligibility is a gather from a (user x province) boolean matrix built from
+  the users' target provinces
+* the per-user cap is applied in date order with one cumulative sum over the
+  lines sorted by user
+"""
+
+import dataclasses
+import datetime
+
+import numpy as np
+
+
+@dataclasses.dataclass(frozen=True)
+class CopayCalculation:
+    rates: np.ndarray
+    eligible: np.ndarray
+    reductions: np.ndarray
+    user_ids: np.ndarray
+    user_totals: np.ndarray
+
+    @property
+    def total_reduction(self) -> float:
+        return float(self.reductions.sum())
+
+    @property
+    def eligible_lines(self) -> int:
+        return int(self.eligible.sum())
+
+
+def rate_vector(province_rates: dict[int, float]) -> np.ndarray:
+    """Rates indexed by province id; ids without a province get 0."""
+    size = max(province_rates, default=0) + 1
+    rates = np.zeros(size, dtype=np.float64)
+    if province_rates:
+        rates[np.fromiter(province_rates.keys(), dtype=np.int64)] = np.fromiter(
+            province_rates.values(), dtype=np.float64
+        )
+    return rates
+
+
+def _gather(vector: np.ndarray, index: np.ndarray, default=0):
+    """``vector[index]`` with out-of-range indexes mapped to ``default``."""
+    valid = (index >= 0) & (index < len(vector))
+    return np.where(valid, vector[np.where(valid, index, 0)], default)
+
+
+def calculate(
+    user_ids: np.ndarray,
+    province_ids: np.ndarray,
+    amounts: np.ndarray,
+    dates: np.ndarray,
+    rates: np.ndarray,
+    target_user_ids: np.ndarray,
+    target_province_ids: np.ndarray,
+    max_reduction_per_user: float | None = None,
+    program_start: datetime.date | None = None,
+    program_end: datetime.date | None = None,
+) -> CopayCalculation:
+    """Compute the reduction of every expense line.
+
+    ``dates`` is a ``datetime64[D]`` array. ``target_user_ids`` and
+    ``target_province_ids`` are the (user, province) pairs users have chosen
+    as target provinces; a line is only eligible for one of those pairs.
+    """
+    user_ids = np.asarray(user_ids, dtype=np.int64)
+    province_ids = np.asarray(province_ids, dtype=np.int64)
+    amounts = np.asarray(amounts, dtype=np.float64)
+    dates = np.asarray(dates, dtype="datetime64[D]")
+    if len(user_ids) == 0:
+        empty = np.zeros(0, dtype=np.float64)
+        return CopayCalculation(
+            rates=empty,
+            eligible=np.zeros(0, dtype=bool),
+            reductions=empty,
+            user_ids=np.zeros(0, dtype=np.int64),
+            user_totals=empty,
+        )
+
+    unique_users, user_index = np.unique(user_ids, return_inverse=True)
+    line_rates = _gather(rates, province_ids, 0.0)
+
+    # (user x province) eligibility matrix, restricted to users in this batch
+    eligibility = np.zeros((len(unique_users), len(rates)), dtype=bool)
+    target_user_ids = np.asarray(target_user_ids, dtype=np.int64)
+    target_province_ids = np.asarray(target_province_ids, dtype=np.int64)
+    position = np.searchsorted(unique_users, target_user_ids)
+    position = np.minimum(position, len(unique_users) - 1)
+    known = (
+        (unique_users[position] == target_user_ids)
+        & (target_province_ids >= 0)
+        & (target_province_ids < len(rates))
+    )
+    eligibility[position[known], target_province_ids[known]] = True
+
+    in_range = (province_ids >= 0) & (province_ids < len(rates))
+    eligible = np.zeros(len(user_ids), dtype=bool)
+    eligible[in_range] = eligibility[user_index[in_range], province_ids[in_range]]
+    if program_start is not None:
+        eligible &= dates >= np.datetime64(program_start, "D")
+    if program_end is not None:
+        eligible &= dates <= np.datetime64(program_end, "D")
+
+    reductions = np.where(eligible, amounts * line_rates, 0.0)
+
+    if max_reduction_per_user is not None and len(reductions):
+        # Lines consume the cap in date order, ties by input order
+        order = np.lexsort((np.arange(len(reductions)), dates, user_index))
+        sorted_users = user_index[order]
+        sorted_reductions = reductions[order]
+
+        group_start = np.ones(len(order), dtype=bool)
+        group_start[1:] = sorted_users[1:] != sorted_users[:-1]
+        group = np.cumsum(group_start) - 1
+
+        running = np.cumsum(sorted_reductions)
+        before_group = (running - sorted_reductions)[group_start]
+        capped = np.minimum(running - before_group[group], max_reduction_per_user)
+
+        previous = np.empty_like(capped)
+        previous[0] = 0.0
+        previous[1:] = capped[:-1]
+        previous[group_start] = 0.0
+
+        reductions = np.empty_like(reductions)
+        reductions[order] = capped - previous
+
+    user_totals = np.bincount(
+        user_index, weights=reductions, minlength=len(unique_users)
+    )
+    return CopayCalculation(
+        rates=line_rates,
+        eligible=eligible,
+        reductions=reductions,
+        user_ids=unique_users,
+        user_totals=user_totals,
+    )
@@ -10,6 +10,7 @@ from pydantic import ValidationError
 from flasx import models
 from . import security
 from . import config
+from . import revocation
 
 logger = logging.getLogger(__name__)
 
@@ -18,15 +19,17 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/v1/token")
 settings = config.get_settings()
 
 
-async def get_current_user(
-    token: typing.Annotated[str, Depends(oauth2_scheme)],
-    session: typing.Annotated[models.AsyncSession, Depends(models.get_session)],
-) -> models.User:
-    credentials_exception = HTTPException(
+def credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+async def get_token_payload(
+    token: typing.Annotated[str, Depends(oauth2_scheme)],
+) -> dict:
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
@@ -34,15 +37,35 @@ async def get_current_user(
         user_id: int = payload.get("sub")
 
         if user_id is None:
-            raise credentials_exception
+            raise credentials_exception()
+
+        # Refresh tokens are only accepted by /v1/token/refresh
+        if payload.get("type") == security.REFRESH_TOKEN_TYPE:
+            raise credentials_exception()
 
     except Exception as e:
-        print(e)
-        raise credentials_exception
+        logger.debug("Invalid access token: %s", e)
+        raise credentials_exception()
 
-    user = await session.get(models.DBUser, user_id)
+    store = revocation.get_store()
+    await store.sync()
+    if store.is_revoked(payload.get("jti")):
+        raise credentials_exception()
+
+    return payload
+
+
+async def get_current_user(
+    payload: typing.Annotated[dict, Depends(get_token_payload)],
+    session: typing.Annotated[models.AsyncSession, Depends(models.get_read_session)],
+) -> models.User:
+    user = await session.get(models.DBUser, payload["sub"])
     if user is None:
-        raise credentials_exception
+        raise credentials_exception()
+
+    # Tokens issued before the user's last "revoke all" are rejected
+    if payload.get("tv", 0) != user.token_version:
+        raise credentials_exception()
 
     return user
 
@@ -57,8 +80,11 @@ async def get_current_active_user(
 async def get_current_active_superuser(
     current_user: typing.Annotated[models.User, Depends(get_current_user)],
 ) -> models.User:
-    # Remove roles check since User model doesn't have roles field
-    # This would need to be implemented based on your user permission system
+    if current_user.id not in settings.ADMIN_USER_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions",
+        )
     return current_user
 
 
@@ -0,0 +1,139 @@
+"""Response encoding chosen by the ``Accept`` header.
+
+The v1 routes use ``NegotiatedRoute``, which serves the response model in
+the first of these the client accepts:
+
+* ``application/msgpack`` (also ``application/x-msgpack`` and
+  ``application/vnd.msgpack``)
+* ``application/cbor``, when the optional ``cbor2`` package is installed
+* JSON, also the default for a missing, wildcard or unsupported ``Accept``
+
+Only the last step changes: the route's response model is validated and
+serialized by the same compiled pydantic serializer FastAPI builds for the
+route at startup, and the resulting plain data is packed into the
+negotiated format instead of being dumped as JSON. So every format carries
+exactly the data the JSON response does, with dates as ISO strings. Routes
+with their own response class (streams, files, plain text) and error
+responses stay as they are. Negotiated responses carry ``Vary: Accept``.
+"""
+
+from typing import Any, Callable, Coroutine
+
+import msgpack
+from fastapi import Request, Response
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute, get_request_handler
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+CBOR = "application/cbor"
+
+MEDIA_TYPE_ALIASES = {
+    "*/*": JSON,
+    "application/*": JSON,
+    JSON: JSON,
+    MSGPACK: MSGPACK,
+    "application/x-msgpack": MSGPACK,
+    "application/vnd.msgpack": MSGPACK,
+}
+if cbor2 is not None:
+    MEDIA_TYPE_ALIASES[CBOR] = CBOR
+
+
+class MsgPackResponse(Response):
+    media_type = MSGPACK
+
+    def render(self, content: Any) -> bytes:
+        return msgpack.packb(content)
+
+
+class CBORResponse(Response):
+    media_type = CBOR
+
+    def render(self, content: Any) -> bytes:
+        return cbor2.dumps(content)
+
+
+RESPONSE_CLASSES: dict[str, type[Response]] = {
+    JSON: JSONResponse,
+    MSGPACK: MsgPackResponse,
+}
+if cbor2 is not None:
+    RESPONSE_CLASSES[CBOR] = CBORResponse
+
+
+def negotiate(accept: str | None) -> str:
+    """The supported media type with the highest quality in ``accept``; ties go to the first listed."""
+    best, best_quality = JSON, 0.0
+    for media_range in (accept or "").split(","):
+        media_type, *params = (part.strip() for part in media_range.split(";"))
+        supported = MEDIA_TYPE_ALIASES.get(media_type.lower())
+        if supported is None:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > best_quality:
+            best, best_quality = supported, quality
+    return best
+
+
+def requested_media_type(request: Request) -> str:
+    """Dependency: the media type to answer ``request`` in."""
+    return negotiate(request.headers.get("accept"))
+
+
+def encode(content: Any, media_type: str) -> bytes:
+    """Render plain data (as from ``jsonable_encoder``) in ``media_type``."""
+    return RESPONSE_CLASSES[media_type](content).body
+
+
+class NegotiatedRoute(APIRoute):
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        json_handler = super().get_route_handler()
+        response_class = self.response_class
+        if isinstance(response_class, DefaultPlaceholder):
+            response_class = response_class.value
+        if response_class is not JSONResponse:
+            return json_handler
+
+        # One request handler per format, each with the route's compiled
+        # response field and a response class that packs its output
+        handlers = {
+            media_type: get_request_handler(
+                dependant=self.dependant,
+                body_field=self.body_field,
+                status_code=self.status_code,
+                response_class=encoded_response_class,
+                response_field=self.secure_cloned_response_field,
+                response_model_include=self.response_model_include,
+                response_model_exclude=self.response_model_exclude,
+                response_model_by_alias=self.response_model_by_alias,
+                response_model_exclude_unset=self.response_model_exclude_unset,
+                response_model_exclude_defaults=self.response_model_exclude_defaults,
+                response_model_exclude_none=self.response_model_exclude_none,
+                dependency_overrides_provider=self.dependency_overrides_provider,
+                embed_body_fields=self._embed_body_fields,
+            )
+            for media_type, encoded_response_class in RESPONSE_CLASSES.items()
+            if media_type != JSON
+        }
+        handlers[JSON] = json_handler
+
+        async def handler(request: Request) -> Response:
+            response = await handlers[requested_media_type(request)](request)
+            response.headers.append("Vary", "Accept")
+            return response
+
+        return handler
@@ -0,0 +1,265 @@
+"""``Idempotency-Key`` support for POST endpoints that clients retry.
+
+For the routes in ``IDEMPOTENT_ROUTES``, a request carrying an
+``Idempotency-Key`` header is executed at most once per key (per caller and
+route) within ``IDEMPOTENCY_TTL_SECONDS``:
+
+* the first request claims the key in the shared cache, runs, and its
+  response is stored under the key
+* a retry gets the stored response back, with ``Idempotent-Replayed: true``
+* a duplicate arriving while the first is still running waits for it, up
+  to ``IDEMPOTENCY_WAIT_SECONDS``, then gets its response; 409 if it is still
+  running after that. If the first fails instead, the duplicate claims the
+  key and runs itself
+* reusing a key with a different request body is rejected with 422
+
+Server errors (5xx) are not stored, so the retry runs again. A claim that is
+never completed, e.g. because the worker died, expires after
+``IDEMPOTENCY_LOCK_SECONDS``.
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+
+import jwt
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from . import cache
+from . import config
+from . import revocation
+from . import security
+
+settings = config.get_settings()
+
+IDEMPOTENCY_HEADER = "idempotency-key"
+REPLAYED_HEADER = b"idempotent-replayed"
+KEY_PREFIX = "idempotency:"
+MAX_KEY_LENGTH = 255
+# How often a waiting duplicate re-checks the cache for the original's response
+POLL_SECONDS = 0.05
+
+IDEMPOTENT_ROUTES = {
+    ("POST", "/v1/register"),
+    ("POST", "/v1/users/create"),
+    ("POST", "/v1/user-provinces/target-province"),
+}
+
+IN_FLIGHT = "in-flight"
+DONE = "done"
+
+
+async def verified_subject(headers: Headers) -> str | None:
+    """User id of the request's access token, if it verifies and is not revoked.
+
+    Replays run before the route's own authentication, so unlike
+    ``consistency.request_subject`` this checks the token: a forged one must
+    not reach another user's stored responses.
+    """
+    scheme, _, token = headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        payload = security.decode_access_token(token)
+    except jwt.InvalidTokenError:
+        return None
+
+    store = revocation.get_store()
+    await store.sync()
+    if store.is_revoked(payload.get("jti")):
+        return None
+    return payload.get("sub")
+
+
+async def cache_key(scope: Scope, key: str) -> str:
+    # Scoped to the caller, so one user's key can never replay another's response
+    subject = await verified_subject(Headers(scope=scope))
+    return f"{KEY_PREFIX}{scope['method']}:{scope['path']}:{subject or ''}:{key}"
+
+
+async def read_body(receive: Receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            return body
+        body += message.get("body", b"")
+        if not message.get("more_body", False):
+            return body
+
+
+def error(status_code: int, detail: str) -> JSONResponse:
+    return JSONResponse({"detail": detail}, status_code=status_code)
+
+
+class IdempotencyMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        # Local waiters are woken as soon as the original finishes here;
+        # duplicates on other workers poll the shared cache instead
+        self._finished: dict[str, asyncio.Event] = {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if (
+            scope["type"] != "http"
+            or (scope["method"], scope["path"]) not in IDEMPOTENT_ROUTES
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        key = headers.get(IDEMPOTENCY_HEADER)
+        if key is None:
+            await self.app(scope, receive, send)
+            return
+        if not key or len(key) > MAX_KEY_LENGTH:
+            await error(400, "Invalid Idempotency-Key header")(scope, receive, send)
+            return
+
+        body = await read_body(receive)
+        fingerprint = hashlib.sha256(body).hexdigest()
+        record_key = await cache_key(scope, key)
+        store = cache.get_cache()
+
+        while not await store.add(
+            record_key,
+            json.dumps({"state": IN_FLIGHT, "fingerprint": fingerprint}),
+            settings.IDEMPOTENCY_LOCK_SECONDS,
+        ):
+            record = await self._wait_for_original(record_key, fingerprint)
+            if record is None:
+                # The original failed and released the key: try to claim it
+                continue
+            if record["fingerprint"] != fingerprint:
+                response = error(
+                    422, "Idempotency-Key was already used with a different request"
+                )
+            elif record["state"] == IN_FLIGHT:
+                response = error(
+                    409, "A request with this Idempotency-Key is in progress"
+                )
+            else:
+                await self._replay(record, send)
+                return
+            await response(scope, receive, send)
+            return
+
+        finished = asyncio.Event()
+        self._finished[record_key] = finished
+        try:
+            await self._run_and_store(
+                scope, receive, send, body, record_key, fingerprint
+            )
+        finally:
+            # Once the claim expired, a later request can have claimed the key again
+            if self._finished.get(record_key) is finished:
+                del self._finished[record_key]
+            finished.set()
+
+    async def _wait_for_original(
+        self, record_key: str, fingerprint: str
+    ) -> dict | None:
+        """The original's record once it is done, or None if it released the key.
+
+        Still in flight after ``IDEMPOTENCY_WAIT_SECONDS``, its in-flight
+        record is returned. A record for a different request body is
+        returned straight away.
+        """
+        store = cache.get_cache()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            value = await store.get(record_key)
+            if value is None:
+                # The original failed and released the key
+                return None
+            record = json.loads(value)
+            if record["state"] == DONE or record["fingerprint"] != fingerprint:
+                return record
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return record
+            finished = self._finished.get(record_key)
+            if finished is not None:
+                try:
+                    await asyncio.wait_for(finished.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await asyncio.sleep(min(POLL_SECONDS, remaining))
+
+    async def _run_and_store(
+        self,
+        scope: Scope,
+        receive: Receive,
+        send: Send,
+        body: bytes,
+        record_key: str,
+        fingerprint: str,
+    ):
+        response: dict = {"body": b""}
+        body_sent = False
+
+        async def replay_body() -> Message:
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            # The body was already read, so this is e.g. http.disconnect
+            return await receive()
+
+        async def capture(message: Message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                response["body"] += message.get("body", b"")
+            await send(message)
+
+        store = cache.get_cache()
+        try:
+            await self.app(scope, replay_body, capture)
+        except BaseException:
+            await store.delete(record_key)
+            raise
+
+        if response.get("status", 500) >= 500:
+            await store.delete(record_key)
+            return
+
+        await store.set(
+            record_key,
+            json.dumps(
+                {
+                    "state": DONE,
+                    "fingerprint": fingerprint,
+                    "status": response["status"],
+                    "headers": [
+                        [name.decode("latin-1"), value.decode("latin-1")]
+                        for name, value in response["headers"]
+                    ],
+                    "body": base64.b64encode(response["body"]).decode(),
+                }
+            ),
+            settings.IDEMPOTENCY_TTL_SECONDS,
+        )
+
+    async def _replay(self, record: dict, send: Send):
+        headers = [
+            (name.encode("latin-1"), value.encode("latin-1"))
+            for name, value in record["headers"]
+        ]
+        await send(
+            {
+                "type": "http.response.start",
+                "status": record["status"],
+                "headers": headers + [(REPLAYED_HEADER, b"true")],
+            }
+        )
+        await send(
+            {"type": "http.response.body", "body": base64.b64decode(record["body"])}
+        )
@@ -0,0 +1,100 @@
+"""Coalesced ``last_login_date`` writes.
+
+Logins only record the timestamp in memory. A background task started in the
+application lifespan writes everything recorded since the last flush as one
+UPDATE per chunk of users, and the buffer is flushed once more on shutdown.
+"""
+
+import asyncio
+import collections
+import datetime
+import logging
+
+from sqlalchemy import case, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from flasx import models
+from . import config
+
+logger = logging.getLogger(__name__)
+
+settings = config.get_settings()
+
+# Keeps the number of bound parameters per statement well below SQLite's limit
+FLUSH_CHUNK_SIZE = 500
+
+
+class LastLoginBuffer:
+    def __init__(self):
+        self._pending: dict[int, datetime.datetime] = {}
+
+    def record(self, user_id: int, logged_in_at: datetime.datetime):
+        self._pending[user_id] = logged_in_at
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    async def flush(
+        self, session: AsyncSession, user_ids: list[int] | None = None
+    ) -> int:
+        """Write pending timestamps, only those of ``user_ids`` if given.
+
+        Returns the number of users updated.
+        """
+        if user_ids is None:
+            pending, self._pending = self._pending, {}
+        else:
+            pending = {
+                user_id: self._pending.pop(user_id)
+                for user_id in user_ids
+                if user_id in self._pending
+            }
+        if not pending:
+            return 0
+
+        user_ids = list(pending)
+        try:
+            for start in range(0, len(user_ids), FLUSH_CHUNK_SIZE):
+                chunk = user_ids[start : start + FLUSH_CHUNK_SIZE]
+                await session.exec(
+                    update(models.DBUser)
+                    .where(models.DBUser.id.in_(chunk))
+                    .values(
+                        last_login_date=case(
+                            {user_id: pending[user_id] for user_id in chunk},
+                            value=models.DBUser.id,
+                        )
+                    )
+                )
+            await session.commit()
+        except BaseException:
+            # Keep the timestamps for the next attempt unless newer ones arrived
+            for user_id, logged_in_at in pending.items():
+                self._pending.setdefault(user_id, logged_in_at)
+            raise
+
+        return len(pending)
+
+    async def flush_with_new_session(self) -> int:
+        # Each user's row is updated on the shard that holds it
+        shard_user_ids = collections.defaultdict(list)
+        for user_id in self._pending:
+            shard_user_ids[models.shard_for_user(user_id)].append(user_id)
+
+        flushed = 0
+        for shard, user_ids in shard_user_ids.items():
+            async with models.shards[shard].session() as session:
+                flushed += await self.flush(session, user_ids)
+        return flushed
+
+    async def run(self, interval: float):
+        """Flush every ``interval`` seconds until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush_with_new_session()
+            except Exception:
+                logger.exception("Failed to flush last login dates")
+
+
+buffer = LastLoginBuffer()
@@ -0,0 +1,211 @@
+"""Opt-in detection of blocking calls on the event loop.
+
+With ``LOOP_DEBUG`` set, the application lifespan puts the loop in asyncio
+debug mode, so asyncio itself logs every callback that runs longer than
+``LOOP_SLOW_CALLBACK_SECONDS``. Those warnings only name the callback, so a
+watchdog thread also looks out for the loop going that long without running
+a heartbeat. When that happens, the watchdog records:
+
+* the stack the loop thread is blocked in
+* the task that was running and, if it is serving a request, the request's
+  route
+* how long the loop was blocked, once it runs again
+
+Time spent in garbage collection is not counted: a collection pauses every
+thread wherever it was triggered, and is not a blocking call of the code it
+happens to interrupt.
+
+The last ``LOOP_BLOCKING_CALLS_KEPT`` are listed under
+``/admin/loop/blocking-calls``. The test suite runs with this mode on and
+fails any test in which a request handler blocks.
+"""
+
+import asyncio
+import collections
+import dataclasses
+import datetime
+import gc
+import logging
+import sys
+import threading
+import time
+import traceback
+import weakref
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+settings = config.get_settings()
+
+
+@dataclasses.dataclass
+class BlockingCall:
+    detected_at: datetime.datetime
+    # "GET /v1/users/{user_id}", or None outside a request
+    route: str | None
+    task: str | None
+    stack: list[str]
+    # Known once the loop runs again
+    blocked_seconds: float | None = None
+
+
+def scope_route(scope: Scope) -> str:
+    # Only known after routing
+    route = scope.get("route")
+    return f"{scope['method']} {getattr(route, 'path', scope['path'])}"
+
+
+class BlockingMonitor:
+    def __init__(self, threshold: float, kept: int = 100):
+        self.threshold = threshold
+        self._calls: collections.deque[BlockingCall] = collections.deque(
+            maxlen=kept
+        )
+        # Task serving each request in progress
+        self._requests: weakref.WeakKeyDictionary[asyncio.Task, Scope] = (
+            weakref.WeakKeyDictionary()
+        )
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread_id: int | None = None
+        self._heartbeat: asyncio.TimerHandle | None = None
+        self._stopped = threading.Event()
+        self._watchdog: threading.Thread | None = None
+        self._last_beat = 0.0
+        self._stall: BlockingCall | None = None
+        # Garbage collection since the last heartbeat. Updated without the
+        # lock, as a collection can start while the lock is held
+        self._gc_started: float | None = None
+        self._gc_seconds = 0.0
+
+    @property
+    def interval(self) -> float:
+        return self.threshold / 4
+
+    @property
+    def running(self) -> bool:
+        return self._loop is not None
+
+    def start(self, loop: asyncio.AbstractEventLoop | None = None):
+        """Watch ``loop``, the running one by default; must be called on its thread."""
+        if self.running:
+            return
+        self._loop = loop or asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._loop.set_debug(True)
+        self._loop.slow_callback_duration = self.threshold
+
+        self._last_beat = time.monotonic()
+        self._gc_seconds = 0.0
+        gc.callbacks.append(self._on_gc)
+        self._heartbeat = self._loop.call_later(self.interval, self._beat)
+        self._stopped.clear()
+        self._watchdog = threading.Thread(
+            target=self._watch, name="loop-debug-watchdog", daemon=True
+        )
+        self._watchdog.start()
+
+    def stop(self):
+        if not self.running:
+            return
+        self._stopped.set()
+        self._watchdog.join()
+        gc.callbacks.remove(self._on_gc)
+        self._heartbeat.cancel()
+        self._loop.set_debug(False)
+        self._loop = None
+
+    def track(self, scope: Scope):
+        task = asyncio.current_task()
+        if task is not None:
+            self._requests[task] = scope
+
+    def untrack(self):
+        task = asyncio.current_task()
+        if task is not None:
+            self._requests.pop(task, None)
+
+    def blocking_calls(self) -> list[BlockingCall]:
+        return list(self._calls)
+
+    def clear(self):
+        self._calls.clear()
+
+    def _on_gc(self, phase: str, info: dict):
+        if phase == "start":
+            self._gc_started = time.monotonic()
+        elif self._gc_started is not None:
+            self._gc_seconds += time.monotonic() - self._gc_started
+            self._gc_started = None
+
+    def _late(self, now: float) -> float:
+        """How far the heartbeat is behind, garbage collection aside."""
+        collecting = now - self._gc_started if self._gc_started is not None else 0.0
+        return now - self._last_beat - self.interval - self._gc_seconds - collecting
+
+    def _beat(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._stall is not None:
+                self._stall.blocked_seconds = self._late(now)
+                self._stall = None
+            self._last_beat = now
+            self._gc_seconds = 0.0
+        self._heartbeat = self._loop.call_later(self.interval, self._beat)
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval):
+            with self._lock:
+                late = self._late(time.monotonic())
+                if late > self.threshold and self._stall is None:
+                    self._stall = self._capture()
+                    self._calls.append(self._stall)
+
+    def _capture(self) -> BlockingCall:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = traceback.format_stack(frame) if frame is not None else []
+        task = asyncio.current_task(self._loop)
+        scope = self._requests.get(task) if task is not None else None
+        call = BlockingCall(
+            detected_at=datetime.datetime.now(),
+            route=scope_route(scope) if scope is not None else None,
+            task=task.get_name() if task is not None else None,
+            stack=stack,
+        )
+        logger.warning(
+            "Event loop blocked for over %.3fs in %s:\n%s",
+            self.threshold,
+            call.route or call.task or "a callback",
+            "".join(stack),
+        )
+        return call
+
+
+class LoopDebugMiddleware:
+    """Remembers which request each task is serving, for the watchdog."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not _monitor.running:
+            await self.app(scope, receive, send)
+            return
+
+        _monitor.track(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _monitor.untrack()
+
+
+_monitor = BlockingMonitor(
+    settings.LOOP_SLOW_CALLBACK_SECONDS, kept=settings.LOOP_BLOCKING_CALLS_KEPT
+)
+
+
+def get_monitor() -> BlockingMonitor:
+    return _monitor
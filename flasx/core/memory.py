@@ -0,0 +1,192 @@
+"""Opt-in memory diagnostics built on ``tracemalloc``.
+
+Tracing is off unless ``MEMORY_PROFILING`` is set, an admin starts it through
+``/admin/memory``, or the process receives ``MEMORY_PROFILING_SIGNAL``
+(SIGUSR2 by default), which toggles it. While it is off nothing is traced and
+the request middleware only checks ``tracemalloc.is_tracing()``.
+
+While it is on:
+
+* snapshots can be taken and kept (the last ``MEMORY_SNAPSHOTS_KEPT``), and
+  compared with each other or listed by top allocation sites
+* every request's change in traced memory is added to its route, so routes
+  that leave memory behind stand out. Concurrent requests overlap, so the
+  per-route numbers are indicative rather than exact.
+"""
+
+import collections
+import dataclasses
+import datetime
+import gc
+import itertools
+import logging
+import signal
+import tracemalloc
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+settings = config.get_settings()
+
+GROUP_BY = ("lineno", "filename", "traceback")
+
+
+@dataclasses.dataclass(frozen=True)
+class StoredSnapshot:
+    id: int
+    taken_at: datetime.datetime
+    snapshot: tracemalloc.Snapshot
+
+    @property
+    def traced_bytes(self) -> int:
+        return sum(stat.size for stat in self.snapshot.statistics("filename"))
+
+
+@dataclasses.dataclass
+class RouteMemory:
+    requests: int = 0
+    # Sum over requests of traced memory after minus before the request
+    retained_bytes: int = 0
+    max_retained_bytes: int = 0
+
+    def add(self, retained: int):
+        self.requests += 1
+        self.retained_bytes += retained
+        self.max_retained_bytes = max(self.max_retained_bytes, retained)
+
+
+class MemoryProfiler:
+    def __init__(self, frames: int = 10, snapshots_kept: int = 10):
+        self.frames = frames
+        self._snapshots: collections.deque[StoredSnapshot] = collections.deque(
+            maxlen=snapshots_kept
+        )
+        self._ids = itertools.count(1)
+        self.routes: dict[str, RouteMemory] = collections.defaultdict(RouteMemory)
+
+    @property
+    def enabled(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            logger.info("Memory profiling started with %d frames", self.frames)
+
+    def stop(self):
+        """Stop tracing and drop everything collected while it was on."""
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            logger.info("Memory profiling stopped")
+        self._snapshots.clear()
+        self.routes.clear()
+
+    def toggle(self):
+        if self.enabled:
+            self.stop()
+        else:
+            self.start()
+
+    def take_snapshot(self) -> StoredSnapshot:
+        if not self.enabled:
+            raise RuntimeError("Memory profiling is not enabled")
+
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<unknown>"),
+            )
+        )
+        stored = StoredSnapshot(
+            id=next(self._ids),
+            taken_at=datetime.datetime.now(),
+            snapshot=snapshot,
+        )
+        self._snapshots.append(stored)
+        return stored
+
+    def snapshots(self) -> list[StoredSnapshot]:
+        return list(self._snapshots)
+
+    def get_snapshot(self, snapshot_id: int) -> StoredSnapshot | None:
+        return next((s for s in self._snapshots if s.id == snapshot_id), None)
+
+    def record_request(self, route: str, before: int):
+        current, _ = tracemalloc.get_traced_memory()
+        self.routes[route].add(current - before)
+
+
+def top_sites(
+    snapshot: tracemalloc.Snapshot, group_by: str = "lineno", limit: int = 20
+) -> list[tracemalloc.Statistic]:
+    return snapshot.statistics(group_by)[:limit]
+
+
+def diff(
+    new: tracemalloc.Snapshot,
+    old: tracemalloc.Snapshot,
+    group_by: str = "lineno",
+    limit: int = 20,
+) -> list[tracemalloc.StatisticDiff]:
+    return new.compare_to(old, group_by)[:limit]
+
+
+def describe(stat: tracemalloc.Statistic | tracemalloc.StatisticDiff) -> str:
+    frame = stat.traceback[0]
+    return f"{frame.filename}:{frame.lineno}"
+
+
+def count_instances(base: type) -> dict[str, int]:
+    """Live objects that are instances of ``base``, by class name."""
+    counts = collections.Counter(
+        type(obj).__name__ for obj in gc.get_objects() if isinstance(obj, base)
+    )
+    return dict(counts.most_common())
+
+
+class MemoryMiddleware:
+    """Adds each request's change in traced memory to its route while tracing."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not tracemalloc.is_tracing():
+            await self.app(scope, receive, send)
+            return
+
+        before, _ = tracemalloc.get_traced_memory()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            # Only known after routing; unmatched paths are grouped together
+            route = scope.get("route")
+            path = getattr(route, "path", "<unmatched>")
+            if tracemalloc.is_tracing():
+                _profiler.record_request(f"{scope['method']} {path}", before)
+
+
+_profiler = MemoryProfiler(
+    frames=settings.MEMORY_PROFILING_FRAMES,
+    snapshots_kept=settings.MEMORY_SNAPSHOTS_KEPT,
+)
+
+
+def get_profiler() -> MemoryProfiler:
+    return _profiler
+
+
+def install_signal_handler():
+    """Toggle profiling on ``MEMORY_PROFILING_SIGNAL``, where the platform has it."""
+    signum = getattr(signal, settings.MEMORY_PROFILING_SIGNAL, None)
+    if signum is None:
+        return
+    try:
+        signal.signal(signum, lambda *_: _profiler.toggle())
+    except ValueError:
+        # Only the main thread may install signal handlers
+        logger.warning("Memory profiling signal handler not installed")
@@ -0,0 +1,125 @@
+"""Password hashing.
+
+New hashes use ``PASSWORD_HASH_ALGORITHM`` with the cost from ``Settings``.
+Existing hashes keep verifying whatever algorithm or cost produced them, and
+``needs_rehash`` tells the login path when to upgrade one.
+
+Supported algorithms:
+
+* ``bcrypt``: cost set by ``BCRYPT_ROUNDS``
+* ``scrypt``: memory-hard, from the standard library, stored as
+  ``$scrypt$ln=<log2 N>,r=<r>,p=<p>$<salt>$<hash>``
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+
+import bcrypt
+
+from . import config
+
+settings = config.get_settings()
+
+BCRYPT = "bcrypt"
+SCRYPT = "scrypt"
+ALGORITHMS = (BCRYPT, SCRYPT)
+
+SCRYPT_PREFIX = "$scrypt$"
+SCRYPT_SALT_BYTES = 16
+SCRYPT_KEY_BYTES = 32
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii").rstrip("=")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.b64decode(data + "=" * (-len(data) % 4))
+
+
+def _scrypt(password: bytes, salt: bytes, log2_n: int, r: int, p: int) -> bytes:
+    n = 1 << log2_n
+    return hashlib.scrypt(
+        password,
+        salt=salt,
+        n=n,
+        r=r,
+        p=p,
+        # hashlib refuses anything above 32 MiB unless told otherwise
+        maxmem=128 * r * (n + p + 2),
+        dklen=SCRYPT_KEY_BYTES,
+    )
+
+
+def _parse_scrypt(hashed: str) -> tuple[int, int, int, bytes, bytes]:
+    params, salt, key = hashed[len(SCRYPT_PREFIX) :].split("$")
+    values = dict(item.split("=") for item in params.split(","))
+    return (
+        int(values["ln"]),
+        int(values["r"]),
+        int(values["p"]),
+        _b64decode(salt),
+        _b64decode(key),
+    )
+
+
+def hash_bcrypt(plain_password: str, rounds: int) -> str:
+    return bcrypt.hashpw(
+        plain_password.encode("utf-8"), salt=bcrypt.gensalt(rounds=rounds)
+    ).decode("utf-8")
+
+
+def hash_scrypt(plain_password: str, log2_n: int, r: int, p: int) -> str:
+    salt = os.urandom(SCRYPT_SALT_BYTES)
+    key = _scrypt(plain_password.encode("utf-8"), salt, log2_n, r, p)
+    return f"{SCRYPT_PREFIX}ln={log2_n},r={r},p={p}${_b64encode(salt)}${_b64encode(key)}"
+
+
+def hash_password(plain_password: str) -> str:
+    if settings.PASSWORD_HASH_ALGORITHM == SCRYPT:
+        return hash_scrypt(
+            plain_password,
+            settings.SCRYPT_LOG2_N,
+            settings.SCRYPT_R,
+            settings.SCRYPT_P,
+        )
+    return hash_bcrypt(plain_password, settings.BCRYPT_ROUNDS)
+
+
+def verify_password(plain_password: str, hashed: str) -> bool:
+    if hashed.startswith(SCRYPT_PREFIX):
+        log2_n, r, p, salt, key = _parse_scrypt(hashed)
+        candidate = _scrypt(plain_password.encode("utf-8"), salt, log2_n, r, p)
+        return hmac.compare_digest(candidate, key)
+
+    return bcrypt.checkpw(plain_password.encode("utf-8"), hashed.encode("utf-8"))
+
+
+def identify(hashed: str) -> str:
+    """Describe the algorithm and cost of a hash, e.g. ``bcrypt:12``."""
+    if hashed.startswith(SCRYPT_PREFIX):
+        log2_n, r, p, _, _ = _parse_scrypt(hashed)
+        return f"{SCRYPT}:ln={log2_n},r={r},p={p}"
+
+    # bcrypt hashes look like $2b$12$<salt and hash>
+    parts = hashed.split("$")
+    if len(parts) == 4 and parts[1].startswith("2"):
+        return f"{BCRYPT}:{int(parts[2])}"
+
+    return "unknown"
+
+
+def current_scheme() -> str:
+    if settings.PASSWORD_HASH_ALGORITHM == SCRYPT:
+        return (
+            f"{SCRYPT}:ln={settings.SCRYPT_LOG2_N},"
+            f"r={settings.SCRYPT_R},p={settings.SCRYPT_P}"
+        )
+    return f"{BCRYPT}:{settings.BCRYPT_ROUNDS}"
+
+
+def needs_rehash(hashed: str) -> bool:
+    """True when ``hashed`` was not produced with the configured algorithm and cost."""
+    return identify(hashed) != current_scheme()
@@ -0,0 +1,143 @@
+"""Per-request CPU profiling with ``cProfile``.
+
+A request is profiled when it carries ``X-Profile: <PROFILING_SECRET>``, or
+when it is picked by global sampling at ``PROFILING_SAMPLE_RATE``. The
+profile is written as a pstats file to ``PROFILING_DIR`` under the request id
+(``X-Request-ID`` if the client sent a usable one), which is returned in the
+``X-Profile-Id`` response header and can be fetched from ``/admin/profiles``.
+
+Overhead is bounded: only one request is profiled at a time (others are
+served unprofiled meanwhile), and only the newest ``PROFILES_KEPT`` files
+are kept. cProfile sees the whole event loop thread, so a profile also
+contains whatever other requests ran while it was recording.
+"""
+
+import asyncio
+import cProfile
+import hmac
+import io
+import logging
+import os
+import pstats
+import random
+import re
+import uuid
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+settings = config.get_settings()
+
+PROFILE_HEADER = "x-profile"
+REQUEST_ID_HEADER = "x-request-id"
+PROFILE_ID_HEADER = b"x-profile-id"
+PROFILE_SUFFIX = ".pstats"
+
+_PROFILE_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def valid_profile_id(profile_id: str) -> bool:
+    return bool(_PROFILE_ID.match(profile_id))
+
+
+class ProfileStore:
+    def __init__(self, directory: str, kept: int = 100):
+        self.directory = directory
+        self.kept = kept
+
+    def path(self, profile_id: str) -> str:
+        if not valid_profile_id(profile_id):
+            raise ValueError(f"Invalid profile id: {profile_id!r}")
+        return os.path.join(self.directory, profile_id + PROFILE_SUFFIX)
+
+    def save(self, profile_id: str, profile: cProfile.Profile) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(profile_id)
+        profile.dump_stats(path)
+        self._prune()
+        return path
+
+    def list(self) -> list[os.DirEntry]:
+        """Stored profiles, newest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        with os.scandir(self.directory) as entries:
+            profiles = [
+                entry
+                for entry in entries
+                if entry.is_file() and entry.name.endswith(PROFILE_SUFFIX)
+            ]
+        return sorted(profiles, key=lambda entry: entry.stat().st_mtime, reverse=True)
+
+    def _prune(self):
+        for entry in self.list()[self.kept :]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def summary(self, profile_id: str, sort: str = "cumulative", limit: int = 30) -> str:
+        output = io.StringIO()
+        stats = pstats.Stats(self.path(profile_id), stream=output)
+        stats.strip_dirs().sort_stats(sort).print_stats(limit)
+        return output.getvalue()
+
+
+class ProfilingMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        # cProfile can only record one profile per thread at a time
+        self._active = False
+
+    def _should_profile(self, headers: Headers) -> bool:
+        secret = settings.PROFILING_SECRET
+        requested = headers.get(PROFILE_HEADER)
+        if secret and requested and hmac.compare_digest(requested, secret):
+            return True
+        rate = settings.PROFILING_SAMPLE_RATE
+        return rate > 0 and random.random() < rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or self._active:
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        if not self._should_profile(headers):
+            await self.app(scope, receive, send)
+            return
+
+        request_id = headers.get(REQUEST_ID_HEADER, "")
+        profile_id = request_id if valid_profile_id(request_id) else uuid.uuid4().hex
+
+        async def send_with_profile_id(message: Message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [
+                    (PROFILE_ID_HEADER, profile_id.encode())
+                ]
+            await send(message)
+
+        profile = cProfile.Profile()
+        self._active = True
+        profile.enable()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profile.disable()
+            self._active = False
+            try:
+                await asyncio.to_thread(get_profile_store().save, profile_id, profile)
+            except OSError:
+                logger.exception("Could not save profile %s", profile_id)
+
+
+_store = ProfileStore(settings.PROFILING_DIR, kept=settings.PROFILES_KEPT)
+
+
+def get_profile_store() -> ProfileStore:
+    return _store
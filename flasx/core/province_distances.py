@@ -0,0 +1,130 @@
+"""Great-circle distances between provinces, precomputed for nearby lookups.
+
+The matrix holds the haversine distance in kilometres between the centroids
+of every pair of provinces that have coordinates (77 x 77 for the full
+catalog). It is built once from the catalog, at startup by the warm-up or
+on first use, and rebuilt after a catalog change, so a lookup is one row of
+the matrix masked and sorted with NumPy, without touching the database.
+"""
+
+import dataclasses
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_matrix(latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """Pairwise great-circle distances in km between points given in degrees."""
+    lat = np.radians(latitudes)[:, np.newaxis]
+    lon = np.radians(longitudes)[:, np.newaxis]
+    a = (
+        np.sin((lat - lat.T) / 2) ** 2
+        + np.cos(lat) * np.cos(lat.T) * np.sin((lon - lon.T) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+@dataclasses.dataclass(frozen=True)
+class DistanceEntry:
+    id: int
+    name: str
+    name_th: str | None
+    tax_reduction_rate: float
+    tier: int | None
+    latitude: float
+    longitude: float
+
+
+class ProvinceDistances:
+    def __init__(self, entries: list[DistanceEntry], catalog_version: int = 0):
+        self.entries = entries
+        # The shared catalog version the entries were read at
+        self.catalog_version = catalog_version
+        self.ids = np.array([entry.id for entry in entries], dtype=np.int64)
+        # -1 stands for "no tier"
+        self.tiers = np.array(
+            [entry.tier if entry.tier is not None else -1 for entry in entries],
+            dtype=np.int64,
+        )
+        self._rows = {entry.id: row for row, entry in enumerate(entries)}
+        self._names = [entry.name.lower() for entry in entries]
+        self.matrix = haversine_matrix(
+            np.array([entry.latitude for entry in entries], dtype=np.float64),
+            np.array([entry.longitude for entry in entries], dtype=np.float64),
+        )
+
+    def __contains__(self, province_id: int) -> bool:
+        return province_id in self._rows
+
+    def entry(self, province_id: int) -> DistanceEntry:
+        return self.entries[self._rows[province_id]]
+
+    def distance(self, from_id: int, to_id: int) -> float:
+        return float(self.matrix[self._rows[from_id], self._rows[to_id]])
+
+    def matching_address(self, address: str) -> list[int]:
+        """Ids of provinces whose name matches ``address``, as for target provinces."""
+        address = address.lower()
+        return [
+            int(self.ids[row])
+            for row, name in enumerate(self._names)
+            if name in address or address in name
+        ]
+
+    def nearby(
+        self,
+        province_id: int,
+        limit: int = 5,
+        tier: int | None = None,
+        exclude_ids=(),
+        max_distance_km: float | None = None,
+    ) -> list[tuple[DistanceEntry, float]]:
+        """Closest provinces to ``province_id``, nearest first."""
+        row = self._rows[province_id]
+        distances = self.matrix[row]
+
+        mask = np.ones(len(self.entries), dtype=bool)
+        mask[row] = False
+        if tier is not None:
+            mask &= self.tiers == tier
+        if len(exclude_ids):
+            mask &= ~np.isin(self.ids, np.fromiter(exclude_ids, dtype=np.int64))
+        if max_distance_km is not None:
+            mask &= distances <= max_distance_km
+
+        candidates = np.flatnonzero(mask)
+        closest = candidates[np.argsort(distances[candidates], kind="stable")][:limit]
+        return [(self.entries[i], float(distances[i])) for i in closest]
+
+
+_distances: ProvinceDistances | None = None
+
+
+def get_distances() -> ProvinceDistances | None:
+    return _distances
+
+
+def set_distances(distances: ProvinceDistances | None):
+    global _distances
+    _distances = distances
+
+
+def build_distances(provinces, catalog_version: int = 0) -> ProvinceDistances:
+    """Build from province rows; provinces without coordinates are left out."""
+    return ProvinceDistances(
+        [
+            DistanceEntry(
+                id=province.id,
+                name=province.name,
+                name_th=province.name_th,
+                tax_reduction_rate=province.tax_reduction_rate,
+                tier=province.tier,
+                latitude=province.latitude,
+                longitude=province.longitude,
+            )
+            for province in provinces
+            if province.latitude is not None and province.longitude is not None
+        ],
+        catalog_version,
+    )
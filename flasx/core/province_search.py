@@ -0,0 +1,219 @@
+"""In-memory province search.
+
+The index is built from the province catalog (English and Thai names) and
+answers queries without touching the database:
+
+* a prefix trie over every name and every word start inside a name, where
+  each node already holds the ids below it, so a prefix lookup is one walk
+  down the query
+* a trigram index for typo-tolerant matching, ranked by trigram overlap and
+  edit distance
+
+Names and queries are normalized the same way: case-folded, with combining
+marks (Latin accents, Thai tone marks and vowel signs) removed, and spaces
+and punctuation dropped.
+"""
+
+import collections
+import dataclasses
+import functools
+import unicodedata
+
+EXACT_SCORE = 3.0
+PREFIX_SCORE = 2.0
+WORD_PREFIX_SCORE = 1.5
+# Fuzzy matches score in (0, 1], below any prefix match
+MIN_FUZZY_SIMILARITY = 0.3
+# Only the provinces sharing the most trigrams get an edit-distance check
+FUZZY_CANDIDATES = 8
+RESULT_CACHE_SIZE = 4096
+
+
+def normalize(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(
+        char
+        for char in decomposed
+        if char.isalnum() and unicodedata.category(char) != "Mn"
+    )
+
+
+def _words(text: str) -> list[str]:
+    return [normalize(word) for word in text.split() if normalize(word)]
+
+
+def trigrams(text: str) -> set[str]:
+    padded = f"  {text} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def prefix_edit_distance(query: str, name: str, limit: int) -> int:
+    """Levenshtein distance from ``query`` to the closest prefix of ``name``.
+
+    Gives up with ``limit + 1`` as soon as every prefix is further than
+    ``limit`` away.
+    """
+    name = name[: len(query) + limit]
+    previous = list(range(len(name) + 1))
+    for i, char_a in enumerate(query, 1):
+        current = [i]
+        for j, char_b in enumerate(name, 1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (char_a != char_b),
+                )
+            )
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return min(previous)
+
+
+@dataclasses.dataclass(frozen=True)
+class SearchEntry:
+    id: int
+    name: str
+    name_th: str | None
+    tax_reduction_rate: float
+    tier: int | None
+
+
+class _TrieNode:
+    __slots__ = ("children", "ids")
+
+    def __init__(self):
+        self.children: dict[str, _TrieNode] = {}
+        self.ids: set[int] = set()
+
+
+class ProvinceSearchIndex:
+    def __init__(self, entries: list[SearchEntry], catalog_version: int = 0):
+        self.entries = {entry.id: entry for entry in entries}
+        # The shared catalog version the entries were read at
+        self.catalog_version = catalog_version
+        self._keys: dict[int, tuple[str, ...]] = {}
+        # Full names plus the words after the first, for typo matching
+        self._word_keys: dict[int, tuple[str, ...]] = {}
+        self._full_trie = _TrieNode()
+        self._word_trie = _TrieNode()
+        self._trigrams: dict[str, set[int]] = {}
+        self._key_trigrams: dict[str, set[str]] = {}
+        # Per index, so a rebuilt index starts with an empty cache
+        self._cached_search = functools.lru_cache(maxsize=RESULT_CACHE_SIZE)(
+            self._search
+        )
+
+        for entry in entries:
+            names = [entry.name] + ([entry.name_th] if entry.name_th else [])
+            keys = tuple(key for key in (normalize(name) for name in names) if key)
+            self._keys[entry.id] = keys
+            words = tuple(word for name in names for word in _words(name)[1:])
+            self._word_keys[entry.id] = keys + words
+
+            for key in keys:
+                self._insert(self._full_trie, key, entry.id)
+            for word in words:
+                self._insert(self._word_trie, word, entry.id)
+            for key in keys:
+                grams = self._key_trigrams.setdefault(key, trigrams(key))
+                for gram in grams:
+                    self._trigrams.setdefault(gram, set()).add(entry.id)
+
+    @staticmethod
+    def _insert(root: _TrieNode, key: str, entry_id: int):
+        node = root
+        node.ids.add(entry_id)
+        for char in key:
+            node = node.children.setdefault(char, _TrieNode())
+            node.ids.add(entry_id)
+
+    @staticmethod
+    def _prefix(root: _TrieNode, key: str) -> set[int]:
+        node = root
+        for char in key:
+            node = node.children.get(char)
+            if node is None:
+                return set()
+        return node.ids
+
+    def _fuzzy(self, key: str) -> dict[int, float]:
+        query_grams = trigrams(key)
+        shared = collections.Counter()
+        for gram in query_grams:
+            shared.update(self._trigrams.get(gram, ()))
+        candidates = [entry_id for entry_id, _ in shared.most_common(FUZZY_CANDIDATES)]
+
+        # Allow roughly one typo per three characters
+        limit = max(1, len(key) // 3)
+        scores = {}
+        for entry_id in candidates:
+            best = 0.0
+            for name_key in self._keys[entry_id]:
+                grams = self._key_trigrams[name_key]
+                best = max(best, len(query_grams & grams) / len(query_grams | grams))
+
+            for name_key in self._word_keys[entry_id]:
+                # Partial input matches the start of a name
+                distance = prefix_edit_distance(key, name_key, limit)
+                if distance <= limit:
+                    best = max(best, 1 - distance / (len(key) + 1))
+            if best >= MIN_FUZZY_SIMILARITY:
+                scores[entry_id] = best
+        return scores
+
+    def cache_info(self):
+        return self._cached_search.cache_info()
+
+    def search(self, query: str, limit: int = 10) -> list[tuple[SearchEntry, float]]:
+        return self._cached_search(normalize(query), limit)
+
+    def _search(self, key: str, limit: int) -> list[tuple[SearchEntry, float]]:
+        if not key:
+            return []
+
+        scores: dict[int, float] = {}
+        for entry_id in self._prefix(self._word_trie, key):
+            scores[entry_id] = WORD_PREFIX_SCORE
+        for entry_id in self._prefix(self._full_trie, key):
+            exact = key in self._keys[entry_id]
+            scores[entry_id] = EXACT_SCORE if exact else PREFIX_SCORE
+
+        # Typo matching only when the input is not a prefix of any name
+        if not scores:
+            scores = self._fuzzy(key)
+
+        ranked = sorted(
+            scores.items(), key=lambda item: (-item[1], self.entries[item[0]].name)
+        )
+        return [(self.entries[entry_id], score) for entry_id, score in ranked[:limit]]
+
+
+_index: ProvinceSearchIndex | None = None
+
+
+def get_index() -> ProvinceSearchIndex | None:
+    return _index
+
+
+def set_index(index: ProvinceSearchIndex | None):
+    global _index
+    _index = index
+
+
+def build_index(provinces, catalog_version: int = 0) -> ProvinceSearchIndex:
+    """Build an index from province rows or any objects with the same attributes."""
+    return ProvinceSearchIndex(
+        [
+            SearchEntry(
+                id=province.id,
+                name=province.name,
+                name_th=province.name_th,
+                tax_reduction_rate=province.tax_reduction_rate,
+                tier=province.tier,
+            )
+            for province in provinces
+        ],
+        catalog_version,
+    )
@@ -0,0 +1,74 @@
+"""Province tiers and target-province quota rules.
+
+The rules come from ``flasx/data/quota_rules.json`` (or ``QUOTA_RULES_PATH``)
+and are loaded once into frozen objects. Each province stores the integer id
+of its tier, so tier filters and quota counts never compare float rates. A
+new tier only needs a new entry in the rules file.
+"""
+
+import dataclasses
+import functools
+import json
+import math
+import os
+import types
+import typing
+
+from . import config
+
+settings = config.get_settings()
+
+DEFAULT_RULES_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "data", "quota_rules.json"
+)
+
+
+@dataclasses.dataclass(frozen=True)
+class Tier:
+    id: int
+    name: str
+    tax_reduction_rate: float
+    max_provinces: int
+
+
+@dataclasses.dataclass(frozen=True)
+class QuotaRules:
+    tiers: tuple[Tier, ...]
+    max_total_provinces: int
+    by_id: typing.Mapping[int, Tier]
+    by_name: typing.Mapping[str, Tier]
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "QuotaRules":
+        tiers = tuple(Tier(**tier) for tier in data["tiers"])
+        return cls(
+            tiers=tiers,
+            max_total_provinces=data["max_total_provinces"],
+            by_id=types.MappingProxyType({tier.id: tier for tier in tiers}),
+            by_name=types.MappingProxyType({tier.name: tier for tier in tiers}),
+        )
+
+    def tier_for_rate(self, tax_reduction_rate: float) -> Tier | None:
+        for tier in self.tiers:
+            if math.isclose(tier.tax_reduction_rate, tax_reduction_rate):
+                return tier
+        return None
+
+    def tier_name(self, tier_id: int | None) -> str:
+        tier = self.by_id.get(tier_id)
+        return tier.name if tier else "unknown"
+
+    def usage(self, tier_ids: typing.Iterable[int | None]) -> dict[int, int]:
+        """Number of provinces per tier id, with every tier present."""
+        counts = dict.fromkeys(self.by_id, 0)
+        for tier_id in tier_ids:
+            if tier_id in counts:
+                counts[tier_id] += 1
+        return counts
+
+
+@functools.lru_cache
+def get_rules() -> QuotaRules:
+    path = settings.QUOTA_RULES_PATH or DEFAULT_RULES_PATH
+    with open(path, "r", encoding="utf-8") as f:
+        return QuotaRules.from_dict(json.load(f))
@@ -0,0 +1,158 @@
+"""In-process cache of rendered per-user responses.
+
+Responses are stored as the bytes sent to the client, keyed by
+``(kind, media type, user id, user version, catalog version)``. The user version is a
+counter in the shared cache that every write to the user's target
+provinces or profile bumps, so a write on any worker makes every worker's
+entries for that user unreachable; the catalog version, also in the shared
+cache, does the same for catalog changes. Serving a cached response is then
+one read of both versions from the shared cache and a dictionary lookup,
+with no database query.
+
+Unreachable entries are never looked up again and age out: the cache is
+an LRU bounded by ``RESPONSE_CACHE_MAX_ENTRIES`` entries and
+``RESPONSE_CACHE_MAX_BYTES`` bytes of responses.
+
+The versions are only shared between workers through Redis: without
+``REDIS_URL`` each worker counts its own, so with more than one worker
+(``WORKERS``) the cache is disabled rather than serve responses another
+worker has made stale.
+"""
+
+import collections
+import dataclasses
+import functools
+from typing import Any, Hashable
+
+import pydantic
+from fastapi.encoders import jsonable_encoder
+
+from . import cache
+from . import config
+from . import encoding
+
+settings = config.get_settings()
+
+VERSION_KEY_PREFIX = "user-version:"
+CATALOG_VERSION_KEY = "catalog-version"
+
+
+async def versions(user_id: int) -> tuple[int, int]:
+    """The version of ``user_id`` and the catalog version."""
+    values = await cache.get_cache().get_many(
+        [f"{VERSION_KEY_PREFIX}{user_id}", CATALOG_VERSION_KEY]
+    )
+    user, catalog = (int(value) if value is not None else 0 for value in values)
+    return user, catalog
+
+
+async def catalog_version() -> int:
+    """The catalog version alone, for structures built from the catalog."""
+    value = await cache.get_cache().get(CATALOG_VERSION_KEY)
+    return int(value) if value is not None else 0
+
+
+async def bump_user_version(user_id: int) -> int:
+    """Make every cached response of ``user_id`` stale, on every worker."""
+    return await cache.get_cache().incr(f"{VERSION_KEY_PREFIX}{user_id}")
+
+
+async def bump_catalog_version() -> int:
+    """Make every cached response stale, on every worker."""
+    return await cache.get_cache().incr(CATALOG_VERSION_KEY)
+
+
+@functools.cache
+def _adapter(response_type) -> pydantic.TypeAdapter:
+    return pydantic.TypeAdapter(response_type)
+
+
+def render(content: Any, response_type=None, media_type: str = encoding.JSON) -> bytes:
+    """The body FastAPI would send for ``content``, in ``media_type``.
+
+    With ``response_type``, ``content`` is first validated as the route's
+    response model would be, e.g. dropping fields the model does not have.
+    """
+    if response_type is not None:
+        adapter = _adapter(response_type)
+        content = adapter.dump_python(
+            adapter.validate_python(content, from_attributes=True), mode="json"
+        )
+    return encoding.encode(jsonable_encoder(content), media_type)
+
+
+@dataclasses.dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self.stats = CacheStats()
+        self._entries: collections.OrderedDict[Hashable, bytes] = (
+            collections.OrderedDict()
+        )
+
+    def get(self, key: Hashable) -> bytes | None:
+        body = self._entries.get(key)
+        if body is None:
+            self.stats.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        return body
+
+    def put(self, key: Hashable, body: bytes):
+        # Also keeps a disabled cache (a bound of 0) empty
+        if len(body) > self.max_bytes or self.max_entries <= 0:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.size_bytes -= len(old)
+        self._entries[key] = body
+        self.size_bytes += len(body)
+
+        while len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size_bytes -= len(evicted)
+            self.stats.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self.size_bytes = 0
+
+    def reset_stats(self):
+        self.stats = CacheStats()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def enabled() -> bool:
+    """Whether a write on one worker reaches every worker's versions."""
+    return settings.REDIS_URL is not None or settings.WORKERS <= 1
+
+
+def new_cache() -> ResponseCache:
+    # A bound of 0 stores nothing, so every lookup misses
+    return ResponseCache(
+        max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES if enabled() else 0,
+        max_bytes=settings.RESPONSE_CACHE_MAX_BYTES,
+    )
+
+
+_cache = new_cache()
+
+
+def get_cache() -> ResponseCache:
+    return _cache
@@ -0,0 +1,156 @@
+"""Revoked access tokens.
+
+Revoked token ids (``jti``) are kept in an in-memory set that forgets each id
+once the token it belongs to has expired, so lookups never touch the database.
+A Bloom filter can be put in front of the set to answer the common "not
+revoked" case from a few bits per entry.
+
+When a shared cache is configured, revocations are also appended to a log in
+the cache. Every worker replays new log entries into its own set at most once
+per ``REVOCATION_SYNC_SECONDS``, so a logout on one worker reaches the others.
+"""
+
+import hashlib
+import heapq
+import math
+import time
+
+from . import cache
+from . import config
+
+settings = config.get_settings()
+
+SEQUENCE_KEY = "revocation-seq"
+LOG_KEY_PREFIX = "revocation-log:"
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        # Standard sizing: m = -n ln p / (ln 2)^2, k = m / n ln 2
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+
+class RevocationStore:
+    def __init__(self, use_bloom_filter: bool = False, bloom_capacity: int = 100_000):
+        self.use_bloom_filter = use_bloom_filter
+        self.bloom_capacity = bloom_capacity
+        self._revoked: dict[str, float] = {}
+        self._expiry_heap: list[tuple[float, str]] = []
+        self._bloom = self._new_bloom()
+        self._stale_bloom_entries = 0
+        self._last_sequence = 0
+        self._last_sync = 0.0
+
+    def _new_bloom(self) -> BloomFilter | None:
+        if not self.use_bloom_filter:
+            return None
+        return BloomFilter(max(self.bloom_capacity, len(self._revoked) * 2))
+
+    def _add_local(self, token_id: str, expires_at: float):
+        if expires_at <= time.time() or token_id in self._revoked:
+            return
+        self._revoked[token_id] = expires_at
+        heapq.heappush(self._expiry_heap, (expires_at, token_id))
+        if self._bloom is not None:
+            self._bloom.add(token_id)
+
+    def _prune(self):
+        now = time.time()
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            _, token_id = heapq.heappop(self._expiry_heap)
+            self._revoked.pop(token_id, None)
+            self._stale_bloom_entries += 1
+
+        # A Bloom filter cannot forget entries. Stale bits only cause false
+        # positives that the set rejects, so rebuild once they dominate.
+        if self._bloom is not None and self._stale_bloom_entries > len(self._revoked):
+            self._bloom = self._new_bloom()
+            for token_id in self._revoked:
+                self._bloom.add(token_id)
+            self._stale_bloom_entries = 0
+
+    def is_revoked(self, token_id: str | None) -> bool:
+        if not token_id:
+            return False
+        if self._bloom is not None and token_id not in self._bloom:
+            return False
+        expires_at = self._revoked.get(token_id)
+        return expires_at is not None and expires_at > time.time()
+
+    async def revoke(self, token_id: str, expires_at: float):
+        """Revoke ``token_id`` until ``expires_at`` (a UNIX timestamp)."""
+        self._prune()
+        self._add_local(token_id, expires_at)
+
+        backend = cache.get_cache()
+        if isinstance(backend, cache.LocalCache):
+            return
+
+        ttl = expires_at - time.time()
+        if ttl > 0:
+            sequence = await backend.incr(SEQUENCE_KEY)
+            await backend.set(
+                f"{LOG_KEY_PREFIX}{sequence}", f"{token_id} {expires_at}", ttl
+            )
+
+    async def sync(self, force: bool = False):
+        """Pull revocations made by other workers from the shared cache."""
+        backend = cache.get_cache()
+        if isinstance(backend, cache.LocalCache):
+            return
+
+        now = time.monotonic()
+        if not force and now - self._last_sync < settings.REVOCATION_SYNC_SECONDS:
+            return
+        self._last_sync = now
+
+        latest = int(await backend.get(SEQUENCE_KEY) or 0)
+        if latest <= self._last_sequence:
+            return
+
+        keys = [
+            f"{LOG_KEY_PREFIX}{sequence}"
+            for sequence in range(self._last_sequence + 1, latest + 1)
+        ]
+        self._prune()
+        for entry in await backend.get_many(keys):
+            # Entries of already expired tokens have dropped out of the cache
+            if entry:
+                token_id, expires_at = entry.split(" ", 1)
+                self._add_local(token_id, float(expires_at))
+        self._last_sequence = latest
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
+
+_store: RevocationStore | None = None
+
+
+def get_store() -> RevocationStore:
+    global _store
+    if _store is None:
+        _store = RevocationStore(
+            use_bloom_filter=settings.REVOCATION_BLOOM_FILTER,
+            bloom_capacity=settings.REVOCATION_BLOOM_CAPACITY,
+        )
+    return _store
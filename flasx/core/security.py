@@ -1,4 +1,5 @@
 import datetime
+import uuid
 from typing import Any, Union
 
 import jwt
@@ -8,9 +9,16 @@ from . import config
 
 ALGORITHM = "HS256"
 
+ACCESS_TOKEN_TYPE = "access"
+REFRESH_TOKEN_TYPE = "refresh"
+
 settings = config.get_settings()
 
 
+def new_token_id() -> str:
+    return uuid.uuid4().hex
+
+
 def create_access_token(data: dict, expires_delta: datetime.timedelta | None = None):
     to_encode = data.copy()
     if expires_delta:
@@ -19,7 +27,14 @@ def create_access_token(data: dict, expires_delta: datetime.timedelta | None = N
         expire = datetime.datetime.now(tz=datetime.timezone.utc) + datetime.timedelta(
             minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
         )
-    to_encode.update({"exp": expire, "sub": str(data.get("sub", 0))})
+    to_encode.update(
+        {
+            "exp": expire,
+            "sub": str(data.get("sub", 0)),
+            "type": ACCESS_TOKEN_TYPE,
+            "jti": data.get("jti") or new_token_id(),
+        }
+    )
 
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
@@ -35,6 +50,31 @@ def create_refresh_token(
         expire = datetime.datetime.now(tz=datetime.timezone.utc) + datetime.timedelta(
             minutes=settings.REFRESH_TOKEN_EXPIRE_MINUTES
         )
-    to_encode.update({"exp": expire})
+    to_encode.update(
+        {
+            "exp": expire,
+            "sub": str(data.get("sub", 0)),
+            "type": REFRESH_TOKEN_TYPE,
+            "jti": data.get("jti") or new_token_id(),
+        }
+    )
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
+
+
+def decode_access_token(token: str) -> dict:
+    """Decode an access token, raising ``jwt.InvalidTokenError`` if it is not one."""
+    payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM])
+    if payload.get("type") == REFRESH_TOKEN_TYPE:
+        raise jwt.InvalidTokenError("Not an access token")
+    return payload
+
+
+def decode_refresh_token(token: str) -> dict:
+    """Decode a refresh token, raising ``jwt.InvalidTokenError`` if it is not one."""
+    payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM])
+    if payload.get("type") != REFRESH_TOKEN_TYPE:
+        raise jwt.InvalidTokenError("Not a refresh token")
+    if not payload.get("jti") or not payload.get("fid"):
+        raise jwt.InvalidTokenError("Refresh token is missing its id or family")
+    return payload
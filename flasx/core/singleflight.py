@@ -0,0 +1,102 @@
+"""Single-flight coalescing of identical in-flight loads.
+
+Concurrent callers asking for the same key share one in-flight load and its
+result instead of each running the same query. Nothing is kept once the load
+finishes, so this never serves stale data: a call that starts after a load
+completed runs its own.
+
+Keys are tuples whose first item names the kind of load, e.g.
+``("user-provinces", 42)`` or ``("catalog", 3)``; metrics are kept per kind.
+"""
+
+import asyncio
+import collections
+import dataclasses
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+@dataclasses.dataclass
+class FlightStats:
+    calls: int = 0
+    loads: int = 0
+    coalesced: int = 0
+    errors: int = 0
+
+
+class Group:
+    def __init__(self):
+        self._flights: dict[tuple[Hashable, ...], asyncio.Future] = {}
+        self._stats: dict[str, FlightStats] = collections.defaultdict(FlightStats)
+
+    async def do(
+        self, key: tuple[Hashable, ...], load: Callable[[], Awaitable[T]]
+    ) -> T:
+        """Return the result of ``load()``, sharing it with concurrent callers of ``key``.
+
+        An exception raised by the load is raised in every caller waiting on it.
+        """
+        stats = self._stats[str(key[0])]
+        stats.calls += 1
+
+        flight = self._flights.get(key)
+        while flight is not None:
+            stats.coalesced += 1
+            try:
+                # Shielded so a cancelled waiter does not cancel the shared load
+                return await asyncio.shield(flight)
+            except asyncio.CancelledError:
+                if not flight.cancelled():
+                    raise
+            # The caller running the load was cancelled; take over from it
+            stats.coalesced -= 1
+            flight = self._flights.get(key)
+
+        flight = asyncio.get_running_loop().create_future()
+        self._flights[key] = flight
+        stats.loads += 1
+        try:
+            result = await load()
+        except BaseException as exc:
+            stats.errors += 1
+            if isinstance(exc, asyncio.CancelledError):
+                flight.cancel()
+            else:
+                flight.set_exception(exc)
+                # Waiters re-raise it; do not also report it as never retrieved
+                flight.exception()
+            raise
+        else:
+            flight.set_result(result)
+            return result
+        finally:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def forget(self, key: tuple[Hashable, ...]):
+        """Make later calls for ``key`` start a new load.
+
+        Called after a write, so readers arriving after it do not join a load
+        that may have started before the write was committed.
+        """
+        self._flights.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def in_flight(self, kind: str) -> int:
+        return sum(1 for key in self._flights if str(key[0]) == kind)
+
+    def stats(self) -> dict[str, FlightStats]:
+        return dict(self._stats)
+
+    def reset_stats(self):
+        self._stats.clear()
+
+
+_group = Group()
+
+
+def get_group() -> Group:
+    return _group
@@ -0,0 +1,51 @@
+"""Refresh-token families with rotation and reuse detection.
+
+Every login starts a new family. The cache holds the id (``jti``) of the only
+refresh token in that family that may still be used. Refreshing swaps in the
+id of the newly issued token; presenting any other token from the family
+means an old token was replayed, so the whole family is revoked.
+"""
+
+from . import cache
+from . import config
+
+settings = config.get_settings()
+
+FAMILY_KEY_PREFIX = "refresh-family:"
+REVOKED = "revoked"
+
+
+def _family_key(family_id: str) -> str:
+    return f"{FAMILY_KEY_PREFIX}{family_id}"
+
+
+def _family_ttl() -> float:
+    return settings.REFRESH_TOKEN_EXPIRE_MINUTES * 60
+
+
+async def start_family(family_id: str, token_id: str):
+    await cache.get_cache().set(_family_key(family_id), token_id, _family_ttl())
+
+
+async def rotate(family_id: str, presented_token_id: str, new_token_id: str) -> bool:
+    """Make ``new_token_id`` current if ``presented_token_id`` still is.
+
+    Returns ``False`` when the presented token was already rotated or the
+    family is unknown; a replayed token also revokes the family.
+    """
+    key = _family_key(family_id)
+    current = await cache.get_cache().swap(key, new_token_id, _family_ttl())
+
+    if current == presented_token_id:
+        return True
+
+    if current is None:
+        # Unknown or expired family: do not let the swap resurrect it
+        await cache.get_cache().delete(key)
+    else:
+        await revoke_family(family_id)
+    return False
+
+
+async def revoke_family(family_id: str):
+    await cache.get_cache().set(_family_key(family_id), REVOKED, _family_ttl())
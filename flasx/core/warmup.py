@@ -0,0 +1,198 @@
+"""Warm-up run when a worker starts, before it reports ready.
+
+Much of the cost of a worker's first requests is one-off: pool connections
+open lazily, the province catalog and search index are built on first use,
+each statement is compiled once per engine, the OpenAPI document is built
+on the first request for it, and the first password hash pays bcrypt's
+setup. ``warm_up`` pays all of that up front:
+
+* opens ``WARMUP_POOL_CONNECTIONS`` connections on every pooled engine
+* runs each hot query once on every engine, filling the compiled cache
+* builds the province catalog, search index and distance matrix
+* builds the OpenAPI schema
+* sends a request to each of ``WARMUP_PATHS`` through the application, so
+  routing, dependencies and response models have all been used once
+* hashes a password
+
+It runs as a background task started in the application lifespan, so
+``/health`` answers at once while ``/ready`` returns 503 until it finishes.
+A failed step is logged and warm-up carries on with the next one.
+"""
+
+import asyncio
+import contextlib
+import dataclasses
+import logging
+import time
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import QueuePool
+
+from flasx import models
+from flasx.models import statements
+from . import config
+from . import passwords
+
+logger = logging.getLogger(__name__)
+
+settings = config.get_settings()
+
+# Each hot statement with parameters that match nothing
+HOT_QUERIES = [
+    (statements.USER_BY_CITIZEN_ID, {"citizen_id": ""}),
+    (statements.USER_BY_PHONE_NUMBER, {"phone_number": ""}),
+    (statements.USER_BY_EMAIL, {"email": ""}),
+    (statements.USER_NAMES_BY_IDS, {"user_ids": [0]}),
+    (statements.ALL_PROVINCES, {}),
+    (statements.PROVINCE_BY_NAME, {"name": ""}),
+    (statements.PROVINCE_RATES, {}),
+    (statements.USER_PROVINCES, {"user_id": 0}),
+    (statements.PROVINCES_OF_USERS, {"user_ids": [0]}),
+    (statements.USER_PROVINCE_LINK, {"user_id": 0, "province_id": 0}),
+    (statements.TARGET_PROVINCES_OF_USERS, {"user_ids": [0]}),
+]
+
+
+@dataclasses.dataclass
+class WarmupState:
+    ready: bool = False
+    started_at: float | None = None
+    finished_at: float | None = None
+    # Seconds each step took, in the order they ran
+    steps: dict[str, float] = dataclasses.field(default_factory=dict)
+    failed_steps: list[str] = dataclasses.field(default_factory=list)
+
+    @property
+    def duration(self) -> float | None:
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+
+_state = WarmupState()
+
+
+def get_state() -> WarmupState:
+    return _state
+
+
+def reset():
+    global _state
+    _state = WarmupState()
+
+
+def mark_ready():
+    """Report ready without warming up, e.g. when ``WARMUP_ENABLED`` is off."""
+    _state.ready = True
+
+
+def engines() -> list[AsyncEngine]:
+    """Every distinct engine of every shard."""
+    found = []
+    for shard in models.shards:
+        for engine in (shard.engine, shard.read_engine):
+            if engine not in found:
+                found.append(engine)
+    return found
+
+
+def pool_connections(engine: AsyncEngine, wanted: int) -> int:
+    pool = engine.sync_engine.pool
+    # Only a QueuePool keeps connections around once they are returned
+    if not isinstance(pool, QueuePool):
+        return min(wanted, 1)
+    return min(wanted, pool.size())
+
+
+async def open_connections(engine: AsyncEngine, count: int):
+    # Held at the same time, so each is a separate pooled connection
+    async with contextlib.AsyncExitStack() as stack:
+        for _ in range(count):
+            connection = await stack.enter_async_context(engine.connect())
+            await connection.execute(text("SELECT 1"))
+
+
+async def warm_pools():
+    await asyncio.gather(
+        *(
+            open_connections(
+                engine, pool_connections(engine, settings.WARMUP_POOL_CONNECTIONS)
+            )
+            for engine in engines()
+        )
+    )
+
+
+async def run_hot_queries():
+    for shard in models.shards:
+        factories = [shard.session]
+        if shard.read_engine is not shard.engine:
+            factories.append(shard.read_session)
+        for factory in factories:
+            async with factory() as session:
+                for statement, params in HOT_QUERIES:
+                    result = await session.exec(statement, params=params)
+                    result.all()
+
+
+async def prime_catalog():
+    # Imported here: the routers import this package's siblings
+    from flasx.routers.v1 import province_router
+
+    async with models.shards[0].read_session() as session:
+        await province_router.get_search_index(session)
+        await province_router.get_distances(session)
+
+
+def build_openapi(app: FastAPI):
+    app.openapi()
+
+
+async def request_paths(app: FastAPI):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://warmup"
+    ) as client:
+        for path in settings.WARMUP_PATHS:
+            response = await client.get(path)
+            if response.status_code >= 400:
+                logger.warning(
+                    "Warm-up request to %s returned %s", path, response.status_code
+                )
+
+
+async def hash_password():
+    await asyncio.to_thread(passwords.hash_password, "warm-up")
+
+
+async def warm_up(app: FastAPI) -> WarmupState:
+    """Run every warm-up step, then report ready."""
+    state = get_state()
+    state.started_at = time.perf_counter()
+
+    steps = [
+        ("pools", warm_pools),
+        ("hot_queries", run_hot_queries),
+        ("catalog", prime_catalog),
+        ("openapi", lambda: build_openapi(app)),
+        ("requests", lambda: request_paths(app)),
+        ("password_hash", hash_password),
+    ]
+    for name, step in steps:
+        started = time.perf_counter()
+        try:
+            result = step()
+            if asyncio.iscoroutine(result):
+                await result
+        except Exception:
+            logger.exception("Warm-up step %s failed", name)
+            state.failed_steps.append(name)
+        state.steps[name] = time.perf_counter() - started
+
+    state.finished_at = time.perf_counter()
+    state.ready = True
+    logger.info("Warm-up finished in %.3fs", state.duration)
+    return state
@@ -1,25 +1,84 @@
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
+import asyncio
+
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 # from flasx.models import engine
 # from sqlmodel import SQLModel
 
 from . import models
 from . import routers
+from .core import admission
+from .core import broadcast
+from .core import budget
+from .core import cache
+from .core import config
+from .core import idempotency
+from .core import last_login
+from .core import loop_debug
+from .core import memory
+from .core import profiling
+from .core import warmup
+
+settings = config.get_settings()
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan manager."""
     # Startup
+    if settings.LOOP_DEBUG:
+        loop_debug.get_monitor().start()
+    memory.install_signal_handler()
+    if settings.MEMORY_PROFILING:
+        memory.get_profiler().start()
     await models.init_db()
     # async with engine.begin() as conn:
     #     await conn.run_sync(SQLModel.metadata.create_all)
+    tasks = [
+        asyncio.create_task(last_login.buffer.run(settings.LAST_LOGIN_FLUSH_SECONDS)),
+        asyncio.create_task(
+            broadcast.get_broadcaster().run(settings.FEED_TICK_SECONDS)
+        ),
+        asyncio.create_task(
+            budget.get_pools().run(settings.BUDGET_RECONCILE_SECONDS)
+        ),
+    ]
+    if settings.ADMISSION_CONTROL:
+        tasks.append(
+            asyncio.create_task(
+                admission.get_controller().monitor(
+                    settings.ADMISSION_LAG_INTERVAL_SECONDS
+                )
+            )
+        )
+    # Serves requests meanwhile; /ready reports 503 until it finishes
+    if settings.WARMUP_ENABLED:
+        tasks.append(asyncio.create_task(warmup.warm_up(app)))
+    else:
+        warmup.mark_ready()
     yield
     # Shutdown
+    for task in tasks:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    await last_login.buffer.flush_with_new_session()
+    await budget.get_pools().reconcile(hand_back_all=True)
     await models.close_db()
+    await cache.close_cache()
+    loop_debug.get_monitor().stop()
 
 
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(idempotency.IdempotencyMiddleware)
+app.add_middleware(memory.MemoryMiddleware)
+app.add_middleware(profiling.ProfilingMiddleware)
+if settings.LOOP_DEBUG:
+    app.add_middleware(loop_debug.LoopDebugMiddleware)
+# Outermost, so shed requests cost as little as possible
+if settings.ADMISSION_CONTROL:
+    app.add_middleware(admission.AdmissionMiddleware)
 app.include_router(routers.router)
 
 
@@ -32,3 +91,16 @@ def read_root() -> dict:
 def health_check() -> dict:
     """Health check endpoint for production monitoring."""
     return {"status": "healthy", "service": "flasx"}
+
+
+@app.get("/ready")
+def readiness_check():
+    """Readiness check: 503 until the worker has finished warming up."""
+    state = warmup.get_state()
+    if not state.ready:
+        return JSONResponse({"status": "warming-up"}, status_code=503)
+    return {
+        "status": "ready",
+        "warmup_seconds": state.duration,
+        "failed_steps": state.failed_steps,
+    }
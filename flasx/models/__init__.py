@@ -2,12 +2,17 @@
 # Import order matters to avoid circular imports
 
 import asyncio
+import contextlib
+import dataclasses
 import json
+import logging
 import os
-from typing import AsyncIterator
+from typing import AsyncIterator, Awaitable, Callable, TypeVar
 
+from fastapi import Request
 from sqlmodel import SQLModel
 from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine
 from sqlalchemy.orm import sessionmaker
 
@@ -15,10 +20,49 @@ from sqlalchemy.orm import sessionmaker
 from .user_model import *
 from .province_model import *
 from .user_province_model import *
+from .copay_model import *
+from .metrics_model import *
+from . import consistency
+from . import migrations
+from . import sharding
+from . import sqlite
+from . import statements
+from flasx.core import config
+
+logger = logging.getLogger(__name__)
+
+settings = config.get_settings()
+
+DATABASE_URL = "sqlite+aiosqlite:///database.db"
 
 connect_args = {"check_same_thread": False}
 
 engine: AsyncEngine = None
+# Engine for read-only work; the same object as `engine` unless a
+# dedicated read pool or a replica is configured
+read_engine: AsyncEngine = None
+# Reads may lag behind writes, so recent writers are sent to the primary
+read_your_writes: bool = False
+
+async_session: sessionmaker = None
+async_read_session: sessionmaker = None
+
+T = TypeVar("T")
+
+# Tries at a free user id when concurrent registrations on a shard collide
+USER_ID_ATTEMPTS = 5
+
+
+@dataclasses.dataclass(frozen=True)
+class Shard:
+    engine: AsyncEngine
+    read_engine: AsyncEngine
+    session: sessionmaker
+    read_session: sessionmaker
+
+
+# Every database holding user data; just the primary unless sharded
+shards: list[Shard] = []
 
 
 async def init_province_data():
@@ -29,77 +73,400 @@ async def init_province_data():
         print(f"Province data file not found: {json_path}")
         return
 
-    async for session in get_session():
-        # Check if provinces already exist
-        from sqlmodel import select
+    # Every shard holds its own copy of the catalog
+    for shard in shards:
+        async with shard.session() as session:
+            await seed_provinces(session, json_path)
 
-        result = await session.exec(select(DBProvince))
-        existing_provinces = result.all()
 
-        if existing_provinces:
-            print("Provinces already exist, skipping initialization")
-            return
+def load_json(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
 
-        # Load and insert province data
-        with open(json_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
 
-        # Insert primary provinces
-        for province_data in data["primary_provinces"]:
-            province = DBProvince(
-                name=province_data["name"],
-                tax_reduction_rate=province_data["tax_reduction_rate"],
-            )
-            session.add(province)
+async def seed_provinces(session: AsyncSession, json_path: str):
+    # Check if provinces already exist
+    from sqlmodel import select
 
-        # Insert secondary provinces
-        for province_data in data["secondary_provinces"]:
-            province = DBProvince(
-                name=province_data["name"],
-                tax_reduction_rate=province_data["tax_reduction_rate"],
+    result = await session.exec(select(DBProvince))
+    existing_provinces = result.all()
+
+    if existing_provinces:
+        print("Provinces already exist, skipping initialization")
+        return
+
+    # Load and insert province data, reading the file off the event loop
+    data = await asyncio.to_thread(load_json, json_path)
+
+    # Insert primary provinces
+    for province_data in data["primary_provinces"]:
+        province = DBProvince(
+            name=province_data["name"],
+            name_th=province_data.get("name_th"),
+            tax_reduction_rate=province_data["tax_reduction_rate"],
+            latitude=province_data.get("latitude"),
+            longitude=province_data.get("longitude"),
+        )
+        session.add(province)
+
+    # Insert secondary provinces
+    for province_data in data["secondary_provinces"]:
+        province = DBProvince(
+            name=province_data["name"],
+            name_th=province_data.get("name_th"),
+            tax_reduction_rate=province_data["tax_reduction_rate"],
+            latitude=province_data.get("latitude"),
+            longitude=province_data.get("longitude"),
+        )
+        session.add(province)
+
+    await session.commit()
+    print("Province data initialized successfully")
+
+
+def connect_args_for(url: str) -> dict:
+    return connect_args if url.startswith("sqlite") else {}
+
+
+def build_engines(
+    database_url: str, replica_url: str | None = None
+) -> tuple[AsyncEngine, AsyncEngine]:
+    """Create the write engine of a database and the engine its reads use."""
+    use_sqlite_profile = settings.SQLITE_HIGH_CONCURRENCY and sqlite.is_file_database(
+        database_url
+    )
+    if use_sqlite_profile:
+        # One writer connection plus a pool of read-only connections
+        write_engine = create_async_engine(
+            database_url,
+            echo=True,
+            future=True,
+            query_cache_size=settings.SQL_COMPILED_CACHE_SIZE,
+            connect_args=connect_args,
+            pool_size=1,
+            max_overflow=0,
+        )
+        sqlite.apply_profile(write_engine)
+    else:
+        write_engine = create_async_engine(
+            database_url,
+            echo=True,
+            future=True,
+            query_cache_size=settings.SQL_COMPILED_CACHE_SIZE,
+            connect_args=connect_args_for(database_url),
+        )
+
+    if replica_url:
+        reader = create_async_engine(
+            replica_url,
+            echo=True,
+            future=True,
+            query_cache_size=settings.SQL_COMPILED_CACHE_SIZE,
+            connect_args=connect_args_for(replica_url),
+        )
+        if settings.SQLITE_HIGH_CONCURRENCY and sqlite.is_file_database(replica_url):
+            sqlite.apply_profile(reader, read_only=True)
+    elif use_sqlite_profile:
+        reader = create_async_engine(
+            sqlite.read_only_url(database_url),
+            echo=True,
+            future=True,
+            query_cache_size=settings.SQL_COMPILED_CACHE_SIZE,
+            connect_args=connect_args,
+            pool_size=settings.SQLITE_READ_POOL_SIZE,
+            max_overflow=0,
+        )
+        sqlite.apply_profile(reader, read_only=True)
+    else:
+        reader = write_engine
+
+    return write_engine, reader
+
+
+def configure_engines(
+    database_url: str,
+    replica_url: str | None = None,
+    shard_urls: list[str] | tuple[str, ...] = (),
+):
+    """Create the primary, read and shard engines and their session factories."""
+    global engine, read_engine, read_your_writes, async_session, async_read_session
+    global shards
+
+    engine, read_engine = build_engines(database_url, replica_url)
+    read_your_writes = bool(replica_url)
+    async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async_read_session = sessionmaker(
+        read_engine, class_=AsyncSession, expire_on_commit=False
+    )
+
+    # The primary database is shard 0
+    shards = [Shard(engine, read_engine, async_session, async_read_session)]
+    for shard_url in shard_urls:
+        shard_engine, shard_read_engine = build_engines(shard_url)
+        shards.append(
+            Shard(
+                shard_engine,
+                shard_read_engine,
+                sessionmaker(shard_engine, class_=AsyncSession, expire_on_commit=False),
+                sessionmaker(
+                    shard_read_engine, class_=AsyncSession, expire_on_commit=False
+                ),
             )
-            session.add(province)
+        )
 
-        await session.commit()
-        print("Province data initialized successfully")
-        break
+    statements.untrack_all()
+    for index, shard in enumerate(shards):
+        name = "primary" if index == 0 else f"shard-{index}"
+        statements.track(name, shard.engine)
+        if shard.read_engine is not shard.engine:
+            statements.track("read" if index == 0 else f"{name}-read", shard.read_engine)
 
 
 async def init_db():
     """Initialize the database engine and create tables."""
-    global engine
-
-    engine = create_async_engine(
-        "sqlite+aiosqlite:///database.db",
-        echo=True,
-        future=True,
-        connect_args=connect_args,
+    configure_engines(
+        DATABASE_URL, settings.SQLDB_REPLICA_URL, settings.SQLDB_SHARD_URLS
     )
 
     await create_db_and_tables()
+    await migrate_db()
+    await check_user_placement()
     await init_province_data()
 
 
+async def check_user_placement():
+    """Refuse to run sharded over users whose id places them on another shard."""
+    if not is_sharded():
+        return
+    for index, shard in enumerate(shards):
+        async with shard.session() as session:
+            misplaced = await sharding.misplaced_user_count(
+                session, index, shard_count()
+            )
+        if misplaced:
+            raise RuntimeError(
+                f"{misplaced} users on shard {index} have ids of other shards; "
+                "their data must be moved before running with these shards"
+            )
+
+
 async def create_db_and_tables():
     """Create database tables."""
-    async with engine.begin() as conn:
-        # await conn.run_sync(SQLModel.metadata.drop_all)
-        await conn.run_sync(SQLModel.metadata.create_all)
+    for shard in shards:
+        async with shard.engine.begin() as conn:
+            # await conn.run_sync(SQLModel.metadata.drop_all)
+            await conn.run_sync(SQLModel.metadata.create_all)
+
+
+async def migrate_db():
+    """Add the columns tables created by an older release are missing."""
+    for shard in shards:
+        await migrations.migrate(shard.engine)
+
+
+def shard_count() -> int:
+    return max(1, len(shards))
+
+
+def is_sharded() -> bool:
+    return len(shards) > 1
 
 
-async def get_session() -> AsyncIterator[AsyncSession]:
-    """Get async database session."""
+def shard_for_user(user_id: int | str) -> int:
+    if not is_sharded():
+        return 0
+    try:
+        return sharding.shard_for_user_id(int(user_id), shard_count())
+    except ValueError:
+        return 0
+
+
+def shard_for_citizen_id(citizen_id: str) -> int:
+    return sharding.shard_for_citizen_id(citizen_id, shard_count())
+
+
+def shard_for_request(request: Request | None) -> int:
+    """Shard of the user the request's bearer token is for; 0 without one."""
+    if not is_sharded():
+        return 0
+    subject = consistency.request_subject(request)
+    try:
+        return shard_for_user(int(subject))
+    except (TypeError, ValueError):
+        return 0
+
+
+async def get_session(request: Request = None) -> AsyncIterator[AsyncSession]:
+    """Get async database session, on the shard of the requesting user."""
     if engine is None:
         raise Exception("Database engine is not initialized. Call init_db() first.")
 
-    async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
-    async with async_session() as session:
+    async with shards[shard_for_request(request)].session() as session:
         yield session
 
+        if read_your_writes and session.info.get(consistency.COMMITTED):
+            subject = consistency.request_subject(request)
+            if subject is not None:
+                await consistency.record_write(subject)
+
+
+async def get_read_session(request: Request = None) -> AsyncIterator[AsyncSession]:
+    """Get async database session for routes that only read."""
+    if read_engine is None:
+        raise Exception("Database engine is not initialized. Call init_db() first.")
+
+    index = shard_for_request(request)
+    factory = shards[index].read_session
+    # Only the primary (shard 0) can have a lagging replica
+    if read_your_writes and index == 0:
+        subject = consistency.request_subject(request)
+        if subject is not None and await consistency.wrote_recently(subject):
+            factory = shards[index].session
+
+    async with factory() as session:
+        yield session
+
+
+@contextlib.asynccontextmanager
+async def shard_session(
+    session: AsyncSession, shard: int, read: bool = False
+) -> AsyncIterator[AsyncSession]:
+    """A session on ``shard``: the request's own ``session`` when not sharded."""
+    if not is_sharded():
+        yield session
+        return
+
+    factory = shards[shard].read_session if read else shards[shard].session
+    async with factory() as shard_session:
+        yield shard_session
+        # Lets get_session see the write for read-your-writes
+        if shard_session.info.get(consistency.COMMITTED):
+            session.info[consistency.COMMITTED] = True
+
+
+async def gather_shards(
+    session: AsyncSession,
+    load: Callable[[AsyncSession], Awaitable[T]],
+    read: bool = True,
+) -> list[T]:
+    """Run ``load`` on every shard concurrently, each with its own session.
+
+    Not sharded, ``load`` runs once on the request's own ``session``.
+    """
+    if not is_sharded():
+        return [await load(session)]
+
+    async def run(shard: Shard) -> T:
+        factory = shard.read_session if read else shard.session
+        async with factory() as shard_session:
+            return await load(shard_session)
+
+    return await asyncio.gather(*(run(shard) for shard in shards))
+
+
+async def write_shards(
+    session: AsyncSession, apply: Callable[[AsyncSession], Awaitable[T]]
+) -> list[T]:
+    """Run ``apply`` on every shard, then commit the shards together.
+
+    ``apply`` makes its changes without committing. The shards are only
+    committed once it succeeded on all of them, so an error on one shard
+    (e.g. a 404) leaves every shard as it was. A commit failing after others
+    went through cannot be undone; it is logged with the shards that
+    committed, and raised.
+    """
+    if not is_sharded():
+        result = await apply(session)
+        await session.commit()
+        return [result]
+
+    async with contextlib.AsyncExitStack() as stack:
+        sessions = [
+            await stack.enter_async_context(shard.session()) for shard in shards
+        ]
+
+        async def run(shard_session: AsyncSession) -> T:
+            result = await apply(shard_session)
+            # Constraint errors show here, before any shard has committed
+            await shard_session.flush()
+            return result
+
+        outcomes = await asyncio.gather(
+            *(run(shard_session) for shard_session in sessions),
+            return_exceptions=True,
+        )
+        for outcome in outcomes:
+            if isinstance(outcome, BaseException):
+                raise outcome
+
+        for index, shard_session in enumerate(sessions):
+            try:
+                await shard_session.commit()
+            except Exception:
+                if index:
+                    logger.error(
+                        "Write committed on shards %s but failed on shard %d",
+                        list(range(index)),
+                        index,
+                    )
+                raise
+        return outcomes
+
+
+async def find_user(
+    session: AsyncSession, statement, params: dict, shard: int | None = None
+) -> DBUser | None:
+    """The user matching ``statement``, looked up on ``shard`` or on all shards.
+
+    Used for uniqueness checks, so never asks a lagging replica.
+    """
+    if not is_sharded():
+        result = await session.exec(statement, params=params)
+        return result.one_or_none()
+
+    async def load(shard_session: AsyncSession) -> DBUser | None:
+        result = await shard_session.exec(statement, params=params)
+        return result.one_or_none()
+
+    if shard is not None:
+        async with shards[shard].session() as shard_session:
+            return await load(shard_session)
+
+    users = await gather_shards(session, load, read=False)
+    return next((user for user in users if user is not None), None)
+
+
+async def insert_user(session: AsyncSession, user: DBUser, shard: int):
+    """Add and commit a new user, with an id that places it on ``shard``.
+
+    Ids are autoincrement when not sharded. Sharded, a registration that
+    loses a race for an id to another one allocates the next id.
+    """
+    for attempt in range(1, USER_ID_ATTEMPTS + 1):
+        if is_sharded():
+            user.id = await sharding.allocate_user_id(session, shard, shard_count())
+        session.add(user)
+        try:
+            await session.commit()
+        except IntegrityError:
+            await session.rollback()
+            if not is_sharded() or attempt == USER_ID_ATTEMPTS:
+                raise
+            # Any other constraint failed; allocating again will not help
+            if await session.get(DBUser, user.id) is None:
+                raise
+            continue
+        await session.refresh(user)
+        return
+
 
 async def close_db():
     """Close database connection."""
-    global engine
-    if engine is not None:
-        await engine.dispose()
-        engine = None
+    global engine, read_engine, shards
+    for shard in shards:
+        if shard.read_engine is not shard.engine:
+            await shard.read_engine.dispose()
+        await shard.engine.dispose()
+    engine = None
+    read_engine = None
+    shards = []
@@ -0,0 +1,57 @@
+"""Read-your-writes routing for replica reads.
+
+A replica may lag behind the primary, so a user who has just written would
+not see their own change on the next read. Every committed write session
+marks the requesting user for ``READ_YOUR_WRITES_SECONDS``. While the mark
+is set, that user's read-only sessions use the primary. Marks are kept in the
+shared cache so they hold across workers.
+"""
+
+import jwt
+from fastapi import Request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from flasx.core import cache
+from flasx.core import config
+
+settings = config.get_settings()
+
+RECENT_WRITE_KEY_PREFIX = "recent-write:"
+COMMITTED = "committed"
+
+
+@event.listens_for(Session, "after_commit")
+def _mark_committed(session: Session):
+    session.info[COMMITTED] = True
+
+
+def request_subject(request: Request | None) -> str | None:
+    """User id from the bearer token, if any.
+
+    Only used to choose a database, so the token is not verified here; the
+    route's own authentication still does that.
+    """
+    if request is None:
+        return None
+
+    authorization = request.headers.get("Authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+
+    try:
+        payload = jwt.decode(token, options={"verify_signature": False})
+    except jwt.InvalidTokenError:
+        return None
+    return payload.get("sub")
+
+
+async def record_write(subject: str):
+    await cache.get_cache().set(
+        f"{RECENT_WRITE_KEY_PREFIX}{subject}", "1", settings.READ_YOUR_WRITES_SECONDS
+    )
+
+
+async def wrote_recently(subject: str) -> bool:
+    return await cache.get_cache().get(f"{RECENT_WRITE_KEY_PREFIX}{subject}") is not None
@@ -0,0 +1,73 @@
+import datetime
+import pydantic
+from pydantic import BaseModel, ConfigDict
+from sqlmodel import SQLModel, Field
+
+MAX_EXPENSE_LINES = 10_000
+
+
+class ExpenseLine(BaseModel):
+    user_id: int
+    province_id: int
+    amount: float = pydantic.Field(ge=0, json_schema_extra=dict(example=1200.00))
+    date: datetime.date = pydantic.Field(json_schema_extra=dict(example="2025-07-01"))
+
+
+class CopayRequest(BaseModel):
+    lines: list[ExpenseLine] = pydantic.Field(max_length=MAX_EXPENSE_LINES)
+
+
+class CopayLine(BaseModel):
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True)
+    tax_reduction_rate: float
+    eligible: bool
+    reduction: float
+
+
+class CopayUserTotal(BaseModel):
+    user_id: int
+    reduction: float
+
+
+class CopayResult(BaseModel):
+    """Per-line and aggregate tax reductions for a batch of expense lines"""
+    lines: list[CopayLine]
+    users: list[CopayUserTotal]
+    total_lines: int
+    eligible_lines: int
+    total_amount: float
+    total_reduction: float
+
+
+class DBProvinceBudget(SQLModel, table=True):
+    """Co-pay budget of a province, for the whole program or one day.
+
+    Amounts are in satang. ``leased`` is what workers have taken out of
+    ``cap`` to serve reservations from; see flasx.core.budget.
+    """
+    __tablename__ = "province_budgets"
+    province_id: int = Field(foreign_key="provinces.id", primary_key=True)
+    # "total", or the ISO date of a daily budget
+    period: str = Field(primary_key=True, max_length=10)
+    cap: int
+    leased: int = Field(default=0)
+    spent: int = Field(default=0)
+
+
+class SetProvinceBudget(BaseModel):
+    cap: float = pydantic.Field(ge=0, json_schema_extra=dict(example=1_000_000.00))
+    day: datetime.date | None = None
+
+
+class ProvinceBudget(BaseModel):
+    """A province budget in baht, with this worker's share of it"""
+    province_id: int
+    period: str
+    cap: float
+    leased: float
+    spent: float
+    # This worker's lease: not yet reserved, reserved, and spent but not
+    # yet reconciled into ``spent``
+    available: float
+    reserved: float
+    committed: float
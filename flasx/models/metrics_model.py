@@ -0,0 +1,108 @@
+import datetime
+
+from pydantic import BaseModel
+
+
+class SingleFlightKindStats(BaseModel):
+    calls: int
+    loads: int
+    coalesced: int
+    errors: int
+    in_flight: int
+
+
+class SingleFlightStats(BaseModel):
+    """Coalescing of identical concurrent loads, per kind of load"""
+    total_calls: int
+    total_coalesced: int
+    kinds: dict[str, SingleFlightKindStats]
+
+
+class ResponseCacheStats(BaseModel):
+    """Hits and size of this worker's cache of rendered per-user responses"""
+    hits: int
+    misses: int
+    hit_ratio: float
+    evictions: int
+    entries: int
+    max_entries: int
+    size_bytes: int
+    max_bytes: int
+
+
+class CompiledCacheEngineStats(BaseModel):
+    size: int
+    entries: int
+    hits: int
+    misses: int
+    # Executions that bypassed the cache, by SQLAlchemy's reason
+    uncached: dict[str, int]
+
+
+class CompiledCacheStats(BaseModel):
+    """SQLAlchemy compiled-statement cache usage, per engine"""
+    engines: dict[str, CompiledCacheEngineStats]
+
+
+class MemorySnapshotInfo(BaseModel):
+    id: int
+    taken_at: datetime.datetime
+    traced_bytes: int
+
+
+class RouteMemoryStats(BaseModel):
+    requests: int
+    retained_bytes: int
+    max_retained_bytes: int
+
+
+class MemoryStatus(BaseModel):
+    """tracemalloc state, stored snapshots and memory left behind per route"""
+    enabled: bool
+    traced_bytes: int
+    peak_bytes: int
+    snapshots: list[MemorySnapshotInfo]
+    routes: dict[str, RouteMemoryStats]
+
+
+class AllocationSite(BaseModel):
+    site: str
+    size_bytes: int
+    count: int
+    size_diff_bytes: int | None = None
+    count_diff: int | None = None
+    traceback: list[str] | None = None
+
+
+class ObjectCounts(BaseModel):
+    """Live SQLModel instances by class, and entries held by in-process caches"""
+    sqlmodel_instances: dict[str, int]
+    caches: dict[str, int]
+
+
+class ProfileInfo(BaseModel):
+    id: str
+    size_bytes: int
+    created_at: datetime.datetime
+
+
+class AdmissionStats(BaseModel):
+    """Event-loop lag, requests in flight and requests shed while overloaded"""
+    overloaded: bool
+    lag_seconds: float
+    max_lag_seconds: float
+    in_flight: int
+    max_in_flight: int
+    admitted: int
+    shed_total: int
+    shed_by_reason: dict[str, int]
+    shed_by_route: dict[str, int]
+
+
+class BlockingCallInfo(BaseModel):
+    """A stretch of time the event loop spent in one callback"""
+    detected_at: datetime.datetime
+    route: str | None
+    task: str | None
+    blocked_seconds: float | None
+    stack: list[str]
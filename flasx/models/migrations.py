@@ -0,0 +1,142 @@
+"""Columns added to tables after they were first created.
+
+``create_all`` only creates missing tables, so a database created by an
+older release lacks the columns added since. ``migrate`` runs on every
+start and adds each missing column, filling it in for the rows already
+there; columns a database already has are left alone, so running it again
+changes nothing.
+
+Tiers are derived from rates by the current quota rules, which can change
+between starts, so ``migrate`` also derives every province's tier again.
+"""
+
+import asyncio
+import dataclasses
+import json
+import logging
+import os
+from typing import Awaitable, Callable
+
+from sqlalchemy import bindparam, case, func, inspect, null, update
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from flasx.core import quota
+from .province_model import DBProvince
+
+logger = logging.getLogger(__name__)
+
+CATALOG_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "provinces.json")
+
+
+@dataclasses.dataclass(frozen=True)
+class AddedColumn:
+    table: str
+    name: str
+    # Type and constraints, in SQL that both SQLite and PostgreSQL accept
+    definition: str
+    index: bool = False
+    # Fills the new column in for the existing rows
+    backfill: Callable[[AsyncConnection], Awaitable[None]] | None = None
+
+
+async def derive_tiers(connection: AsyncConnection):
+    """Each province's tier from its rate, as DBProvince's update hook sets it.
+
+    Rows are only written where the tier differs, so with unchanged rules
+    this writes nothing.
+    """
+    tier = case(
+        *(
+            (
+                func.abs(DBProvince.tax_reduction_rate - tier.tax_reduction_rate)
+                < 1e-9,
+                tier.id,
+            )
+            for tier in quota.get_rules().tiers
+        ),
+        else_=null(),
+    )
+    result = await connection.execute(
+        update(DBProvince)
+        .where(DBProvince.tier.is_distinct_from(tier))
+        .values(tier=tier)
+    )
+    if result.rowcount:
+        logger.info("Derived the tier of %d provinces again", result.rowcount)
+
+
+def _load_catalog() -> list[dict]:
+    with open(CATALOG_PATH, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return data["primary_provinces"] + data["secondary_provinces"]
+
+
+def backfill_from_catalog(column: str):
+    """A backfill copying ``column`` from the bundled catalog, by province name."""
+
+    async def backfill(connection: AsyncConnection):
+        rows = [
+            {"province_name": province["name"], "value": province[column]}
+            for province in await asyncio.to_thread(_load_catalog)
+            if province.get(column) is not None
+        ]
+        if rows:
+            await connection.execute(
+                update(DBProvince)
+                .where(DBProvince.name == bindparam("province_name"))
+                .values({column: bindparam("value")}),
+                rows,
+            )
+
+    return backfill
+
+
+ADDED_COLUMNS = [
+    AddedColumn("users", "token_version", "INTEGER NOT NULL DEFAULT 0"),
+    AddedColumn("provinces", "tier", "INTEGER", index=True, backfill=derive_tiers),
+    AddedColumn(
+        "provinces", "name_th", "VARCHAR", backfill=backfill_from_catalog("name_th")
+    ),
+    AddedColumn(
+        "provinces", "latitude", "FLOAT", backfill=backfill_from_catalog("latitude")
+    ),
+    AddedColumn(
+        "provinces", "longitude", "FLOAT", backfill=backfill_from_catalog("longitude")
+    ),
+]
+
+
+def _columns(connection) -> dict[str, set[str]]:
+    inspector = inspect(connection)
+    return {
+        table: {column["name"] for column in inspector.get_columns(table)}
+        for table in inspector.get_table_names()
+    }
+
+
+async def migrate(engine: AsyncEngine) -> list[str]:
+    """Add the columns the database is missing and derive tiers again.
+
+    Returns the added columns as ``table.column``.
+    """
+    added = []
+    async with engine.begin() as connection:
+        existing = await connection.run_sync(_columns)
+        for column in ADDED_COLUMNS:
+            if column.name in existing.get(column.table, ()):
+                continue
+            await connection.exec_driver_sql(
+                f"ALTER TABLE {column.table} ADD COLUMN {column.name} "
+                f"{column.definition}"
+            )
+            if column.index:
+                await connection.exec_driver_sql(
+                    f"CREATE INDEX IF NOT EXISTS ix_{column.table}_{column.name} "
+                    f"ON {column.table} ({column.name})"
+                )
+            if column.backfill is not None:
+                await column.backfill(connection)
+            added.append(f"{column.table}.{column.name}")
+            logger.info("Added column %s.%s", column.table, column.name)
+        await derive_tiers(connection)
+    return added
@@ -1,17 +1,49 @@
 import datetime
 import pydantic
 from pydantic import BaseModel, ConfigDict
+from sqlalchemy import event
 from sqlmodel import SQLModel, Field
 
+from flasx.core import quota
+
 
 class BaseProvince(BaseModel):
     model_config = ConfigDict(from_attributes=True, populate_by_name=True)
     name: str = pydantic.Field(json_schema_extra=dict(example="Bangkok"))
+    name_th: str | None = pydantic.Field(
+        json_schema_extra=dict(example="กรุงเทพมหานคร"), default=None
+    )
     tax_reduction_rate: float = pydantic.Field(json_schema_extra=dict(example=0.50))
+    # Approximate centroid, at the provincial seat
+    latitude: float | None = pydantic.Field(
+        json_schema_extra=dict(example=13.7563), default=None, ge=-90, le=90
+    )
+    longitude: float | None = pydantic.Field(
+        json_schema_extra=dict(example=100.5018), default=None, ge=-180, le=180
+    )
 
 
 class Province(BaseProvince):
     id: int
+    tier: int | None = pydantic.Field(json_schema_extra=dict(example=1), default=None)
+
+
+class ProvinceSearchResult(Province):
+    score: float
+
+
+class ProvinceSearchResults(BaseModel):
+    query: str
+    results: list[ProvinceSearchResult]
+
+
+class NearbyProvince(Province):
+    distance_km: float
+
+
+class NearbyProvinces(BaseModel):
+    province: Province
+    results: list[NearbyProvince]
 
 
 class ProvinceList(BaseModel):
@@ -31,7 +63,19 @@ class DBProvince(BaseProvince, SQLModel, table=True):
     __tablename__ = "provinces"
     id: int | None = Field(default=None, primary_key=True)
     name: str
+    name_th: str | None = Field(default=None)
     tax_reduction_rate: float
-    
+    latitude: float | None = Field(default=None)
+    longitude: float | None = Field(default=None)
+    # Derived from tax_reduction_rate on every insert and update
+    tier: int | None = Field(default=None, index=True)
+
     created_date: datetime.datetime = Field(default_factory=datetime.datetime.now)
     updated_date: datetime.datetime = Field(default_factory=datetime.datetime.now)
+
+
+@event.listens_for(DBProvince, "before_insert")
+@event.listens_for(DBProvince, "before_update")
+def _assign_tier(mapper, connection, province: DBProvince):
+    tier = quota.get_rules().tier_for_rate(province.tax_reduction_rate)
+    province.tier = tier.id if tier else None
@@ -0,0 +1,61 @@
+"""Placement of user data across shard databases.
+
+With ``SQLDB_SHARD_URLS`` set there are N shards: shard 0 is the primary
+database and the URLs are shards 1..N-1. A user's ``users`` row and their
+``user_provinces`` rows live on one shard, and every shard holds a full copy
+of the province catalog.
+
+The shard of a user is a function of the user id alone, so any token,
+path parameter or foreign key leads straight to it. Ids are allocated per
+shard from that shard's own sequence: shard ``s`` uses ``s + 1``,
+``s + 1 + N``, ``s + 1 + 2N``, ... A database that already holds users
+with other ids (e.g. 1..n from before sharding) cannot be sharded as is;
+``misplaced_user_count`` finds them so startup can refuse.
+
+New users are placed by a hash of their citizen id, which also lets logins
+by citizen id go straight to the right shard.
+"""
+
+import zlib
+
+from sqlalchemy import func
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .user_model import DBUser
+
+
+def shard_for_user_id(user_id: int, shard_count: int) -> int:
+    return (user_id - 1) % shard_count
+
+
+def shard_for_citizen_id(citizen_id: str, shard_count: int) -> int:
+    return zlib.crc32(citizen_id.encode()) % shard_count
+
+
+def next_user_id(last_id: int | None, shard: int, shard_count: int) -> int:
+    """The first id after ``last_id`` that belongs to ``shard``."""
+    if last_id is None:
+        return shard + 1
+    return ((last_id - 1 - shard) // shard_count + 1) * shard_count + shard + 1
+
+
+async def allocate_user_id(session: AsyncSession, shard: int, shard_count: int) -> int:
+    """Next free id on ``shard``.
+
+    Two registrations racing on one shard can pick the same id; the primary
+    key rejects the second one, which then allocates again. With the SQLite
+    profile the single writer connection serializes them.
+    """
+    result = await session.exec(select(func.max(DBUser.id)))
+    return next_user_id(result.one(), shard, shard_count)
+
+
+async def misplaced_user_count(
+    session: AsyncSession, shard: int, shard_count: int
+) -> int:
+    """How many users on ``shard`` have an id that belongs to another shard."""
+    result = await session.exec(
+        select(func.count(DBUser.id)).where((DBUser.id - 1) % shard_count != shard)
+    )
+    return result.one()
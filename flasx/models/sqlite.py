@@ -0,0 +1,61 @@
+"""SQLite high-concurrency profile.
+
+File-backed SQLite databases are opened in WAL mode so readers never wait for
+the writer. Writes go through one dedicated connection, which turns writer
+contention into an orderly queue instead of ``database is locked`` retries,
+and reads use a separate pool of read-only connections.
+"""
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from flasx.core import config
+
+settings = config.get_settings()
+
+
+def is_file_database(url: str) -> bool:
+    parsed = make_url(url)
+    return (
+        parsed.get_backend_name() == "sqlite"
+        and parsed.database not in (None, "", ":memory:")
+        and "mode=memory" not in url
+    )
+
+
+def read_only_url(url: str) -> str:
+    """Open the same database file through a read-only SQLite URI."""
+    parsed = make_url(url)
+    return parsed.set(database=f"file:{parsed.database}").update_query_dict(
+        {"mode": "ro", "uri": "true"}
+    ).render_as_string(hide_password=False)
+
+
+def pragmas(read_only: bool) -> list[str]:
+    statements = [
+        f"PRAGMA busy_timeout = {settings.SQLITE_BUSY_TIMEOUT_MS}",
+        f"PRAGMA cache_size = {settings.SQLITE_CACHE_SIZE}",
+        f"PRAGMA mmap_size = {settings.SQLITE_MMAP_SIZE}",
+        "PRAGMA temp_store = MEMORY",
+    ]
+    if read_only:
+        statements.append("PRAGMA query_only = ON")
+    else:
+        # journal_mode is stored in the file, so the writer sets it once for everyone
+        statements += ["PRAGMA journal_mode = WAL", "PRAGMA synchronous = NORMAL"]
+    return statements
+
+
+def apply_profile(engine: AsyncEngine, read_only: bool = False):
+    """Run the profile pragmas on every new DBAPI connection of ``engine``."""
+    statements = pragmas(read_only)
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
@@ -0,0 +1,97 @@
+"""Prebuilt statements for hot queries.
+
+Building a ``select()`` costs Python time on every request even when
+SQLAlchemy then finds its compiled form in the engine's compiled cache.
+These statements are built once at import, with the per-request values as
+bind parameters, so a request only supplies ``params``::
+
+    await session.exec(statements.USER_BY_CITIZEN_ID, params={"citizen_id": ...})
+
+The compiled cache size is ``SQL_COMPILED_CACHE_SIZE``; hits and misses of
+every tracked engine are counted by ``track``.
+"""
+
+import collections
+import dataclasses
+
+from sqlalchemy import bindparam, event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import select
+
+from .user_model import DBUser
+from .province_model import DBProvince
+from .user_province_model import DBUserProvince
+
+USER_BY_CITIZEN_ID = select(DBUser).where(DBUser.citizen_id == bindparam("citizen_id"))
+USER_BY_PHONE_NUMBER = select(DBUser).where(
+    DBUser.phone_number == bindparam("phone_number")
+)
+USER_BY_EMAIL = select(DBUser).where(DBUser.email == bindparam("email"))
+USER_NAMES_BY_IDS = select(DBUser.id, DBUser.first_name, DBUser.last_name).where(
+    DBUser.id.in_(bindparam("user_ids", expanding=True))
+)
+
+ALL_PROVINCES = select(DBProvince)
+PROVINCES_BY_TIER = select(DBProvince).where(DBProvince.tier == bindparam("tier"))
+PROVINCE_BY_NAME = select(DBProvince).where(DBProvince.name == bindparam("name"))
+PROVINCE_RATES = select(DBProvince.id, DBProvince.tax_reduction_rate)
+
+USER_PROVINCES = (
+    select(DBProvince)
+    .join(DBUserProvince)
+    .where(DBUserProvince.user_id == bindparam("user_id"))
+)
+PROVINCES_OF_USERS = (
+    select(DBUserProvince.user_id, DBProvince)
+    .join(DBProvince, DBProvince.id == DBUserProvince.province_id)
+    .where(DBUserProvince.user_id.in_(bindparam("user_ids", expanding=True)))
+    .order_by(DBUserProvince.user_id, DBUserProvince.id)
+)
+USER_PROVINCE_LINK = select(DBUserProvince).where(
+    DBUserProvince.user_id == bindparam("user_id"),
+    DBUserProvince.province_id == bindparam("province_id"),
+)
+TARGET_PROVINCES_OF_USERS = select(
+    DBUserProvince.user_id, DBUserProvince.province_id
+).where(DBUserProvince.user_id.in_(bindparam("user_ids", expanding=True)))
+
+
+@dataclasses.dataclass
+class CompiledCacheStats:
+    engine: AsyncEngine
+    # Keyed by the lower-cased SQLAlchemy CacheStats name, e.g. "cache_hit"
+    executions: collections.Counter = dataclasses.field(
+        default_factory=collections.Counter
+    )
+
+    @property
+    def size(self) -> int:
+        cache = self.engine.sync_engine._compiled_cache
+        return cache.capacity if cache is not None else 0
+
+    @property
+    def entries(self) -> int:
+        cache = self.engine.sync_engine._compiled_cache
+        return len(cache) if cache is not None else 0
+
+
+_tracked: dict[str, CompiledCacheStats] = {}
+
+
+def track(name: str, engine: AsyncEngine):
+    """Count compiled-cache hits and misses of ``engine`` under ``name``."""
+    stats = CompiledCacheStats(engine)
+    _tracked[name] = stats
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def count(conn, cursor, statement, parameters, context, executemany):
+        if context is not None and context.compiled is not None:
+            stats.executions[context.cache_hit.name.lower()] += 1
+
+
+def untrack_all():
+    _tracked.clear()
+
+
+def compiled_cache_stats() -> dict[str, CompiledCacheStats]:
+    return dict(_tracked)
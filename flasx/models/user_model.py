@@ -1,3 +1,4 @@
+import asyncio
 import datetime
 
 import pydantic
@@ -7,7 +8,7 @@ from sqlmodel import SQLModel, Field
 # from passlib.context import CryptContext
 
 # pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-import bcrypt
+from flasx.core import passwords
 
 
 class BaseUser(BaseModel):
@@ -76,11 +77,27 @@ class Token(BaseModel):
     user_id: int
 
 
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str
+
+
+class LogoutRequest(BaseModel):
+    refresh_token: str | None = None
+
+
 class ChangedPasswordUser(BaseModel):
     current_password: str
     new_password: str
 
 
+class PasswordHashStats(BaseModel):
+    """Distribution of stored password hashes by algorithm and cost"""
+    total_users: int
+    current_scheme: str
+    needs_rehash: int
+    schemes: dict[str, int]
+
+
 class DBUser(BaseUser, SQLModel, table=True):
     __tablename__ = "users"
     id: int | None = Field(default=None, primary_key=True)
@@ -91,16 +108,20 @@ class DBUser(BaseUser, SQLModel, table=True):
     register_date: datetime.datetime = Field(default_factory=datetime.datetime.now)
     updated_date: datetime.datetime = Field(default_factory=datetime.datetime.now)
     last_login_date: datetime.datetime | None = Field(default=None)
+    # Bumped to invalidate every token issued to this user so far
+    token_version: int = Field(default=0)
 
+    # Hashing takes a good fraction of a second, so it runs off the event loop
     async def get_encrypted_password(self, plain_password):
-        return bcrypt.hashpw(
-            plain_password.encode("utf-8"), salt=bcrypt.gensalt()
-        ).decode("utf-8")
+        return await asyncio.to_thread(passwords.hash_password, plain_password)
 
     async def set_password(self, plain_password):
         self.password = await self.get_encrypted_password(plain_password)
 
     async def verify_password(self, plain_password):
-        return bcrypt.checkpw(
-            plain_password.encode("utf-8"), self.password.encode("utf-8")
+        return await asyncio.to_thread(
+            passwords.verify_password, plain_password, self.password
         )
+
+    def password_needs_rehash(self) -> bool:
+        return passwords.needs_rehash(self.password)
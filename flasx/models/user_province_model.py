@@ -1,7 +1,12 @@
 import datetime
+import pydantic
 from pydantic import BaseModel, ConfigDict
 from sqlmodel import SQLModel, Field
 
+from .province_model import Province
+
+MAX_BATCH_USERS = 500
+
 
 class BaseUserProvince(BaseModel):
     model_config = ConfigDict(from_attributes=True, populate_by_name=True)
@@ -31,6 +36,15 @@ class DBUserProvince(SQLModel, table=True):
     created_date: datetime.datetime = Field(default_factory=datetime.datetime.now)
 
 
+class TierQuota(BaseModel):
+    """Quota usage for one province tier"""
+    tier: int
+    name: str
+    used: int
+    remaining: int
+    max_provinces: int
+
+
 class UserProvinceQuota(BaseModel):
     """Model to show user's province quota status"""
     total_provinces: int
@@ -38,6 +52,30 @@ class UserProvinceQuota(BaseModel):
     secondary_provinces: int
     remaining_primary_quota: int
     remaining_secondary_quota: int
-    max_primary_quota: int = 3
-    max_secondary_quota: int = 2
-    max_total_quota: int = 5
+    max_primary_quota: int
+    max_secondary_quota: int
+    max_total_quota: int
+    remaining_total_quota: int
+    tiers: list[TierQuota]
+
+
+class BatchUserProvincesRequest(BaseModel):
+    user_ids: list[int] = pydantic.Field(
+        min_length=1,
+        max_length=MAX_BATCH_USERS,
+        json_schema_extra=dict(example=[1, 2, 3]),
+    )
+
+
+class UserProvincesSummary(BaseModel):
+    """One user's target provinces and quota usage"""
+    user_id: int
+    user_name: str
+    provinces: list[Province]
+    quota: UserProvinceQuota
+
+
+class BatchUserProvinces(BaseModel):
+    users: list[UserProvincesSummary]
+    # Requested ids with no matching user
+    missing_user_ids: list[int]
@@ -6,6 +6,8 @@ from . import (
     hello_router,
     province_router,
     user_province_router,
+    admin_router,
+    copay_router,
 )
 
 router = APIRouter(prefix="/v1")
@@ -15,3 +17,5 @@ router.include_router(user_router.router)
 router.include_router(hello_router.router)
 router.include_router(province_router.router)
 router.include_router(user_province_router.router)
+router.include_router(admin_router.router)
+router.include_router(copay_router.router)
@@ -0,0 +1,365 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import FileResponse, PlainTextResponse
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel import select
+
+from typing import Annotated, Literal
+import collections
+import dataclasses
+import datetime
+import os
+import tracemalloc
+
+from flasx.core import admission
+from flasx.core import budget
+from flasx.core import cache
+from flasx.core import deps
+from flasx.core import encoding
+from flasx.core import last_login
+from flasx.core import loop_debug
+from flasx.core import memory
+from flasx.core import passwords
+from flasx.core import profiling
+from flasx.core import province_search
+from flasx.core import response_cache
+from flasx.core import revocation
+from flasx.core import singleflight
+from flasx import models
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    dependencies=[Depends(deps.get_current_active_superuser)],
+    route_class=encoding.NegotiatedRoute,
+)
+
+
+@router.get("/password-hashes")
+async def get_password_hash_stats(
+    session: Annotated[AsyncSession, Depends(models.get_read_session)],
+) -> models.PasswordHashStats:
+    """Report how many stored hashes use each algorithm/cost, to track rehash migration"""
+    async def count_schemes(shard_session: AsyncSession) -> collections.Counter:
+        schemes = collections.Counter()
+        result = await shard_session.stream_scalars(select(models.DBUser.password))
+        async for hashed in result:
+            schemes[passwords.identify(hashed)] += 1
+        return schemes
+
+    schemes = sum(
+        await models.gather_shards(session, count_schemes), collections.Counter()
+    )
+
+    current_scheme = passwords.current_scheme()
+    total_users = sum(schemes.values())
+    return models.PasswordHashStats(
+        total_users=total_users,
+        current_scheme=current_scheme,
+        needs_rehash=total_users - schemes.get(current_scheme, 0),
+        schemes=dict(schemes),
+    )
+
+
+@router.get("/single-flight")
+async def get_single_flight_stats() -> models.SingleFlightStats:
+    """Report how many loads were shared with a concurrent identical call"""
+    group = singleflight.get_group()
+    kinds = {
+        kind: models.SingleFlightKindStats(
+            **dataclasses.asdict(stats), in_flight=group.in_flight(kind)
+        )
+        for kind, stats in group.stats().items()
+    }
+    return models.SingleFlightStats(
+        total_calls=sum(stats.calls for stats in kinds.values()),
+        total_coalesced=sum(stats.coalesced for stats in kinds.values()),
+        kinds=kinds,
+    )
+
+
+@router.get("/response-cache")
+async def get_response_cache_stats() -> models.ResponseCacheStats:
+    """Report hits, evictions and size of the per-user response cache"""
+    responses = response_cache.get_cache()
+    return models.ResponseCacheStats(
+        **dataclasses.asdict(responses.stats),
+        hit_ratio=responses.stats.hit_ratio,
+        entries=len(responses),
+        max_entries=responses.max_entries,
+        size_bytes=responses.size_bytes,
+        max_bytes=responses.max_bytes,
+    )
+
+
+@router.get("/statement-cache")
+async def get_statement_cache_stats() -> models.CompiledCacheStats:
+    """Report compiled-statement cache hits and misses since the engines were created"""
+    engines = {}
+    for name, stats in models.statements.compiled_cache_stats().items():
+        executions = stats.executions
+        engines[name] = models.CompiledCacheEngineStats(
+            size=stats.size,
+            entries=stats.entries,
+            hits=executions["cache_hit"],
+            misses=executions["cache_miss"],
+            uncached={
+                reason: count
+                for reason, count in executions.items()
+                if reason not in ("cache_hit", "cache_miss")
+            },
+        )
+    return models.CompiledCacheStats(engines=engines)
+
+
+@router.get("/admission")
+async def get_admission_stats() -> models.AdmissionStats:
+    """Report event-loop lag, requests in flight and how many requests were shed"""
+    controller = admission.get_controller()
+    return models.AdmissionStats(
+        overloaded=controller.overload_reason() is not None,
+        lag_seconds=controller.lag,
+        max_lag_seconds=controller.max_lag_seen,
+        in_flight=controller.in_flight,
+        max_in_flight=controller.max_in_flight_seen,
+        admitted=controller.admitted,
+        shed_total=sum(controller.shed_by_reason.values()),
+        shed_by_reason=dict(controller.shed_by_reason),
+        shed_by_route=dict(controller.shed_by_route.most_common()),
+    )
+
+
+@router.delete("/admission")
+async def reset_admission_stats() -> dict:
+    """Reset the shed counters and the peaks"""
+    admission.get_controller().reset_stats()
+    return {"message": "Admission stats reset"}
+
+
+def province_budget(row: models.DBProvinceBudget) -> models.ProvinceBudget:
+    allotment = budget.get_pools().allotment(row.province_id, row.period)
+    allotment = allotment or budget.Allotment()
+    return models.ProvinceBudget(
+        province_id=row.province_id,
+        period=row.period,
+        cap=budget.to_baht(row.cap),
+        leased=budget.to_baht(row.leased),
+        spent=budget.to_baht(row.spent),
+        available=budget.to_baht(allotment.available),
+        reserved=budget.to_baht(allotment.reserved),
+        committed=budget.to_baht(allotment.committed),
+    )
+
+
+@router.get("/budgets")
+async def get_budgets() -> list[models.ProvinceBudget]:
+    """List co-pay budgets with how much is leased and spent, and this worker's lease"""
+    return [province_budget(row) for row in await budget.get_pools().load_budgets()]
+
+
+@router.put("/budgets/{province_id}")
+async def set_budget(
+    province_id: int,
+    new_budget: models.SetProvinceBudget,
+    session: Annotated[AsyncSession, Depends(models.get_read_session)],
+) -> models.ProvinceBudget:
+    """Set a province's co-pay budget, for the whole program or for one day"""
+    if await session.get(models.DBProvince, province_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Province not found"
+        )
+
+    row = await budget.get_pools().set_budget(
+        province_id, budget.to_satang(new_budget.cap), new_budget.day
+    )
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Cap is below the amount already leased",
+        )
+    return province_budget(row)
+
+
+@router.get("/loop/blocking-calls")
+async def get_blocking_calls() -> list[models.BlockingCallInfo]:
+    """List recent times the event loop was blocked, with stack and route (LOOP_DEBUG)"""
+    return [
+        models.BlockingCallInfo(**dataclasses.asdict(call))
+        for call in loop_debug.get_monitor().blocking_calls()
+    ]
+
+
+def memory_status() -> models.MemoryStatus:
+    profiler = memory.get_profiler()
+    traced, peak = tracemalloc.get_traced_memory() if profiler.enabled else (0, 0)
+    return models.MemoryStatus(
+        enabled=profiler.enabled,
+        traced_bytes=traced,
+        peak_bytes=peak,
+        snapshots=[snapshot_info(s) for s in profiler.snapshots()],
+        routes={
+            route: models.RouteMemoryStats(**dataclasses.asdict(stats))
+            for route, stats in sorted(
+                profiler.routes.items(), key=lambda item: -item[1].retained_bytes
+            )
+        },
+    )
+
+
+def snapshot_info(stored: memory.StoredSnapshot) -> models.MemorySnapshotInfo:
+    return models.MemorySnapshotInfo(
+        id=stored.id, taken_at=stored.taken_at, traced_bytes=stored.traced_bytes
+    )
+
+
+def get_stored_snapshot(snapshot_id: int) -> memory.StoredSnapshot:
+    stored = memory.get_profiler().get_snapshot(snapshot_id)
+    if stored is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Memory snapshot not found",
+        )
+    return stored
+
+
+def allocation_site(stat, group_by: str) -> models.AllocationSite:
+    return models.AllocationSite(
+        site=memory.describe(stat),
+        size_bytes=stat.size,
+        count=stat.count,
+        size_diff_bytes=getattr(stat, "size_diff", None),
+        count_diff=getattr(stat, "count_diff", None),
+        traceback=stat.traceback.format() if group_by == "traceback" else None,
+    )
+
+
+@router.get("/memory")
+async def get_memory_status() -> models.MemoryStatus:
+    """Report whether memory profiling is on, stored snapshots and memory retained per route"""
+    return memory_status()
+
+
+@router.post("/memory/start")
+async def start_memory_profiling() -> models.MemoryStatus:
+    memory.get_profiler().start()
+    return memory_status()
+
+
+@router.post("/memory/stop")
+async def stop_memory_profiling() -> models.MemoryStatus:
+    """Stop tracing and discard its snapshots and per-route numbers"""
+    memory.get_profiler().stop()
+    return memory_status()
+
+
+@router.post("/memory/snapshots")
+def take_memory_snapshot() -> models.MemorySnapshotInfo:
+    profiler = memory.get_profiler()
+    if not profiler.enabled:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Memory profiling is not enabled",
+        )
+    return snapshot_info(profiler.take_snapshot())
+
+
+@router.get("/memory/snapshots/{snapshot_id}/top")
+def get_top_allocation_sites(
+    snapshot_id: int,
+    group_by: Literal["lineno", "filename", "traceback"] = "lineno",
+    limit: Annotated[int, Query(ge=1, le=200)] = 20,
+) -> list[models.AllocationSite]:
+    """List the allocation sites holding the most memory in a snapshot"""
+    stored = get_stored_snapshot(snapshot_id)
+    return [
+        allocation_site(stat, group_by)
+        for stat in memory.top_sites(stored.snapshot, group_by, limit)
+    ]
+
+
+@router.get("/memory/snapshots/{snapshot_id}/diff")
+def diff_memory_snapshots(
+    snapshot_id: int,
+    base: int,
+    group_by: Literal["lineno", "filename", "traceback"] = "lineno",
+    limit: Annotated[int, Query(ge=1, le=200)] = 20,
+) -> list[models.AllocationSite]:
+    """List the allocation sites that grew the most since snapshot ``base``"""
+    stored = get_stored_snapshot(snapshot_id)
+    base_snapshot = get_stored_snapshot(base)
+    return [
+        allocation_site(stat, group_by)
+        for stat in memory.diff(stored.snapshot, base_snapshot.snapshot, group_by, limit)
+    ]
+
+
+@router.get("/memory/objects")
+def get_object_counts() -> models.ObjectCounts:
+    """Count live SQLModel instances and the entries held by in-process caches"""
+    caches = {
+        "revoked_tokens": len(revocation.get_store()),
+        "last_login_pending": len(last_login.buffer),
+        "single_flight_in_flight": len(singleflight.get_group()),
+        "responses": len(response_cache.get_cache()),
+    }
+    shared_cache = cache.get_cache()
+    if isinstance(shared_cache, cache.LocalCache):
+        caches["local_cache"] = len(shared_cache)
+    index = province_search.get_index()
+    if index is not None:
+        caches["province_search_results"] = index.cache_info().currsize
+    for name, stats in models.statements.compiled_cache_stats().items():
+        caches[f"compiled_statements_{name}"] = stats.entries
+
+    return models.ObjectCounts(
+        sqlmodel_instances=memory.count_instances(models.SQLModel),
+        caches=caches,
+    )
+
+
+def get_profile_path(profile_id: str) -> str:
+    store = profiling.get_profile_store()
+    if not profiling.valid_profile_id(profile_id) or not os.path.isfile(
+        store.path(profile_id)
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found",
+        )
+    return store.path(profile_id)
+
+
+@router.get("/profiles")
+def list_profiles() -> list[models.ProfileInfo]:
+    """List stored request profiles, newest first"""
+    profiles = []
+    for entry in profiling.get_profile_store().list():
+        stat = entry.stat()
+        profiles.append(
+            models.ProfileInfo(
+                id=entry.name.removesuffix(profiling.PROFILE_SUFFIX),
+                size_bytes=stat.st_size,
+                created_at=datetime.datetime.fromtimestamp(stat.st_mtime),
+            )
+        )
+    return profiles
+
+
+@router.get("/profiles/{profile_id}")
+def download_profile(profile_id: str) -> FileResponse:
+    """Download a profile as a pstats file, e.g. for snakeviz or flameprof"""
+    return FileResponse(
+        get_profile_path(profile_id),
+        media_type="application/octet-stream",
+        filename=profile_id + profiling.PROFILE_SUFFIX,
+    )
+
+
+@router.get("/profiles/{profile_id}/summary", response_class=PlainTextResponse)
+def get_profile_summary(
+    profile_id: str,
+    sort: Literal["cumulative", "tottime", "ncalls"] = "cumulative",
+    limit: Annotated[int, Query(ge=1, le=500)] = 30,
+) -> str:
+    """Show the top functions of a profile as pstats text"""
+    get_profile_path(profile_id)
+    return profiling.get_profile_store().summary(profile_id, sort, limit)
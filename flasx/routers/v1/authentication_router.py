@@ -7,15 +7,26 @@ from fastapi.security import (
 )
 
 
-from sqlmodel import select
 from typing import Annotated
 import datetime
+import jwt
+import logging
 
 from flasx.core import config
+from flasx.core import deps
+from flasx.core import encoding
+from flasx.core import last_login
+from flasx.core import revocation
 from flasx.core import security
+from flasx.core import token_store
 from ... import models
 
-router = APIRouter(tags=["authentication"])
+logger = logging.getLogger(__name__)
+
+router = APIRouter(
+    tags=["authentication"],
+    route_class=encoding.NegotiatedRoute,
+)
 
 settings = config.get_settings()
 
@@ -25,24 +36,29 @@ async def authentication(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
     session: Annotated[models.AsyncSession, Depends(models.get_session)],
 ) -> models.Token:
-    print("form_data", form_data)
-
-    # Try to find user by citizen_id first
-    result = await session.exec(
-        select(models.DBUser).where(models.DBUser.citizen_id == form_data.username)
+    # Try to find user by citizen_id first, on the shard it was placed on
+    user = await models.find_user(
+        session,
+        models.statements.USER_BY_CITIZEN_ID,
+        {"citizen_id": form_data.username},
+        shard=models.shard_for_citizen_id(form_data.username),
     )
-    user = result.one_or_none()
 
-    # If not found, try to find by phone_number
+    # If not found, try to find by phone_number, which can be on any shard
     if not user:
-        result = await session.exec(
-            select(models.DBUser).where(models.DBUser.phone_number == form_data.username)
+        user = await models.find_user(
+            session,
+            models.statements.USER_BY_PHONE_NUMBER,
+            {"phone_number": form_data.username},
         )
-        user = result.one_or_none()
 
-    print("user", user)
+    # End the lookup's transaction, handing the connection back before the
+    # slow password check, so a login does not hold the SQLite profile's only
+    # writer; a rehash takes it again
+    await session.commit()
 
     if not user:
+        logger.debug("Login for unknown user %s", form_data.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect citizen ID/phone number or password",
@@ -54,27 +70,113 @@ async def authentication(
             detail="Incorrect citizen ID/phone number or password",
         )
 
-    user.last_login_date = datetime.datetime.now()
-    session.add(user)
-    await session.commit()
-    await session.refresh(user)
+    # Upgrade hashes made with an older algorithm or cost while we know the password
+    if user.password_needs_rehash():
+        await user.set_password(form_data.password)
+        async with models.shard_session(
+            session, models.shard_for_user(user.id)
+        ) as shard_session:
+            shard_session.add(user)
+            await shard_session.commit()
+
+    # Written in batches by the background flush started in lifespan
+    logged_in_at = datetime.datetime.now()
+    last_login.buffer.record(user.id, logged_in_at)
+
+    # Every login starts a new refresh-token family
+    family_id = security.new_token_id()
+    refresh_token_id = security.new_token_id()
+    await token_store.start_family(family_id, refresh_token_id)
+
+    return issue_token(user, family_id, refresh_token_id, logged_in_at)
+
+
+@router.post("/token/refresh")
+async def refresh_token(
+    token_request: models.RefreshTokenRequest,
+    session: Annotated[models.AsyncSession, Depends(models.get_session)],
+) -> models.Token:
+    """Exchange a refresh token for a new token pair without re-entering the password"""
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        payload = security.decode_refresh_token(token_request.refresh_token)
+    except jwt.InvalidTokenError:
+        raise credentials_exception
+
+    user_id = int(payload["sub"])
+    async with models.shard_session(
+        session, models.shard_for_user(user_id)
+    ) as shard_session:
+        user = await shard_session.get(models.DBUser, user_id)
+    if user is None or payload.get("tv", 0) != user.token_version:
+        await token_store.revoke_family(payload["fid"])
+        raise credentials_exception
 
+    new_token_id = security.new_token_id()
+    if not await token_store.rotate(payload["fid"], payload["jti"], new_token_id):
+        raise credentials_exception
+
+    return issue_token(user, payload["fid"], new_token_id, datetime.datetime.now())
+
+
+@router.post("/logout")
+async def logout(
+    payload: Annotated[dict, Depends(deps.get_token_payload)],
+    logout_request: models.LogoutRequest | None = None,
+) -> dict:
+    """Revoke the current access token and, if given, its refresh-token family"""
+    if payload.get("jti"):
+        await revocation.get_store().revoke(payload["jti"], payload["exp"])
+
+    if logout_request and logout_request.refresh_token:
+        try:
+            refresh_payload = security.decode_refresh_token(
+                logout_request.refresh_token
+            )
+        except jwt.InvalidTokenError:
+            refresh_payload = None
+
+        if refresh_payload and refresh_payload["sub"] == payload["sub"]:
+            await token_store.revoke_family(refresh_payload["fid"])
+
+    return {"message": "Logged out successfully"}
+
+
+def issue_token(
+    user: models.DBUser,
+    family_id: str,
+    refresh_token_id: str,
+    issued_at: datetime.datetime,
+) -> models.Token:
     access_token_expires = datetime.timedelta(
         minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
     )
+    refresh_token_expires = datetime.timedelta(
+        minutes=settings.REFRESH_TOKEN_EXPIRE_MINUTES
+    )
+
     return models.Token(
         access_token=security.create_access_token(
-            data={"sub": user.id},
+            data={"sub": user.id, "tv": user.token_version},
             expires_delta=access_token_expires,
         ),
         refresh_token=security.create_refresh_token(
-            data={"sub": user.id},
-            expires_delta=access_token_expires,
+            data={
+                "sub": user.id,
+                "tv": user.token_version,
+                "jti": refresh_token_id,
+                "fid": family_id,
+            },
+            expires_delta=refresh_token_expires,
         ),
         token_type="Bearer",
         scope="",
         expires_in=settings.ACCESS_TOKEN_EXPIRE_MINUTES,
         expires_at=datetime.datetime.now() + access_token_expires,
-        issued_at=user.last_login_date,
+        issued_at=issued_at,
         user_id=user.id,
-    )
\ No newline at end of file
+    )
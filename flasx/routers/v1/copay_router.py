@@ -0,0 +1,91 @@
+from fastapi import APIRouter, Depends
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from typing import Annotated
+
+import numpy as np
+
+from flasx.core import config
+from flasx.core import copay
+from flasx.core import deps
+from flasx.core import encoding
+from flasx import models
+
+router = APIRouter(
+    prefix="/copay",
+    tags=["copay"],
+    route_class=encoding.NegotiatedRoute,
+)
+
+settings = config.get_settings()
+
+
+@router.post("/calculate")
+async def calculate(
+    copay_request: models.CopayRequest,
+    session: Annotated[AsyncSession, Depends(models.get_read_session)],
+    current_user: models.User = Depends(deps.get_current_user),
+) -> models.CopayResult:
+    """Apply province rates, target-province eligibility and per-user caps to a batch of expense lines"""
+    lines = copay_request.lines
+    # Lines of other users reveal their target provinces: administrators only
+    if any(line.user_id != current_user.id for line in lines):
+        await deps.get_current_active_superuser(current_user)
+
+    user_ids = np.fromiter((line.user_id for line in lines), np.int64, len(lines))
+    province_ids = np.fromiter(
+        (line.province_id for line in lines), np.int64, len(lines)
+    )
+    amounts = np.fromiter((line.amount for line in lines), np.float64, len(lines))
+    dates = np.array([line.date for line in lines], dtype="datetime64[D]")
+
+    result = await session.exec(models.statements.PROVINCE_RATES)
+    rates = copay.rate_vector(dict(result.all()))
+
+    params = {"user_ids": np.unique(user_ids).tolist()}
+
+    async def load_targets(shard_session: AsyncSession) -> list:
+        result = await shard_session.exec(
+            models.statements.TARGET_PROVINCES_OF_USERS, params=params
+        )
+        return result.all()
+
+    shard_targets = await models.gather_shards(session, load_targets)
+    targets = np.array(
+        [row for rows in shard_targets for row in rows], dtype=np.int64
+    ).reshape(-1, 2)
+
+    calculation = copay.calculate(
+        user_ids,
+        province_ids,
+        amounts,
+        dates,
+        rates,
+        targets[:, 0],
+        targets[:, 1],
+        max_reduction_per_user=settings.COPAY_MAX_REDUCTION_PER_USER,
+        program_start=settings.COPAY_PROGRAM_START,
+        program_end=settings.COPAY_PROGRAM_END,
+    )
+
+    reductions = np.round(calculation.reductions, 2).tolist()
+    return models.CopayResult(
+        lines=[
+            models.CopayLine(
+                tax_reduction_rate=rate, eligible=eligible, reduction=reduction
+            )
+            for rate, eligible, reduction in zip(
+                calculation.rates.tolist(), calculation.eligible.tolist(), reductions
+            )
+        ],
+        users=[
+            models.CopayUserTotal(user_id=user_id, reduction=round(total, 2))
+            for user_id, total in zip(
+                calculation.user_ids.tolist(), calculation.user_totals.tolist()
+            )
+        ],
+        total_lines=len(lines),
+        eligible_lines=calculation.eligible_lines,
+        total_amount=round(float(amounts.sum()), 2),
+        total_reduction=round(calculation.total_reduction, 2),
+    )
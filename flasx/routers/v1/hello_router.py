@@ -1,7 +1,12 @@
 from fastapi import APIRouter
 
+from flasx.core import encoding
 
-router = APIRouter(prefix="/hello", tags=["hello"])
+router = APIRouter(
+    prefix="/hello",
+    tags=["hello"],
+    route_class=encoding.NegotiatedRoute,
+)
 
 
 @router.get(
@@ -1,28 +1,207 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
 from sqlmodel.ext.asyncio.session import AsyncSession
-from sqlmodel import select
 
 from typing import Annotated
+import dataclasses
 
+from flasx.core import broadcast
+from flasx.core import config
 from flasx.core import deps
+from flasx.core import encoding
+from flasx.core import province_distances
+from flasx.core import province_search
+from flasx.core import quota
+from flasx.core import response_cache
+from flasx.core import singleflight
 from flasx import models
 
-router = APIRouter(prefix="/provinces", tags=["provinces"])
+router = APIRouter(
+    prefix="/provinces",
+    tags=["provinces"],
+    route_class=encoding.NegotiatedRoute,
+)
+
+settings = config.get_settings()
+
+# Bumped on every catalog change, so concurrent catalog loads only coalesce
+# with a load of the same catalog version. Changes made on other workers
+# only show in the shared version, see response_cache.catalog_version
+catalog_version = 0
+
+
+async def invalidate_catalog():
+    global catalog_version
+    catalog_version += 1
+    province_search.set_index(None)
+    province_distances.set_distances(None)
+    # In the shared cache, so other workers' cached responses go stale too
+    await response_cache.bump_catalog_version()
+
+
+async def load_catalog(
+    session: AsyncSession, shared_version: int = 0
+) -> tuple[models.DBProvince, ...]:
+    """All provinces, shared between concurrent callers
+
+    Callers that keep what they build from it pass the shared catalog
+    version they read first, so they never join a load begun before a
+    change made on another worker.
+    """
+
+    async def load():
+        result = await session.exec(models.statements.ALL_PROVINCES)
+        return tuple(result.all())
+
+    return await singleflight.get_group().do(
+        ("catalog", catalog_version, shared_version), load
+    )
 
 
 @router.get("/")
 async def get_all(
-    session: Annotated[AsyncSession, Depends(models.get_session)],
+    session: Annotated[AsyncSession, Depends(models.get_read_session)],
 ) -> models.ProvinceList:
-    result = await session.exec(select(models.DBProvince))
-    provinces = result.all()
+    provinces = await load_catalog(session)
     return models.ProvinceList(provinces=provinces)
 
 
+@router.get("/search")
+async def search(
+    session: Annotated[AsyncSession, Depends(models.get_read_session)],
+    q: Annotated[str, Query(min_length=1, max_length=100)],
+    limit: Annotated[int, Query(ge=1, le=77)] = 10,
+) -> models.ProvinceSearchResults:
+    """Autocomplete province names in English or Thai, tolerating accents and typos"""
+    index = await get_search_index(session)
+    return models.ProvinceSearchResults(
+        query=q,
+        results=[
+            models.ProvinceSearchResult(
+                id=entry.id,
+                name=entry.name,
+                name_th=entry.name_th,
+                tax_reduction_rate=entry.tax_reduction_rate,
+                tier=entry.tier,
+                score=score,
+            )
+            for entry, score in index.search(q, limit)
+        ],
+    )
+
+
+@router.get("/feed", response_class=StreamingResponse)
+async def feed() -> StreamingResponse:
+    """Stream catalog changes and target-province selection deltas as server-sent events"""
+    return StreamingResponse(
+        stream_feed(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def stream_feed():
+    # Subscribed once streaming starts, so the finally below always runs
+    subscription = broadcast.get_broadcaster().subscribe()
+    try:
+        # Ask clients to reconnect after 3s if the stream drops
+        yield b"retry: 3000\n\n"
+        while True:
+            message = await subscription.get(settings.FEED_KEEPALIVE_SECONDS)
+            # A comment line keeps proxies from closing an idle stream
+            yield message if message is not None else b": keep-alive\n\n"
+    finally:
+        broadcast.get_broadcaster().unsubscribe(subscription)
+
+
+async def get_search_index(
+    session: AsyncSession,
+) -> province_search.ProvinceSearchIndex:
+    """Return the search index, building it from the catalog on first use
+
+    Rebuilt when another worker changed the catalog since it was built.
+    """
+    version = await response_cache.catalog_version()
+    index = province_search.get_index()
+    if index is None or index.catalog_version < version:
+        index = province_search.build_index(
+            await load_catalog(session, version), version
+        )
+        province_search.set_index(index)
+    return index
+
+
+async def get_distances(
+    session: AsyncSession,
+) -> province_distances.ProvinceDistances:
+    """Return the distance matrix, building it from the catalog on first use
+
+    Rebuilt when another worker changed the catalog since it was built.
+    """
+    version = await response_cache.catalog_version()
+    distances = province_distances.get_distances()
+    if distances is None or distances.catalog_version < version:
+        distances = province_distances.build_distances(
+            await load_catalog(session, version), version
+        )
+        province_distances.set_distances(distances)
+    return distances
+
+
+@router.get("/{province_id}/nearby")
+async def get_nearby(
+    province_id: int,
+    session: Annotated[AsyncSession, Depends(models.get_read_session)],
+    tier: str | None = None,
+    limit: Annotated[int, Query(ge=1, le=76)] = 5,
+    max_distance_km: Annotated[float | None, Query(gt=0)] = None,
+    current_user: models.User = Depends(deps.get_current_user),
+) -> models.NearbyProvinces:
+    """Closest alternatives to a province, leaving out the user's home and target provinces"""
+    # Imported here: user_province_router imports this module
+    from .user_province_router import load_user_provinces
+
+    distances = await get_distances(session)
+    if province_id not in distances:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Province not found or has no coordinates",
+        )
+
+    tier_id = None
+    if tier is not None:
+        quota_tier = quota.get_rules().by_name.get(tier)
+        if not quota_tier:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Province tier not found",
+            )
+        tier_id = quota_tier.id
+
+    excluded = set(distances.matching_address(current_user.current_address))
+    excluded.update(p.id for p in await load_user_provinces(session, current_user.id))
+
+    return models.NearbyProvinces(
+        province=dataclasses.asdict(distances.entry(province_id)),
+        results=[
+            models.NearbyProvince(
+                **dataclasses.asdict(entry), distance_km=round(distance_km, 1)
+            )
+            for entry, distance_km in distances.nearby(
+                province_id,
+                limit=limit,
+                tier=tier_id,
+                exclude_ids=excluded,
+                max_distance_km=max_distance_km,
+            )
+        ],
+    )
+
+
 @router.get("/{province_id}")
 async def get(
     province_id: int,
-    session: Annotated[AsyncSession, Depends(models.get_session)],
+    session: Annotated[AsyncSession, Depends(models.get_read_session)],
 ) -> models.Province:
     province = await session.get(models.DBProvince, province_id)
     if not province:
@@ -36,10 +215,10 @@ async def get(
 @router.get("/name/{province_name}")
 async def get_by_name(
     province_name: str,
-    session: Annotated[AsyncSession, Depends(models.get_session)],
+    session: Annotated[AsyncSession, Depends(models.get_read_session)],
 ) -> models.Province:
     result = await session.exec(
-        select(models.DBProvince).where(models.DBProvince.name == province_name)
+        models.statements.PROVINCE_BY_NAME, params={"name": province_name}
     )
     province = result.one_or_none()
 
@@ -53,23 +232,40 @@ async def get_by_name(
 
 @router.get("/primary/")
 async def get_primary_provinces(
-    session: Annotated[AsyncSession, Depends(models.get_session)],
+    session: Annotated[AsyncSession, Depends(models.get_read_session)],
 ) -> models.ProvinceList:
-    result = await session.exec(
-        select(models.DBProvince).where(models.DBProvince.tax_reduction_rate == 0.50)
-    )
-    provinces = result.all()
-    return models.ProvinceList(provinces=provinces)
+    return await get_tier_provinces("primary", session)
 
 
 @router.get("/secondary/")
 async def get_secondary_provinces(
-    session: Annotated[AsyncSession, Depends(models.get_session)],
+    session: Annotated[AsyncSession, Depends(models.get_read_session)],
 ) -> models.ProvinceList:
-    result = await session.exec(
-        select(models.DBProvince).where(models.DBProvince.tax_reduction_rate == 0.25)
+    return await get_tier_provinces("secondary", session)
+
+
+@router.get("/tier/{tier_name}/")
+async def get_tier_provinces(
+    tier_name: str,
+    session: Annotated[AsyncSession, Depends(models.get_read_session)],
+) -> models.ProvinceList:
+    tier = quota.get_rules().by_name.get(tier_name)
+    if not tier:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Province tier not found",
+        )
+
+    async def load():
+        # On the index of provinces.tier, rather than a scan of the catalog
+        result = await session.exec(
+            models.statements.PROVINCES_BY_TIER, params={"tier": tier.id}
+        )
+        return tuple(result.all())
+
+    provinces = await singleflight.get_group().do(
+        ("tier", tier.id, catalog_version), load
     )
-    provinces = result.all()
     return models.ProvinceList(provinces=provinces)
 
 
@@ -80,37 +276,45 @@ async def update(
     session: Annotated[AsyncSession, Depends(models.get_session)],
     current_user: models.User = Depends(deps.get_current_user),
 ) -> models.Province:
-    province = await session.get(models.DBProvince, province_id)
+    changes = province_update.model_dump(exclude_unset=True)
+    updated_date = models.datetime.datetime.now()
 
-    if not province:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Province not found",
-        )
+    # Every shard holds a copy of the catalog, so the change is made on each
+    # and committed once it succeeded on all of them
+    async def apply(shard_session: AsyncSession) -> models.DBProvince:
+        province = await shard_session.get(models.DBProvince, province_id)
 
-    # Check if new name conflicts with existing province (if name is being changed)
-    if province_update.name != province.name:
-        result = await session.exec(
-            select(models.DBProvince).where(
-                models.DBProvince.name == province_update.name
+        if not province:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Province not found",
             )
-        )
-        existing_province = result.one_or_none()
 
-        if existing_province:
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail="Province name already exists",
+        # Check if new name conflicts with existing province (if it is changed)
+        if province_update.name != province.name:
+            result = await shard_session.exec(
+                models.statements.PROVINCE_BY_NAME,
+                params={"name": province_update.name},
             )
+            existing_province = result.one_or_none()
+
+            if existing_province:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Province name already exists",
+                )
 
-    # Update province fields
-    for field, value in province_update.model_dump(exclude_unset=True).items():
-        setattr(province, field, value)
+        # Update province fields
+        for field, value in changes.items():
+            setattr(province, field, value)
 
-    province.updated_date = models.datetime.datetime.now()
-    session.add(province)
-    await session.commit()
-    await session.refresh(province)
+        province.updated_date = updated_date
+        shard_session.add(province)
+        return province
+
+    province = (await models.write_shards(session, apply))[0]
+    await invalidate_catalog()
+    broadcast.get_broadcaster().record_catalog_change(province.id, "updated")
 
     return province
 
@@ -121,15 +325,19 @@ async def delete(
     session: Annotated[AsyncSession, Depends(models.get_session)],
     current_user: models.User = Depends(deps.get_current_user),
 ) -> dict:
-    province = await session.get(models.DBProvince, province_id)
+    async def apply(shard_session: AsyncSession):
+        province = await shard_session.get(models.DBProvince, province_id)
 
-    if not province:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Province not found",
-        )
+        if not province:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Province not found",
+            )
+
+        await shard_session.delete(province)
 
-    await session.delete(province)
-    await session.commit()
+    await models.write_shards(session, apply)
+    await invalidate_catalog()
+    broadcast.get_broadcaster().record_catalog_change(province_id, "deleted")
 
     return {"message": "Province deleted successfully"}
@@ -1,11 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlmodel.ext.asyncio.session import AsyncSession
-from sqlmodel import select
 from typing import Annotated
 
+from flasx.core import encoding
 from flasx import models
 
-router = APIRouter(tags=["registration"])
+router = APIRouter(
+    tags=["registration"],
+    route_class=encoding.NegotiatedRoute,
+)
 
 
 @router.post("/register")
@@ -13,41 +16,48 @@ async def register_user(
     user_info: models.RegisteredUser,
     session: Annotated[AsyncSession, Depends(models.get_session)],
 ) -> models.User:
+    # New users are placed on a shard by their citizen ID
+    shard = models.shard_for_citizen_id(user_info.citizen_id)
+
     # Check if citizen_id already exists
-    result = await session.exec(
-        select(models.DBUser).where(models.DBUser.citizen_id == user_info.citizen_id)
+    existing_user = await models.find_user(
+        session,
+        models.statements.USER_BY_CITIZEN_ID,
+        {"citizen_id": user_info.citizen_id},
+        shard=shard,
     )
-    existing_user = result.one_or_none()
 
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT, detail="Citizen ID already exists"
         )
 
-    # Check if phone_number already exists
-    result = await session.exec(
-        select(models.DBUser).where(
-            models.DBUser.phone_number == user_info.phone_number
-        )
+    # Check if phone_number already exists, on any shard
+    existing_phone = await models.find_user(
+        session,
+        models.statements.USER_BY_PHONE_NUMBER,
+        {"phone_number": user_info.phone_number},
     )
-    existing_phone = result.one_or_none()
 
     if existing_phone:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT, detail="Phone number already exists"
         )
 
-    # Check if email already exists
-    result = await session.exec(
-        select(models.DBUser).where(models.DBUser.email == user_info.email)
+    # Check if email already exists, on any shard
+    existing_email = await models.find_user(
+        session, models.statements.USER_BY_EMAIL, {"email": user_info.email}
     )
-    existing_email = result.one_or_none()
 
     if existing_email:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT, detail="Email already exists"
         )
 
+    # End the lookups' transaction before the slow hash, so registering does
+    # not hold the SQLite profile's only writer; inserting takes it again
+    await session.commit()
+
     # Create new user
     new_user = models.DBUser(
         citizen_id=user_info.citizen_id,
@@ -61,9 +71,8 @@ async def register_user(
 
     await new_user.set_password(user_info.password)
 
-    session.add(new_user)
-    await session.commit()
-    await session.refresh(new_user)
+    async with models.shard_session(session, shard) as shard_session:
+        await models.insert_user(shard_session, new_user, shard)
 
     return models.User(
         id=new_user.id,
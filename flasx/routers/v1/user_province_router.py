@@ -1,54 +1,130 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlmodel import select
 
-from typing import Annotated
+from typing import Annotated, Awaitable, Callable
 
+from flasx.core import broadcast
 from flasx.core import deps
+from flasx.core import encoding
+from flasx.core import quota
+from flasx.core import response_cache
+from flasx.core import singleflight
 from flasx import models
+from . import province_router
 
-router = APIRouter(prefix="/user-provinces", tags=["user-provinces"])
+router = APIRouter(
+    prefix="/user-provinces",
+    tags=["user-provinces"],
+    route_class=encoding.NegotiatedRoute,
+)
+
+
+async def query_user_provinces(
+    session: AsyncSession, user_id: int
+) -> tuple[models.DBProvince, ...]:
+    result = await session.exec(
+        models.statements.USER_PROVINCES, params={"user_id": user_id}
+    )
+    return tuple(result.all())
+
+
+async def load_user_provinces(
+    session: AsyncSession, user_id: int
+) -> tuple[models.DBProvince, ...]:
+    """The user's provinces, shared between concurrent reads for the same user"""
+    return await singleflight.get_group().do(
+        ("user-provinces", user_id), lambda: query_user_provinces(session, user_id)
+    )
+
+
+async def user_provinces_changed(user_id: int):
+    await response_cache.bump_user_version(user_id)
+    singleflight.get_group().forget(("user-provinces", user_id))
+
+
+async def cached_response(
+    kind: str,
+    media_type: str,
+    user_id: int,
+    render: Callable[[], Awaitable[bytes]],
+) -> Response:
+    """The cached body for the user's current version, rendered on a miss"""
+    responses = response_cache.get_cache()
+    key = (kind, media_type, user_id, *await response_cache.versions(user_id))
+    body = responses.get(key)
+    if body is None:
+        body = await render()
+        responses.put(key, body)
+    return Response(body, media_type=media_type)
 
 
 @router.get("/my-quota")
 async def get_my_quota(
-    session: Annotated[AsyncSession, Depends(models.get_session)],
+    session: Annotated[AsyncSession, Depends(models.get_read_session)],
+    media_type: Annotated[str, Depends(encoding.requested_media_type)],
     current_user: models.User = Depends(deps.get_current_user),
 ) -> models.UserProvinceQuota:
     """Get current user's province quota status"""
-    # Get user's provinces with tax rates
-    result = await session.exec(
-        select(models.DBProvince)
-        .join(models.DBUserProvince)
-        .where(models.DBUserProvince.user_id == current_user.id)
-    )
-    provinces = result.all()
-    
-    primary_count = sum(1 for p in provinces if p.tax_reduction_rate == 0.50)
-    secondary_count = sum(1 for p in provinces if p.tax_reduction_rate == 0.25)
-    
+
+    async def render() -> bytes:
+        provinces = await load_user_provinces(session, current_user.id)
+        return response_cache.render(
+            build_quota([p.tier for p in provinces]),
+            models.UserProvinceQuota,
+            media_type,
+        )
+
+    return await cached_response("my-quota", media_type, current_user.id, render)
+
+
+def build_quota(tier_ids: list[int | None]) -> models.UserProvinceQuota:
+    """Evaluate the quota rules for a user holding provinces of ``tier_ids``"""
+    rules = quota.get_rules()
+    usage = rules.usage(tier_ids)
+    tiers = [
+        models.TierQuota(
+            tier=tier.id,
+            name=tier.name,
+            used=usage[tier.id],
+            remaining=max(0, tier.max_provinces - usage[tier.id]),
+            max_provinces=tier.max_provinces,
+        )
+        for tier in rules.tiers
+    ]
+
+    # Flat fields for the two original tiers, kept for existing clients
+    by_name = {tier.name: tier for tier in tiers}
+    primary = by_name.get("primary")
+    secondary = by_name.get("secondary")
+
     return models.UserProvinceQuota(
-        total_provinces=len(provinces),
-        primary_provinces=primary_count,
-        secondary_provinces=secondary_count,
-        remaining_primary_quota=max(0, 3 - primary_count),
-        remaining_secondary_quota=max(0, 2 - secondary_count),
+        total_provinces=len(tier_ids),
+        primary_provinces=primary.used if primary else 0,
+        secondary_provinces=secondary.used if secondary else 0,
+        remaining_primary_quota=primary.remaining if primary else 0,
+        remaining_secondary_quota=secondary.remaining if secondary else 0,
+        max_primary_quota=primary.max_provinces if primary else 0,
+        max_secondary_quota=secondary.max_provinces if secondary else 0,
+        max_total_quota=rules.max_total_provinces,
+        remaining_total_quota=max(0, rules.max_total_provinces - len(tier_ids)),
+        tiers=tiers,
     )
 
 
 @router.get("/my-provinces")
 async def get_my_provinces(
-    session: Annotated[AsyncSession, Depends(models.get_session)],
+    session: Annotated[AsyncSession, Depends(models.get_read_session)],
+    media_type: Annotated[str, Depends(encoding.requested_media_type)],
     current_user: models.User = Depends(deps.get_current_user),
 ) -> list[models.Province]:
     """Get all provinces assigned to current user"""
-    result = await session.exec(
-        select(models.DBProvince)
-        .join(models.DBUserProvince)
-        .where(models.DBUserProvince.user_id == current_user.id)
-    )
-    provinces = result.all()
-    return provinces
+
+    async def render() -> bytes:
+        provinces = await load_user_provinces(session, current_user.id)
+        return response_cache.render(provinces, list[models.Province], media_type)
+
+    return await cached_response("my-provinces", media_type, current_user.id, render)
 
 
 @router.post("/target-province")
@@ -82,10 +158,8 @@ async def add_target_province(
     
     # Check if user already has this province
     result = await session.exec(
-        select(models.DBUserProvince).where(
-            models.DBUserProvince.user_id == current_user.id,
-            models.DBUserProvince.province_id == province_data.province_id
-        )
+        models.statements.USER_PROVINCE_LINK,
+        params={"user_id": current_user.id, "province_id": province_data.province_id},
     )
     existing = result.one_or_none()
     
@@ -95,29 +169,31 @@ async def add_target_province(
             detail=f"Province '{province.name}' is already your target province",
         )
     
-    # Get current quota status
-    quota = await get_my_quota(session, current_user)
+    # Get current quota status, read fresh rather than shared with other reads
+    rules = quota.get_rules()
+    provinces = await query_user_provinces(session, current_user.id)
+    quota_status = build_quota([p.tier for p in provinces])
     
     # Check total quota
-    if quota.total_provinces >= 5:
+    if quota_status.total_provinces >= rules.max_total_provinces:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Maximum total quota of 5 target provinces reached",
+            detail=f"Maximum total quota of {rules.max_total_provinces} target provinces reached",
         )
     
-    # Check specific quota based on province type
-    is_primary = province.tax_reduction_rate == 0.50
-    
-    if is_primary and quota.remaining_primary_quota <= 0:
+    # Check specific quota based on province tier
+    tier = rules.by_id.get(province.tier)
+    if tier is None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Maximum primary province quota of 3 reached",
+            detail=f"Province '{province.name}' does not belong to any quota tier",
         )
-    
-    if not is_primary and quota.remaining_secondary_quota <= 0:
+
+    tier_quota = next(t for t in quota_status.tiers if t.tier == tier.id)
+    if tier_quota.remaining <= 0:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Maximum secondary province quota of 2 reached",
+            detail=f"Maximum {tier.name} province quota of {tier.max_provinces} reached",
         )
     
     # Add province to user
@@ -127,19 +203,22 @@ async def add_target_province(
     )
     session.add(user_province)
     await session.commit()
+    await user_provinces_changed(current_user.id)
+    broadcast.get_broadcaster().record_selection(province.id, 1)
     
-    province_type = "primary" if is_primary else "secondary"
+    province_type = tier.name
+    remaining_quota = {
+        t.name: t.remaining - (1 if t.tier == tier.id else 0)
+        for t in quota_status.tiers
+    }
+    remaining_quota["total"] = quota_status.total_provinces + 1
     return {
         "message": f"Successfully added {province_type} province '{province.name}' as target province",
         "province_id": province.id,
         "province_name": province.name,
         "province_type": province_type,
         "tax_reduction_rate": province.tax_reduction_rate,
-        "remaining_quota": {
-            "primary": quota.remaining_primary_quota - (1 if is_primary else 0),
-            "secondary": quota.remaining_secondary_quota - (1 if not is_primary else 0),
-            "total": quota.total_provinces + 1
-        }
+        "remaining_quota": remaining_quota,
     }
 
 
@@ -153,10 +232,8 @@ async def remove_target_province(
     
     # Find user-province relationship
     result = await session.exec(
-        select(models.DBUserProvince).where(
-            models.DBUserProvince.user_id == current_user.id,
-            models.DBUserProvince.province_id == province_id
-        )
+        models.statements.USER_PROVINCE_LINK,
+        params={"user_id": current_user.id, "province_id": province_id},
     )
     user_province = result.one_or_none()
     
@@ -169,10 +246,12 @@ async def remove_target_province(
     # Get province info for response
     province = await session.get(models.DBProvince, province_id)
     province_name = province.name if province else "Unknown"
-    province_type = "primary" if province and province.tax_reduction_rate == 0.50 else "secondary"
+    province_type = quota.get_rules().tier_name(province.tier if province else None)
     
     await session.delete(user_province)
     await session.commit()
+    await user_provinces_changed(current_user.id)
+    broadcast.get_broadcaster().record_selection(province_id, -1)
     
     return {
         "message": f"Successfully removed {province_type} province '{province_name}' from target provinces",
@@ -184,29 +263,38 @@ async def remove_target_province(
 
 @router.get("/available-provinces")
 async def get_available_provinces(
-    session: Annotated[AsyncSession, Depends(models.get_session)],
+    session: Annotated[AsyncSession, Depends(models.get_read_session)],
+    media_type: Annotated[str, Depends(encoding.requested_media_type)],
     current_user: models.User = Depends(deps.get_current_user),
 ) -> dict:
     """Get provinces available for user to add based on quota"""
-    
-    # Get current quota
-    quota = await get_my_quota(session, current_user)
-    
-    # Get all provinces
-    all_provinces_result = await session.exec(select(models.DBProvince))
-    all_provinces = all_provinces_result.all()
-    
-    # Get user's current provinces
-    user_provinces_result = await session.exec(
-        select(models.DBUserProvince.province_id).where(
-            models.DBUserProvince.user_id == current_user.id
+
+    async def render() -> bytes:
+        return response_cache.render(
+            await list_available_provinces(session, current_user),
+            media_type=media_type,
         )
+
+    return await cached_response(
+        "available-provinces", media_type, current_user.id, render
     )
-    user_province_ids = [up for up in user_provinces_result.all()]
+
+
+async def list_available_provinces(
+    session: AsyncSession, current_user: models.User
+) -> dict:
+    # Get user's current provinces and quota
+    rules = quota.get_rules()
+    user_provinces = await load_user_provinces(session, current_user.id)
+    quota_status = build_quota([p.tier for p in user_provinces])
+    remaining = {t.tier: t.remaining for t in quota_status.tiers}
+    user_province_ids = {p.id for p in user_provinces}
+    
+    # Get all provinces
+    all_provinces = await province_router.load_catalog(session)
     
     # Filter available provinces
-    available_primary = []
-    available_secondary = []
+    available = {tier.name: [] for tier in rules.tiers}
     excluded_provinces = []
     
     user_address_lower = current_user.current_address.lower()
@@ -228,99 +316,103 @@ async def get_available_provinces(
             })
             continue
             
-        if province.tax_reduction_rate == 0.50 and quota.remaining_primary_quota > 0:
-            available_primary.append(province)
-        elif province.tax_reduction_rate == 0.25 and quota.remaining_secondary_quota > 0:
-            available_secondary.append(province)
+        if remaining.get(province.tier, 0) > 0:
+            available[rules.by_id[province.tier].name].append(province)
     
     return {
-        "quota_status": quota,
+        "quota_status": quota_status,
         "user_address": current_user.current_address,
-        "available_provinces": {
-            "primary": available_primary,
-            "secondary": available_secondary
-        },
+        "available_provinces": available,
         "excluded_provinces": excluded_provinces,
-        "total_available": len(available_primary) + len(available_secondary),
+        "total_available": sum(len(provinces) for provinces in available.values()),
         "total_excluded": len(excluded_provinces)
     }
 
 
+@router.post("/batch")
+async def get_batch_user_provinces(
+    batch: models.BatchUserProvincesRequest,
+    session: Annotated[AsyncSession, Depends(models.get_read_session)],
+    current_user: models.User = Depends(deps.get_current_active_superuser),
+) -> models.BatchUserProvinces:
+    """Get provinces and quota usage of many users at once (admin function)"""
+    user_ids = list(dict.fromkeys(batch.user_ids))
+
+    async def load(shard_session: AsyncSession) -> tuple[dict, dict]:
+        # A shard only finds the requested users that live on it
+        result = await shard_session.exec(
+            models.statements.USER_NAMES_BY_IDS, params={"user_ids": user_ids}
+        )
+        names = {
+            user_id: f"{first_name} {last_name}"
+            for user_id, first_name, last_name in result.all()
+        }
+
+        result = await shard_session.exec(
+            models.statements.PROVINCES_OF_USERS, params={"user_ids": list(names)}
+        )
+        provinces = {user_id: [] for user_id in names}
+        for user_id, province in result.all():
+            provinces[user_id].append(province)
+        return names, provinces
+
+    names = {}
+    provinces = {}
+    for shard_names, shard_provinces in await models.gather_shards(session, load):
+        names.update(shard_names)
+        provinces.update(shard_provinces)
+
+    return models.BatchUserProvinces(
+        users=[
+            models.UserProvincesSummary(
+                user_id=user_id,
+                user_name=names[user_id],
+                provinces=provinces[user_id],
+                quota=build_quota([p.tier for p in provinces[user_id]]),
+            )
+            for user_id in user_ids
+            if user_id in names
+        ],
+        missing_user_ids=[user_id for user_id in user_ids if user_id not in names],
+    )
+
+
 @router.get("/{user_id}/provinces")
 async def get_user_provinces(
     user_id: int,
-    session: Annotated[AsyncSession, Depends(models.get_session)],
+    session: Annotated[AsyncSession, Depends(models.get_read_session)],
     current_user: models.User = Depends(deps.get_current_user),
 ) -> dict:
     """Get provinces assigned to a specific user (admin function)"""
     
-    # Check if target user exists
-    target_user = await session.get(models.DBUser, user_id)
-    if not target_user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found",
-        )
-    
-    # Get user's provinces
-    result = await session.exec(
-        select(models.DBProvince)
-        .join(models.DBUserProvince)
-        .where(models.DBUserProvince.user_id == user_id)
-    )
-    provinces = result.all()
-    
-    primary_provinces = [p for p in provinces if p.tax_reduction_rate == 0.50]
-    secondary_provinces = [p for p in provinces if p.tax_reduction_rate == 0.25]
-    
-    return {
-        "user_id": user_id,
-        "user_name": f"{target_user.first_name} {target_user.last_name}",
-        "total_provinces": len(provinces),
-        "primary_provinces": primary_provinces,
-        "secondary_provinces": secondary_provinces,
-        "quota_usage": {
-            "primary_used": len(primary_provinces),
-            "primary_remaining": max(0, 3 - len(primary_provinces)),
-            "secondary_used": len(secondary_provinces),
-            "secondary_remaining": max(0, 2 - len(secondary_provinces)),
-            "total_used": len(provinces),
-            "total_remaining": max(0, 5 - len(provinces))
-        }
-    }
-    """Get provinces assigned to a specific user (admin function)"""
-    
-    # Check if target user exists
-    target_user = await session.get(models.DBUser, user_id)
-    if not target_user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found",
-        )
-    
-    # Get user's provinces
-    result = await session.exec(
-        select(models.DBProvince)
-        .join(models.DBUserProvince)
-        .where(models.DBUserProvince.user_id == user_id)
-    )
-    provinces = result.all()
+    async with models.shard_session(
+        session, models.shard_for_user(user_id), read=True
+    ) as shard_session:
+        # Check if target user exists
+        target_user = await shard_session.get(models.DBUser, user_id)
+        if not target_user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found",
+            )
+
+        # Get user's provinces
+        provinces = await load_user_provinces(shard_session, user_id)
     
-    primary_provinces = [p for p in provinces if p.tax_reduction_rate == 0.50]
-    secondary_provinces = [p for p in provinces if p.tax_reduction_rate == 0.25]
+    rules = quota.get_rules()
+    usage = rules.usage(p.tier for p in provinces)
     
-    return {
+    response = {
         "user_id": user_id,
         "user_name": f"{target_user.first_name} {target_user.last_name}",
         "total_provinces": len(provinces),
-        "primary_provinces": primary_provinces,
-        "secondary_provinces": secondary_provinces,
-        "quota_usage": {
-            "primary_used": len(primary_provinces),
-            "primary_remaining": max(0, 3 - len(primary_provinces)),
-            "secondary_used": len(secondary_provinces),
-            "secondary_remaining": max(0, 2 - len(secondary_provinces)),
-            "total_used": len(provinces),
-            "total_remaining": max(0, 5 - len(provinces))
-        }
     }
+    quota_usage = {}
+    for tier in rules.tiers:
+        response[f"{tier.name}_provinces"] = [p for p in provinces if p.tier == tier.id]
+        quota_usage[f"{tier.name}_used"] = usage[tier.id]
+        quota_usage[f"{tier.name}_remaining"] = max(0, tier.max_provinces - usage[tier.id])
+    quota_usage["total_used"] = len(provinces)
+    quota_usage["total_remaining"] = max(0, rules.max_total_provinces - len(provinces))
+    response["quota_usage"] = quota_usage
+    return response
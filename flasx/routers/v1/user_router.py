@@ -1,13 +1,18 @@
 from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlmodel.ext.asyncio.session import AsyncSession
-from sqlmodel import select
 
 from typing import Annotated
 
 from flasx.core import deps
+from flasx.core import encoding
+from flasx.core import response_cache
 from flasx import models
 
-router = APIRouter(prefix="/users", tags=["users"])
+router = APIRouter(
+    prefix="/users",
+    tags=["users"],
+    route_class=encoding.NegotiatedRoute,
+)
 
 
 @router.get("/me")
@@ -18,11 +23,14 @@ def get_me(current_user: models.User = Depends(deps.get_current_user)) -> models
 @router.get("/{user_id}")
 async def get(
     user_id: str,
-    session: Annotated[AsyncSession, Depends(models.get_session)],
+    session: Annotated[AsyncSession, Depends(models.get_read_session)],
     current_user: models.User = Depends(deps.get_current_user),
 ) -> models.User:
 
-    user = await session.get(models.DBUser, user_id)
+    async with models.shard_session(
+        session, models.shard_for_user(user_id), read=True
+    ) as shard_session:
+        user = await shard_session.get(models.DBUser, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -37,11 +45,16 @@ async def create(
     session: Annotated[AsyncSession, Depends(models.get_session)],
 ) -> models.User:
 
+    # New users are placed on a shard by their citizen ID
+    shard = models.shard_for_citizen_id(user_info.citizen_id)
+
     # Check if citizen_id already exists
-    result = await session.exec(
-        select(models.DBUser).where(models.DBUser.citizen_id == user_info.citizen_id)
+    user = await models.find_user(
+        session,
+        models.statements.USER_BY_CITIZEN_ID,
+        {"citizen_id": user_info.citizen_id},
+        shard=shard,
     )
-    user = result.one_or_none()
 
     if user:
         raise HTTPException(
@@ -49,11 +62,10 @@ async def create(
             detail="This citizen ID already exists.",
         )
 
-    # Check if email already exists
-    result = await session.exec(
-        select(models.DBUser).where(models.DBUser.email == user_info.email)
+    # Check if email already exists, on any shard
+    existing_email = await models.find_user(
+        session, models.statements.USER_BY_EMAIL, {"email": user_info.email}
     )
-    existing_email = result.one_or_none()
 
     if existing_email:
         raise HTTPException(
@@ -61,11 +73,14 @@ async def create(
             detail="This email already exists.",
         )
 
+    # End the lookups' transaction before the slow hash, so registering does
+    # not hold the SQLite profile's only writer; inserting takes it again
+    await session.commit()
+
     user = models.DBUser.model_validate(user_info)
     await user.set_password(user_info.password)
-    session.add(user)
-    await session.commit()
-    await session.refresh(user)
+    async with models.shard_session(session, shard) as shard_session:
+        await models.insert_user(shard_session, user, shard)
 
     return user
 
@@ -78,24 +93,31 @@ async def change_password(
     current_user: models.User = Depends(deps.get_current_user),
 ) -> dict:
 
-    user = await session.get(models.DBUser, user_id)
-
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Not found this user",
-        )
+    async with models.shard_session(
+        session, models.shard_for_user(user_id)
+    ) as shard_session:
+        user = await shard_session.get(models.DBUser, user_id)
+
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Not found this user",
+            )
+        # Hand the writer back while checking and hashing passwords
+        await shard_session.commit()
+
+        if not await user.verify_password(password_update.current_password):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Incorrect password",
+            )
+
+        await user.set_password(password_update.new_password)
+        # Sign out every session that was opened with the old password
+        user.token_version += 1
+        shard_session.add(user)
+        await shard_session.commit()
 
-    if not await user.verify_password(password_update.current_password):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Incorrect password",
-        )
-
-    await user.set_password(password_update.new_password)
-    session.add(user)
-    await session.commit()
-    
     return {"message": "Password changed successfully"}
 
 
@@ -108,20 +130,37 @@ async def update(
     current_user: models.User = Depends(deps.get_current_user),
 ) -> models.User:
 
-    db_user = await session.get(models.DBUser, user_id)
-
-    if not db_user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Not found this user",
-        )
-
-    # Update user fields
-    for field, value in user_update.model_dump(exclude_unset=True).items():
-        setattr(db_user, field, value)
-    
-    session.add(db_user)
-    await session.commit()
-    await session.refresh(db_user)
-
+    async with models.shard_session(
+        session, models.shard_for_user(user_id)
+    ) as shard_session:
+        db_user = await shard_session.get(models.DBUser, user_id)
+
+        if not db_user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Not found this user",
+            )
+
+        changes = user_update.model_dump(exclude_unset=True)
+        # Sharded, logins by citizen ID look on the shard the citizen ID was
+        # placed on at registration, so it can no longer change
+        if (
+            models.is_sharded()
+            and changes.get("citizen_id", db_user.citizen_id) != db_user.citizen_id
+        ):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Citizen ID cannot be changed",
+            )
+
+        # Update user fields
+        for field, value in changes.items():
+            setattr(db_user, field, value)
+
+        shard_session.add(db_user)
+        await shard_session.commit()
+        await shard_session.refresh(db_user)
+
+    # The address decides which provinces are available
+    await response_cache.bump_user_version(db_user.id)
     return db_user
@@ -4,7 +4,7 @@ from httpx import AsyncClient
 from flasx.main import app
 from sqlmodel import SQLModel
 
-from flasx.models import get_session
+from flasx.models import get_read_session, get_session
 
 from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlalchemy.ext.asyncio import create_async_engine
@@ -50,6 +50,7 @@ async def client(session):
         yield session
 
     app.dependency_overrides[get_session] = get_session_override
+    app.dependency_overrides[get_read_session] = get_session_override
 
     transport = httpx.ASGITransport(app=app)
     async with AsyncClient(
@@ -1,8 +1,15 @@
 import pytest
 import asyncio
+import inspect
 import os
 import tempfile
-from httpx import AsyncClient
+
+# Request handlers must not block the event loop; see flasx.core.loop_debug
+os.environ.setdefault("LOOP_DEBUG", "true")
+# test_user, the first user of every test database, administers
+os.environ.setdefault("ADMIN_USER_IDS", "[1]")
+
+from httpx import ASGITransport, AsyncClient
 from sqlmodel import SQLModel
 from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.orm import sessionmaker
@@ -10,6 +17,8 @@ from sqlmodel.ext.asyncio.session import AsyncSession
 
 from flasx.main import app
 from flasx import models
+from flasx.core import loop_debug
+from flasx.core import response_cache
 
 
 @pytest.fixture(scope="session")
@@ -20,6 +29,41 @@ def event_loop():
     loop.close()
 
 
+@pytest.fixture(autouse=True)
+async def fail_on_blocking_handlers(request):
+    """Fail the test if a request handler blocked the event loop too long."""
+    if not inspect.iscoroutinefunction(request.function) or (
+        request.node.get_closest_marker("blocking_allowed")
+    ):
+        yield
+        return
+
+    monitor = loop_debug.get_monitor()
+    monitor.clear()
+    monitor.start()
+    yield
+    monitor.stop()
+
+    blocked = [call for call in monitor.blocking_calls() if call.route is not None]
+    if blocked:
+        pytest.fail(
+            "\n\n".join(
+                f"{call.route} blocked the event loop for "
+                f"{call.blocked_seconds or monitor.threshold:.3f}s:\n"
+                + "".join(call.stack)
+                for call in blocked
+            ),
+            pytrace=False,
+        )
+
+
+@pytest.fixture(autouse=True)
+def clear_response_cache():
+    """Every test starts with a fresh database, so cached responses are stale."""
+    response_cache.get_cache().clear()
+    response_cache.get_cache().reset_stats()
+
+
 @pytest.fixture(scope="function")
 async def test_engine():
     """Create test database engine with temporary file."""
@@ -60,6 +104,7 @@ def override_get_session(test_session):
         yield test_session
     
     app.dependency_overrides[models.get_session] = _override_get_session
+    app.dependency_overrides[models.get_read_session] = _override_get_session
     yield
     app.dependency_overrides.clear()
 
@@ -67,7 +112,7 @@ def override_get_session(test_session):
 @pytest.fixture
 async def client(override_get_session):
     """Create test client."""
-    async with AsyncClient(app=app, base_url="http://test") as ac:
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
         yield ac
 
 
@@ -133,3 +178,27 @@ async def auth_token(client, test_user):
 def auth_headers(auth_token):
     """Create authorization headers."""
     return {"Authorization": f"Bearer {auth_token}"}
+
+
+@pytest.fixture
+async def citizen_headers(client, test_session, test_user):
+    """Authorization headers of a user who is not an administrator."""
+    user = models.DBUser(
+        email="citizen@example.com",
+        citizen_id="9876543210987",
+        first_name="Citizen",
+        last_name="User",
+        phone_number="0809876543",
+        current_address="Chiang Mai",
+        password=""
+    )
+    await user.set_password("password123")
+    test_session.add(user)
+    await test_session.commit()
+
+    response = await client.post(
+        "/v1/token",
+        data={"username": user.citizen_id, "password": "password123"}
+    )
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
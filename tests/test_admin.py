@@ -0,0 +1,114 @@
+import pytest
+
+from flasx.core import memory
+from flasx.core import profiling
+
+
+async def test_admin_routes_need_an_administrator(client, citizen_headers):
+    response = await client.post("/v1/admin/memory/start", headers=citizen_headers)
+    assert response.status_code == 403
+    assert not memory.get_profiler().enabled
+
+    response = await client.get("/v1/admin/memory/objects", headers=citizen_headers)
+    assert response.status_code == 403
+
+
+async def test_memory_profiling_is_opt_in(client, auth_headers):
+    response = await client.get("/v1/admin/memory", headers=auth_headers)
+    assert response.json()["enabled"] is False
+
+    response = await client.post("/v1/admin/memory/snapshots", headers=auth_headers)
+    assert response.status_code == 409
+
+
+# /admin/memory/objects walks the whole heap while holding the GIL
+@pytest.mark.blocking_allowed
+async def test_memory_snapshots_and_routes(client, test_provinces, auth_headers):
+    response = await client.post("/v1/admin/memory/start", headers=auth_headers)
+    try:
+        assert response.json()["enabled"] is True
+        response = await client.post("/v1/admin/memory/snapshots", headers=auth_headers)
+        first = response.json()
+
+        await client.get("/v1/provinces/", headers=auth_headers)
+        response = await client.post("/v1/admin/memory/snapshots", headers=auth_headers)
+        second = response.json()
+
+        response = await client.get(
+            f"/v1/admin/memory/snapshots/{second['id']}/top",
+            headers=auth_headers,
+            params={"group_by": "traceback", "limit": 5},
+        )
+        sites = response.json()
+        assert 0 < len(sites) <= 5
+        assert sites[0]["traceback"]
+
+        response = await client.get(
+            f"/v1/admin/memory/snapshots/{second['id']}/diff",
+            headers=auth_headers,
+            params={"base": first["id"]},
+        )
+        assert response.status_code == 200
+        assert all(site["size_diff_bytes"] is not None for site in response.json())
+
+        response = await client.get("/v1/admin/memory", headers=auth_headers)
+        assert response.json()["routes"]["GET /v1/provinces/"]["requests"] == 1
+
+        response = await client.get("/v1/admin/memory/objects", headers=auth_headers)
+        body = response.json()
+        assert body["sqlmodel_instances"]["DBProvince"] >= len(test_provinces)
+        assert "revoked_tokens" in body["caches"]
+    finally:
+        response = await client.post("/v1/admin/memory/stop", headers=auth_headers)
+
+    assert response.json() == {
+        "enabled": False,
+        "traced_bytes": 0,
+        "peak_bytes": 0,
+        "snapshots": [],
+        "routes": {},
+    }
+    assert not memory.get_profiler().enabled
+
+
+async def test_profile_requested_by_header(
+    client, tmp_path, monkeypatch, test_provinces, auth_headers
+):
+    monkeypatch.setattr(profiling.settings, "PROFILING_SECRET", "s3cret")
+    monkeypatch.setattr(profiling.get_profile_store(), "directory", str(tmp_path))
+
+    # A wrong secret is served without profiling
+    response = await client.get(
+        "/v1/provinces/", headers={"X-Profile": "guess", "X-Request-ID": "r1"}
+    )
+    assert "x-profile-id" not in response.headers
+
+    response = await client.get(
+        "/v1/user-provinces/available-provinces",
+        headers={**auth_headers, "X-Profile": "s3cret", "X-Request-ID": "slow-1"},
+    )
+    assert response.status_code == 200
+    assert response.headers["x-profile-id"] == "slow-1"
+
+    response = await client.get("/v1/admin/profiles", headers=auth_headers)
+    assert [p["id"] for p in response.json()] == ["slow-1"]
+
+    response = await client.get(
+        "/v1/admin/profiles/slow-1/summary",
+        headers=auth_headers,
+        params={"limit": 500},
+    )
+    assert "get_available_provinces" in response.text
+
+    response = await client.get("/v1/admin/profiles/slow-1", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.content
+
+    response = await client.get("/v1/admin/profiles/..%2Fsecret", headers=auth_headers)
+    assert response.status_code == 404
+
+
+async def test_profiles_need_an_administrator(client, citizen_headers):
+    for path in ("/v1/admin/profiles", "/v1/admin/profiles/slow-1/summary"):
+        response = await client.get(path, headers=citizen_headers)
+        assert response.status_code == 403
@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+import pytest
+
+from flasx.core import admission
+
+
+@pytest.fixture
+def overloaded():
+    controller = admission.get_controller()
+    controller.reset_stats()
+    controller.record_lag(controller.max_lag + 1)
+    yield controller
+    controller.record_lag(0.0)
+    controller.reset_stats()
+
+
+async def test_sheds_low_priority_requests_while_lagging(
+    client, test_provinces, auth_headers, overloaded
+):
+    # Logins hash a password, so they are among the first to go
+    response = await client.post(
+        "/v1/token", data={"username": "1234567890123", "password": "password123"}
+    )
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(overloaded.retry_after)
+
+    response = await client.get("/v1/provinces/")
+    assert response.status_code == 503
+
+    # Probes and signed-in reads still get through
+    assert (await client.get("/health")).status_code == 200
+    response = await client.get("/v1/provinces/", headers=auth_headers)
+    assert response.status_code == 200
+    response = await client.get("/v1/users/me", headers=auth_headers)
+    assert response.status_code == 200
+
+    # ...but not with a token that does not verify
+    response = await client.get(
+        "/v1/provinces/", headers={"Authorization": "Bearer not-a-token"}
+    )
+    assert response.status_code == 503
+
+    response = await client.get("/v1/admin/admission", headers=auth_headers)
+    stats = response.json()
+    assert stats["overloaded"] is True
+    assert stats["shed_total"] == 3
+    assert stats["shed_by_reason"] == {"lag": 3}
+    assert stats["shed_by_route"] == {"GET /v1/provinces/": 2, "POST /v1/token": 1}
+
+
+async def test_admission_stats_need_an_administrator(client, citizen_headers):
+    controller = admission.get_controller()
+    controller.reset_stats()
+    controller.shed_by_reason["lag"] = 1
+
+    response = await client.get("/v1/admin/admission", headers=citizen_headers)
+    assert response.status_code == 403
+    response = await client.delete("/v1/admin/admission", headers=citizen_headers)
+    assert response.status_code == 403
+    assert controller.shed_by_reason == {"lag": 1}
+    controller.reset_stats()
+
+
+async def test_sheds_once_too_many_requests_are_in_flight(client, test_provinces):
+    controller = admission.get_controller()
+    controller.reset_stats()
+    max_in_flight = controller.max_in_flight
+    controller.max_in_flight = 0
+    try:
+        response = await client.get("/v1/provinces/")
+    finally:
+        controller.max_in_flight = max_in_flight
+    assert response.status_code == 503
+    assert controller.shed_by_reason == {"in_flight": 1}
+
+    response = await client.get("/v1/provinces/")
+    assert response.status_code == 200
+    assert controller.in_flight == 0
+
+
+async def test_monitor_measures_event_loop_lag():
+    controller = admission.AdmissionController(
+        max_lag=0.05, max_in_flight=10, retry_after=1
+    )
+    task = asyncio.create_task(controller.monitor(0.01))
+    await asyncio.sleep(0.02)
+    # Blocks the loop, as an inline bcrypt hash would
+    time.sleep(0.1)
+    await asyncio.sleep(0.02)
+    task.cancel()
+
+    assert controller.max_lag_seen >= 0.08
@@ -0,0 +1,268 @@
+import time
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from flasx import models
+from flasx.core import last_login
+from flasx.core import passwords
+from flasx.core.revocation import RevocationStore
+from flasx.main import app
+
+
+async def login(client, test_user):
+    response = await client.post(
+        "/v1/token",
+        data={"username": test_user.citizen_id, "password": "password123"},
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+async def test_refresh_token_issues_new_pair(client, test_user):
+    tokens = await login(client, test_user)
+
+    response = await client.post(
+        "/v1/token/refresh", json={"refresh_token": tokens["refresh_token"]}
+    )
+    assert response.status_code == 200
+    refreshed = response.json()
+    assert refreshed["user_id"] == test_user.id
+    assert refreshed["refresh_token"] != tokens["refresh_token"]
+
+    response = await client.get(
+        "/v1/users/me",
+        headers={"Authorization": f"Bearer {refreshed['access_token']}"},
+    )
+    assert response.status_code == 200
+
+
+async def test_refresh_token_reuse_revokes_family(client, test_user):
+    tokens = await login(client, test_user)
+
+    first = await client.post(
+        "/v1/token/refresh", json={"refresh_token": tokens["refresh_token"]}
+    )
+    assert first.status_code == 200
+
+    # Replaying the rotated token is rejected and burns the newer one too
+    replay = await client.post(
+        "/v1/token/refresh", json={"refresh_token": tokens["refresh_token"]}
+    )
+    assert replay.status_code == 401
+
+    second = await client.post(
+        "/v1/token/refresh", json={"refresh_token": first.json()["refresh_token"]}
+    )
+    assert second.status_code == 401
+
+
+async def test_refresh_token_is_not_an_access_token(client, test_user):
+    tokens = await login(client, test_user)
+
+    response = await client.get(
+        "/v1/users/me",
+        headers={"Authorization": f"Bearer {tokens['refresh_token']}"},
+    )
+    assert response.status_code == 401
+
+    response = await client.post(
+        "/v1/token/refresh", json={"refresh_token": tokens["access_token"]}
+    )
+    assert response.status_code == 401
+
+
+async def test_logout_revokes_tokens(client, test_user):
+    tokens = await login(client, test_user)
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+
+    response = await client.post(
+        "/v1/logout", headers=headers, json={"refresh_token": tokens["refresh_token"]}
+    )
+    assert response.status_code == 200
+
+    response = await client.get("/v1/users/me", headers=headers)
+    assert response.status_code == 401
+
+    response = await client.post(
+        "/v1/token/refresh", json={"refresh_token": tokens["refresh_token"]}
+    )
+    assert response.status_code == 401
+
+
+async def test_change_password_revokes_all_tokens(client, test_user):
+    first = await login(client, test_user)
+    second = await login(client, test_user)
+
+    response = await client.put(
+        f"/v1/users/{test_user.id}/change_password",
+        headers={"Authorization": f"Bearer {first['access_token']}"},
+        json={"current_password": "password123", "new_password": "password456"},
+    )
+    assert response.status_code == 200
+
+    for tokens in (first, second):
+        response = await client.get(
+            "/v1/users/me",
+            headers={"Authorization": f"Bearer {tokens['access_token']}"},
+        )
+        assert response.status_code == 401
+
+        response = await client.post(
+            "/v1/token/refresh", json={"refresh_token": tokens["refresh_token"]}
+        )
+        assert response.status_code == 401
+
+
+async def test_revocation_store_with_bloom_filter():
+    store = RevocationStore(use_bloom_filter=True, bloom_capacity=1000)
+    await store.revoke("revoked", time.time() + 60)
+    await store.revoke("expired", time.time() - 1)
+
+    assert store.is_revoked("revoked")
+    assert not store.is_revoked("expired")
+    assert not store.is_revoked("never-revoked")
+    assert len(store) == 1
+
+
+async def test_login_rehashes_legacy_password(client, test_session, test_user):
+    test_user.password = passwords.hash_bcrypt("password123", rounds=4)
+    test_session.add(test_user)
+    await test_session.commit()
+    assert test_user.password_needs_rehash()
+
+    tokens = await login(client, test_user)
+
+    await test_session.refresh(test_user)
+    assert passwords.identify(test_user.password) == passwords.current_scheme()
+
+    response = await client.get(
+        "/v1/admin/password-hashes",
+        headers={"Authorization": f"Bearer {tokens['access_token']}"},
+    )
+    assert response.status_code == 200
+    assert response.json()["needs_rehash"] == 0
+
+
+async def test_password_hash_stats_need_an_administrator(client, citizen_headers):
+    response = await client.get("/v1/admin/password-hashes", headers=citizen_headers)
+    assert response.status_code == 403
+
+
+@pytest.fixture
+async def profile_client(tmp_path):
+    """A client on a file database, so with the SQLite profile's one writer."""
+    models.configure_engines(f"sqlite+aiosqlite:///{tmp_path / 'profile.db'}")
+    await models.create_db_and_tables()
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        yield client
+    await models.close_db()
+
+
+@pytest.fixture
+def writer_checkouts(monkeypatch):
+    """Writer connections checked out at each password hash or check."""
+    checked_out = []
+    for name in ("get_encrypted_password", "verify_password"):
+
+        async def counted(self, plain_password, original=getattr(models.DBUser, name)):
+            checked_out.append(models.engine.pool.checkedout())
+            return await original(self, plain_password)
+
+        monkeypatch.setattr(models.DBUser, name, counted)
+    return checked_out
+
+
+async def register_on(client) -> dict:
+    response = await client.post(
+        "/v1/register",
+        json={
+            "email": "test@example.com",
+            "citizen_id": "1234567890123",
+            "first_name": "Test",
+            "last_name": "User",
+            "phone_number": "0801234567",
+            "current_address": "Bangkok",
+            "password": "password123",
+        },
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+async def test_register_hashes_without_holding_the_writer(
+    profile_client, writer_checkouts
+):
+    await register_on(profile_client)
+    assert writer_checkouts == [0]
+
+
+async def test_login_verifies_without_holding_the_writer(
+    profile_client, writer_checkouts
+):
+    await register_on(profile_client)
+    writer_checkouts.clear()
+
+    response = await profile_client.post(
+        "/v1/token", data={"username": "1234567890123", "password": "password123"}
+    )
+    assert response.status_code == 200
+    assert writer_checkouts == [0]
+
+
+async def test_change_password_hashes_without_holding_the_writer(
+    profile_client, writer_checkouts
+):
+    user = await register_on(profile_client)
+    response = await profile_client.post(
+        "/v1/token", data={"username": "1234567890123", "password": "password123"}
+    )
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    writer_checkouts.clear()
+
+    response = await profile_client.put(
+        f"/v1/users/{user['id']}/change_password",
+        headers=headers,
+        json={"current_password": "password123", "new_password": "password456"},
+    )
+    assert response.status_code == 200
+    # The check of the current password, then the new hash
+    assert writer_checkouts == [0, 0]
+
+
+def test_scrypt_hashes_verify():
+    hashed = passwords.hash_scrypt("password123", log2_n=10, r=8, p=1)
+
+    assert passwords.verify_password("password123", hashed)
+    assert not passwords.verify_password("wrong", hashed)
+    assert passwords.identify(hashed) == "scrypt:ln=10,r=8,p=1"
+
+
+async def test_last_login_is_buffered_and_flushed(client, test_session, test_user):
+    await login(client, test_user)
+    await test_session.refresh(test_user)
+    assert test_user.last_login_date is None
+    assert test_user.id in last_login.buffer._pending
+
+    assert await last_login.buffer.flush(test_session) >= 1
+    await test_session.refresh(test_user)
+    assert test_user.last_login_date is not None
+    assert len(last_login.buffer) == 0
+
+
+async def test_prebuilt_statements_hit_compiled_cache(
+    client, test_engine, test_user, auth_headers
+):
+    models.statements.track("test", test_engine)
+    try:
+        for _ in range(2):
+            await login(client, test_user)
+
+        response = await client.get("/v1/admin/statement-cache", headers=auth_headers)
+        stats = response.json()["engines"]["test"]
+        assert stats["hits"] >= 1
+        assert stats["size"] == 500
+    finally:
+        models.statements.untrack_all()
@@ -0,0 +1,125 @@
+import asyncio
+import datetime
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from flasx.core import budget
+
+
+@pytest.fixture
+def session_factory(test_engine):
+    return sessionmaker(test_engine, class_=AsyncSession, expire_on_commit=False)
+
+
+@pytest.fixture
+def pools(session_factory):
+    pools = budget.BudgetPools(session_factory, lease_amount=1_000)
+    budget.set_pools(pools)
+    yield pools
+    budget.set_pools(None)
+
+
+async def test_concurrent_reservations_never_exceed_the_cap(
+    session_factory, test_provinces, pools
+):
+    krabi = test_provinces[2]
+    await pools.set_budget(krabi.id, 10_000)
+    # Two workers leasing from the same budget
+    workers = [pools, budget.BudgetPools(session_factory, lease_amount=1_000)]
+
+    async def claim(worker: budget.BudgetPools):
+        reservation = await worker.reserve(krabi.id, 300)
+        if reservation is not None:
+            await asyncio.sleep(0)
+            worker.commit(reservation)
+        return reservation
+
+    reservations = await asyncio.gather(
+        *(claim(workers[i % 2]) for i in range(100))
+    )
+    granted = [r for r in reservations if r is not None]
+    # At most what fits, less what is stranded in each worker's last lease
+    assert 32 <= len(granted) <= 33
+    # A lease per 1,000 satang or so, not a database write per reservation
+    assert sum(worker.allotment(krabi.id).leases for worker in workers) <= 12
+
+    for worker in workers:
+        await worker.reconcile(hand_back_all=True)
+    [row] = await pools.load_budgets()
+    assert row.spent == len(granted) * 300 <= row.cap
+    assert row.leased == row.spent
+
+
+async def test_reserve_commit_release_and_reconcile(test_provinces, pools):
+    krabi = test_provinces[2]
+    today = datetime.date(2025, 7, 1)
+    assert await pools.reserve(krabi.id, 100) is None
+    await pools.set_budget(krabi.id, 5_000, day=today)
+
+    first = await pools.reserve(krabi.id, 400, day=today)
+    second = await pools.reserve(krabi.id, 400, day=today)
+    allotment = pools.allotment(krabi.id, "2025-07-01")
+    assert (allotment.available, allotment.reserved, allotment.leases) == (200, 800, 1)
+
+    assert pools.commit(first)
+    assert pools.release(second)
+    assert not pools.commit(first)
+    assert not pools.release(second)
+    assert (allotment.available, allotment.reserved, allotment.committed) == (
+        600,
+        0,
+        400,
+    )
+
+    # Reserved from since the last run, so one lease worth is kept
+    assert await pools.reconcile() == 1
+    [row] = await pools.load_budgets()
+    assert (row.period, row.leased, row.spent) == ("2025-07-01", 1_000, 400)
+
+    # Idle since, so the rest goes back
+    await pools.reconcile()
+    [row] = await pools.load_budgets()
+    assert (row.leased, row.spent, allotment.available) == (400, 400, 0)
+
+    # The daily budget does not cover the rest of the program
+    assert await pools.reserve(krabi.id, 100) is None
+    assert await pools.reserve(krabi.id, 4_601, day=today) is None
+    assert await pools.reserve(krabi.id, 4_600, day=today) is not None
+
+
+async def test_admin_budgets(client, test_provinces, auth_headers, pools):
+    krabi = test_provinces[2]
+    response = await client.put(
+        f"/v1/admin/budgets/{krabi.id}", headers=auth_headers, json={"cap": 50}
+    )
+    assert response.status_code == 200
+    assert response.json()["cap"] == 50.0
+
+    await pools.reserve(krabi.id, budget.to_satang(20))
+    response = await client.get("/v1/admin/budgets", headers=auth_headers)
+    [row] = response.json()
+    # Leased what the reservation needed, as that is more than a lease
+    assert (row["leased"], row["available"], row["reserved"]) == (20.0, 0.0, 20.0)
+
+    response = await client.put(
+        f"/v1/admin/budgets/{krabi.id}", headers=auth_headers, json={"cap": 10}
+    )
+    assert response.status_code == 409
+    response = await client.put(
+        "/v1/admin/budgets/999", headers=auth_headers, json={"cap": 10}
+    )
+    assert response.status_code == 404
+
+
+async def test_admin_budgets_need_an_administrator(
+    client, test_provinces, citizen_headers, pools
+):
+    response = await client.put(
+        f"/v1/admin/budgets/{test_provinces[2].id}",
+        headers=citizen_headers,
+        json={"cap": 50},
+    )
+    assert response.status_code == 403
+    assert await pools.load_budgets() == []
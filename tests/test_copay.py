@@ -0,0 +1,80 @@
+import datetime
+
+import numpy as np
+
+from flasx import models
+from flasx.core import copay
+
+
+def test_calculate_applies_eligibility_and_cap():
+    rates = copay.rate_vector({1: 0.50, 2: 0.25, 3: 0.25})
+    result = copay.calculate(
+        user_ids=[1, 1, 1, 2, 2],
+        province_ids=[1, 2, 3, 1, 99],
+        amounts=[1000.0, 1000.0, 4000.0, 400.0, 500.0],
+        dates=np.array(
+            ["2025-07-03", "2025-07-01", "2025-07-02", "2025-07-01", "2025-07-01"],
+            dtype="datetime64[D]",
+        ),
+        rates=rates,
+        target_user_ids=[1, 1, 1, 2],
+        target_province_ids=[1, 2, 3, 2],
+        max_reduction_per_user=1000.0,
+    )
+
+    # User 1 consumes the cap by date: 250, then 750 of 1000, then nothing
+    # User 2 never chose province 1, and province 99 does not exist
+    assert result.eligible.tolist() == [True, True, True, False, False]
+    assert result.reductions.tolist() == [0.0, 250.0, 750.0, 0.0, 0.0]
+    assert result.user_totals.tolist() == [1000.0, 0.0]
+
+
+async def test_calculate_endpoint(
+    client, test_session, test_user, test_provinces, auth_headers
+):
+    krabi, lamphun = test_provinces[2], test_provinces[3]
+    test_session.add(models.DBUserProvince(user_id=test_user.id, province_id=krabi.id))
+    await test_session.commit()
+
+    today = datetime.date.today().isoformat()
+    response = await client.post(
+        "/v1/copay/calculate",
+        headers=auth_headers,
+        json={
+            "lines": [
+                {
+                    "user_id": test_user.id,
+                    "province_id": province.id,
+                    "amount": 100,
+                    "date": today,
+                }
+                for province in (krabi, lamphun)
+            ]
+        },
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert [line["reduction"] for line in body["lines"]] == [50.0, 0.0]
+    assert body["total_reduction"] == 50.0
+    assert body["eligible_lines"] == 1
+
+
+async def test_calculate_for_other_users_needs_an_administrator(
+    client, test_user, test_provinces, citizen_headers
+):
+    today = datetime.date.today().isoformat()
+    line = {"province_id": test_provinces[2].id, "amount": 100, "date": today}
+    response = await client.post(
+        "/v1/copay/calculate",
+        headers=citizen_headers,
+        json={"lines": [{**line, "user_id": test_user.id}]},
+    )
+    assert response.status_code == 403
+
+    me = (await client.get("/v1/users/me", headers=citizen_headers)).json()
+    response = await client.post(
+        "/v1/copay/calculate",
+        headers=citizen_headers,
+        json={"lines": [{**line, "user_id": me["id"]}]},
+    )
+    assert response.status_code == 200
@@ -0,0 +1,54 @@
+import msgpack
+
+from flasx.core import encoding
+
+MSGPACK_HEADERS = {"Accept": "application/msgpack"}
+
+
+def test_negotiate_prefers_the_highest_quality():
+    assert encoding.negotiate(None) == encoding.JSON
+    assert encoding.negotiate("*/*") == encoding.JSON
+    assert encoding.negotiate("application/x-msgpack") == encoding.MSGPACK
+    assert encoding.negotiate("application/json, application/msgpack") == (
+        encoding.JSON
+    )
+    assert encoding.negotiate(
+        "application/json;q=0.5, application/vnd.msgpack"
+    ) == encoding.MSGPACK
+    assert encoding.negotiate("text/html, application/msgpack;q=0") == (
+        encoding.JSON
+    )
+
+
+async def test_msgpack_carries_the_json_data(client, test_provinces, auth_headers):
+    json_response = await client.get("/v1/provinces/", headers=auth_headers)
+    response = await client.get(
+        "/v1/provinces/", headers={**auth_headers, **MSGPACK_HEADERS}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == encoding.MSGPACK
+    assert response.headers["vary"] == "Accept"
+    assert msgpack.unpackb(response.content) == json_response.json()
+    assert len(response.content) < len(json_response.content)
+
+    # Errors stay JSON
+    response = await client.get(
+        "/v1/provinces/999", headers={**auth_headers, **MSGPACK_HEADERS}
+    )
+    assert response.status_code == 404
+    assert response.json()["detail"]
+
+
+async def test_cached_responses_are_kept_per_format(
+    client, test_provinces, auth_headers
+):
+    for _ in range(2):
+        json_response = await client.get(
+            "/v1/user-provinces/available-provinces", headers=auth_headers
+        )
+        response = await client.get(
+            "/v1/user-provinces/available-provinces",
+            headers={**auth_headers, **MSGPACK_HEADERS},
+        )
+        assert response.headers["content-type"] == encoding.MSGPACK
+        assert msgpack.unpackb(response.content) == json_response.json()
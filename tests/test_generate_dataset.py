@@ -0,0 +1,45 @@
+import sqlite3
+
+from flasx.commands import generate_dataset
+from flasx.core import quota
+
+
+def test_citizen_ids_are_valid_and_unique():
+    ids = generate_dataset.citizen_ids(generate_dataset.np.arange(1, 5001))
+    assert len(set(ids)) == 5000
+    assert all(generate_dataset.is_valid_citizen_id(i) for i in ids)
+    assert generate_dataset.is_valid_citizen_id("1101700230708")
+    assert not generate_dataset.is_valid_citizen_id("1101700230709")
+
+
+def test_generated_users_respect_quota_rules(tmp_path):
+    path = tmp_path / "dataset.db"
+    users, targets = generate_dataset.generate(
+        f"sqlite+aiosqlite:///{path}", 3000, fill=0.9, workers=2, chunk_size=1000
+    )
+    assert users == 3000
+
+    rules = quota.get_rules()
+    db = sqlite3.connect(path)
+    rows = db.execute(
+        "SELECT u.id, u.current_address, p.name, p.tier FROM user_provinces up "
+        "JOIN users u ON u.id = up.user_id JOIN provinces p ON p.id = up.province_id"
+    ).fetchall()
+    assert len(rows) == targets
+
+    by_user = {}
+    for user_id, address, name, tier in rows:
+        assert name.lower() not in address.lower()
+        assert address.lower() not in name.lower()
+        by_user.setdefault(user_id, []).append((name, tier))
+
+    for provinces in by_user.values():
+        assert len(provinces) <= rules.max_total_provinces
+        assert len(set(provinces)) == len(provinces)
+        usage = rules.usage(tier for _, tier in provinces)
+        assert all(usage[tier.id] <= tier.max_provinces for tier in rules.tiers)
+
+    # Appends after the existing users
+    assert generate_dataset.generate(f"sqlite:///{path}", 10, workers=1)[0] == 10
+    count = db.execute("SELECT COUNT(DISTINCT citizen_id) FROM users").fetchone()
+    assert count == (3010,)
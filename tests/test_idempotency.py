@@ -0,0 +1,153 @@
+import asyncio
+import uuid
+
+import jwt
+from httpx import ASGITransport, AsyncClient
+from sqlmodel import select
+from starlette.responses import JSONResponse
+
+from flasx import models
+from flasx.core import idempotency
+
+NEW_USER = {
+    "email": "new@example.com",
+    "citizen_id": "1101700230708",
+    "first_name": "New",
+    "last_name": "User",
+    "phone_number": "0812345678",
+    "current_address": "Krabi",
+    "password": "password123",
+}
+
+
+async def test_retried_registration_is_replayed(client):
+    headers = {"Idempotency-Key": uuid.uuid4().hex}
+    first = await client.post("/v1/register", json=NEW_USER, headers=headers)
+    assert first.status_code == 200
+    assert "idempotent-replayed" not in first.headers
+
+    retry = await client.post("/v1/register", json=NEW_USER, headers=headers)
+    assert retry.status_code == 200
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert retry.json() == first.json()
+
+    # Without a key the retry runs again and conflicts
+    response = await client.post("/v1/register", json=NEW_USER)
+    assert response.status_code == 409
+
+    response = await client.post(
+        "/v1/register", json={**NEW_USER, "first_name": "Other"}, headers=headers
+    )
+    assert response.status_code == 422
+
+
+async def test_concurrent_duplicates_wait_for_the_original(
+    client, test_session, test_user, test_provinces, auth_headers
+):
+    headers = {**auth_headers, "Idempotency-Key": uuid.uuid4().hex}
+    responses = await asyncio.gather(
+        *(
+            client.post(
+                "/v1/user-provinces/target-province",
+                headers=headers,
+                json={"province_id": test_provinces[2].id},
+            )
+            for _ in range(3)
+        )
+    )
+
+    assert [r.status_code for r in responses] == [200, 200, 200]
+    assert len({r.text for r in responses}) == 1
+    assert sum("idempotent-replayed" in r.headers for r in responses) == 2
+
+    result = await test_session.exec(
+        select(models.DBUserProvince).where(
+            models.DBUserProvince.user_id == test_user.id
+        )
+    )
+    assert len(result.all()) == 1
+
+
+async def test_forged_token_cannot_replay_another_users_response(
+    client, test_user, test_provinces, auth_headers
+):
+    key = uuid.uuid4().hex
+    body = {"province_id": test_provinces[2].id}
+    response = await client.post(
+        "/v1/user-provinces/target-province",
+        headers={**auth_headers, "Idempotency-Key": key},
+        json=body,
+    )
+    assert response.status_code == 200
+
+    # Right subject, wrong signature
+    forged = jwt.encode({"sub": str(test_user.id)}, "guessed", algorithm="HS256")
+    response = await client.post(
+        "/v1/user-provinces/target-province",
+        headers={"Authorization": f"Bearer {forged}", "Idempotency-Key": key},
+        json=body,
+    )
+    assert response.status_code == 401
+    assert "idempotent-replayed" not in response.headers
+
+
+async def test_key_claimed_again_after_the_lock_expired(monkeypatch):
+    monkeypatch.setattr(idempotency.settings, "IDEMPOTENCY_LOCK_SECONDS", 0.05)
+    releases = [asyncio.Event(), asyncio.Event()]
+    calls = 0
+
+    async def app(scope, receive, send):
+        nonlocal calls
+        call = calls
+        calls += 1
+        await releases[call].wait()
+        await JSONResponse({"call": call})(scope, receive, send)
+
+    headers = {"Idempotency-Key": uuid.uuid4().hex}
+    async with AsyncClient(
+        transport=ASGITransport(app=idempotency.IdempotencyMiddleware(app)),
+        base_url="http://test",
+    ) as client:
+        first = asyncio.create_task(client.post("/v1/register", headers=headers))
+        await asyncio.sleep(0.1)
+        # The first claim expired, so this one runs too
+        second = asyncio.create_task(client.post("/v1/register", headers=headers))
+        await asyncio.sleep(0.01)
+
+        # Each finishes without touching the other's local waiters
+        releases[0].set()
+        assert (await first).json() == {"call": 0}
+        releases[1].set()
+        assert (await second).json() == {"call": 1}
+
+
+async def test_duplicate_runs_itself_when_the_original_fails():
+    release = asyncio.Event()
+    calls = 0
+
+    async def app(scope, receive, send):
+        nonlocal calls
+        call = calls
+        calls += 1
+        if call == 0:
+            await release.wait()
+            await JSONResponse({"call": call}, status_code=503)(scope, receive, send)
+        else:
+            await JSONResponse({"call": call})(scope, receive, send)
+
+    headers = {"Idempotency-Key": uuid.uuid4().hex}
+    async with AsyncClient(
+        transport=ASGITransport(app=idempotency.IdempotencyMiddleware(app)),
+        base_url="http://test",
+    ) as client:
+        first = asyncio.create_task(client.post("/v1/register", headers=headers))
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(client.post("/v1/register", headers=headers))
+        await asyncio.sleep(0.01)
+
+        # The 5xx is not stored, so the waiting duplicate claims the key
+        release.set()
+        assert (await first).status_code == 503
+        response = await second
+        assert (response.status_code, response.json()) == (200, {"call": 1})
+        assert "idempotent-replayed" not in response.headers
@@ -0,0 +1,60 @@
+import asyncio
+import gc
+import time
+
+from flasx.core import loop_debug
+
+
+async def test_blocking_call_is_recorded_with_stack_and_route():
+    monitor = loop_debug.BlockingMonitor(threshold=0.05)
+    monitor.start()
+    try:
+        monitor.track({"type": "http", "method": "GET", "path": "/v1/slow"})
+        await asyncio.sleep(0.02)
+        time.sleep(0.2)
+        await asyncio.sleep(0.05)
+        monitor.untrack()
+    finally:
+        monitor.stop()
+
+    [call] = [c for c in monitor.blocking_calls() if c.route is not None]
+    assert call.route == "GET /v1/slow"
+    assert "time.sleep(0.2)" in "".join(call.stack)
+    assert 0.1 < call.blocked_seconds < 0.5
+
+
+async def test_garbage_collection_is_not_a_blocking_call():
+    monitor = loop_debug.BlockingMonitor(threshold=0.05)
+    monitor.start()
+
+    # After the monitor's own callback, so the sleep happens mid-collection
+    def slow_collection(phase, info):
+        if phase == "start":
+            time.sleep(0.2)
+
+    gc.callbacks.append(slow_collection)
+    try:
+        monitor.track({"type": "http", "method": "GET", "path": "/v1/collecting"})
+        await asyncio.sleep(0.02)
+        gc.collect()
+        await asyncio.sleep(0.05)
+        monitor.untrack()
+    finally:
+        gc.callbacks.remove(slow_collection)
+        monitor.stop()
+
+    assert [c for c in monitor.blocking_calls() if c.route is not None] == []
+
+
+async def test_admin_lists_blocking_calls(client, auth_headers):
+    monitor = loop_debug.get_monitor()
+    await asyncio.sleep(0.02)
+    # Outside any request, so it does not fail the test
+    time.sleep(monitor.threshold * 3)
+    await asyncio.sleep(0.05)
+
+    response = await client.get("/v1/admin/loop/blocking-calls", headers=auth_headers)
+    assert any(
+        call["route"] is None and "time.sleep" in "".join(call["stack"])
+        for call in response.json()
+    )
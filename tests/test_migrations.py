@@ -0,0 +1,131 @@
+import pytest
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlmodel import SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from flasx import models
+from flasx.models import migrations
+
+
+@pytest.fixture
+async def engine(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'old.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    yield engine
+    await engine.dispose()
+
+
+@pytest.fixture
+def session_factory(engine):
+    return sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+
+async def drop_columns(engine, table: str, *columns: str):
+    """Make ``table`` look as an older release created it."""
+    async with engine.begin() as conn:
+        for column in columns:
+            await conn.exec_driver_sql(f"DROP INDEX IF EXISTS ix_{table}_{column}")
+            await conn.exec_driver_sql(f"ALTER TABLE {table} DROP COLUMN {column}")
+
+
+async def test_adds_token_versions(engine, session_factory):
+    async with session_factory() as session:
+        session.add(
+            models.DBUser(
+                email="test@example.com",
+                citizen_id="1234567890123",
+                first_name="Test",
+                last_name="User",
+                phone_number="0801234567",
+                current_address="Bangkok",
+                password="",
+            )
+        )
+        await session.commit()
+    await drop_columns(engine, "users", "token_version")
+
+    assert await migrations.migrate(engine) == ["users.token_version"]
+    async with session_factory() as session:
+        result = await session.exec(select(models.DBUser.token_version))
+        assert result.all() == [0]
+
+    # Already there
+    assert await migrations.migrate(engine) == []
+
+
+async def test_adds_and_backfills_tiers(engine, session_factory):
+    async with session_factory() as session:
+        session.add(models.DBProvince(name="Krabi", tax_reduction_rate=0.50))
+        session.add(models.DBProvince(name="Lampang", tax_reduction_rate=0.25))
+        session.add(models.DBProvince(name="Elsewhere", tax_reduction_rate=0.1))
+        await session.commit()
+    await drop_columns(engine, "provinces", "tier")
+
+    assert "provinces.tier" in await migrations.migrate(engine)
+    async with session_factory() as session:
+        result = await session.exec(
+            models.statements.PROVINCES_BY_TIER, params={"tier": 2}
+        )
+        assert [p.name for p in result.all()] == ["Lampang"]
+        result = await session.exec(
+            select(models.DBProvince.name, models.DBProvince.tier)
+        )
+        assert result.all() == [("Krabi", 1), ("Lampang", 2), ("Elsewhere", None)]
+
+    async with engine.connect() as conn:
+        indexes = await conn.run_sync(
+            lambda sync_conn: inspect(sync_conn).get_indexes("provinces")
+        )
+    assert [index["column_names"] for index in indexes] == [["tier"]]
+
+
+async def test_derives_tiers_again_on_every_start(engine, session_factory):
+    async with session_factory() as session:
+        session.add(models.DBProvince(name="Krabi", tax_reduction_rate=0.50))
+        session.add(models.DBProvince(name="Lampang", tax_reduction_rate=0.25))
+        await session.commit()
+    # Written under rules that tiered these rates differently
+    async with engine.begin() as conn:
+        await conn.exec_driver_sql("UPDATE provinces SET tier = 7")
+
+    assert await migrations.migrate(engine) == []
+    async with session_factory() as session:
+        result = await session.exec(
+            select(models.DBProvince.name, models.DBProvince.tier)
+        )
+        assert result.all() == [("Krabi", 1), ("Lampang", 2)]
+
+
+async def test_adds_thai_names_from_the_catalog(engine, session_factory):
+    async with session_factory() as session:
+        session.add(models.DBProvince(name="Krabi", tax_reduction_rate=0.50))
+        session.add(models.DBProvince(name="Elsewhere", tax_reduction_rate=0.50))
+        await session.commit()
+    await drop_columns(engine, "provinces", "name_th")
+
+    assert await migrations.migrate(engine) == ["provinces.name_th"]
+    async with session_factory() as session:
+        result = await session.exec(
+            select(models.DBProvince.name, models.DBProvince.name_th)
+        )
+        assert result.all() == [("Krabi", "กระบี่"), ("Elsewhere", None)]
+
+
+async def test_adds_coordinates_from_the_catalog(engine, session_factory):
+    async with session_factory() as session:
+        session.add(models.DBProvince(name="Krabi", tax_reduction_rate=0.50))
+        await session.commit()
+    await drop_columns(engine, "provinces", "latitude", "longitude")
+
+    assert await migrations.migrate(engine) == [
+        "provinces.latitude",
+        "provinces.longitude",
+    ]
+    async with session_factory() as session:
+        result = await session.exec(
+            select(models.DBProvince.latitude, models.DBProvince.longitude)
+        )
+        assert result.all() == [(8.0863, 98.9063)]
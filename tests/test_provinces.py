@@ -0,0 +1,236 @@
+import asyncio
+import json
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from flasx import models
+from flasx.core import broadcast
+from flasx.core import province_distances
+from flasx.core import province_search
+from flasx.core import response_cache
+from flasx.routers.v1 import province_router
+
+
+async def test_search_ranks_prefix_typo_and_thai_matches(
+    client, test_session, test_provinces
+):
+    chiang_rai = models.DBProvince(
+        name="Chiang Rai", name_th="เชียงราย", tax_reduction_rate=0.25
+    )
+    test_session.add(chiang_rai)
+    await test_session.commit()
+    province_search.set_index(None)
+
+    response = await client.get("/v1/provinces/search", params={"q": "chiang"})
+    assert response.status_code == 200
+    names = [r["name"] for r in response.json()["results"]]
+    assert names == ["Chiang Mai", "Chiang Rai"]
+
+    response = await client.get("/v1/provinces/search", params={"q": "เชียงราย"})
+    assert response.json()["results"][0]["name"] == "Chiang Rai"
+
+    # Typo and accents
+    response = await client.get("/v1/provinces/search", params={"q": "Lámpnag"})
+    assert response.json()["results"][0]["name"] == "Lampang"
+
+    response = await client.get("/v1/provinces/search", params={"q": "qqqq"})
+    assert response.json()["results"] == []
+
+    province_search.set_index(None)
+
+
+async def test_search_index_follows_catalog_changes_on_other_workers(
+    client, test_session, test_provinces
+):
+    province_search.set_index(None)
+    response = await client.get("/v1/provinces/search", params={"q": "krabi"})
+    assert response.json()["results"][0]["name"] == "Krabi"
+
+    # Another worker renamed Krabi: only the shared catalog version tells
+    krabi = test_provinces[2]
+    krabi.name = "Krabi Town"
+    test_session.add(krabi)
+    await test_session.commit()
+    await response_cache.bump_catalog_version()
+
+    response = await client.get("/v1/provinces/search", params={"q": "krabi"})
+    assert response.json()["results"][0]["name"] == "Krabi Town"
+
+    province_search.set_index(None)
+
+
+COORDINATES = {
+    "Bangkok": (13.7563, 100.5018),
+    "Chiang Mai": (18.7883, 98.9853),
+    "Krabi": (8.0863, 98.9063),
+    "Lamphun": (18.5745, 99.0087),
+    "Lampang": (18.2888, 99.4909),
+}
+
+
+@pytest.fixture
+async def located_provinces(test_session, test_provinces):
+    for province in test_provinces:
+        province.latitude, province.longitude = COORDINATES[province.name]
+        test_session.add(province)
+    await test_session.commit()
+    province_distances.set_distances(None)
+    yield {province.name: province for province in test_provinces}
+    province_distances.set_distances(None)
+
+
+def test_haversine_distances():
+    distances = province_distances.haversine_matrix(
+        np.array([13.7563, 18.7883]), np.array([100.5018, 98.9853])
+    )
+    assert distances[0, 0] == 0
+    assert distances[0, 1] == distances[1, 0]
+    # Bangkok to Chiang Mai, as the crow flies
+    assert 575 < distances[0, 1] < 590
+
+
+async def test_distances_follow_catalog_changes_on_other_workers(
+    client, test_session, located_provinces, auth_headers
+):
+    url = f"/v1/provinces/{located_provinces['Chiang Mai'].id}/nearby"
+    response = await client.get(url, headers=auth_headers, params={"limit": 1})
+    assert [r["name"] for r in response.json()["results"]] == ["Lamphun"]
+
+    # Another worker moved Lamphun south: only the shared catalog version tells
+    lamphun = located_provinces["Lamphun"]
+    lamphun.latitude, lamphun.longitude = COORDINATES["Krabi"]
+    test_session.add(lamphun)
+    await test_session.commit()
+    await response_cache.bump_catalog_version()
+
+    response = await client.get(url, headers=auth_headers, params={"limit": 1})
+    assert [r["name"] for r in response.json()["results"]] == ["Lampang"]
+
+
+async def test_nearby_skips_home_and_selected_provinces(
+    client, located_provinces, auth_headers
+):
+    chiang_mai = located_provinces["Chiang Mai"]
+    url = f"/v1/provinces/{chiang_mai.id}/nearby"
+
+    response = await client.get(url, headers=auth_headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["province"]["name"] == "Chiang Mai"
+    # Bangkok is the user's home province
+    assert [r["name"] for r in body["results"]] == ["Lamphun", "Lampang", "Krabi"]
+    assert body["results"][0]["distance_km"] < 30
+
+    response = await client.get(url, headers=auth_headers, params={"tier": "primary"})
+    assert [r["name"] for r in response.json()["results"]] == ["Krabi"]
+
+    response = await client.get(
+        url, headers=auth_headers, params={"max_distance_km": 100, "limit": 1}
+    )
+    assert [r["name"] for r in response.json()["results"]] == ["Lamphun"]
+
+    response = await client.post(
+        "/v1/user-provinces/target-province",
+        headers=auth_headers,
+        json={"province_id": located_provinces["Lamphun"].id},
+    )
+    assert response.status_code == 200
+    response = await client.get(url, headers=auth_headers)
+    assert [r["name"] for r in response.json()["results"]] == ["Lampang", "Krabi"]
+
+    response = await client.get(url, headers=auth_headers, params={"tier": "none"})
+    assert response.status_code == 404
+    response = await client.get("/v1/provinces/999/nearby", headers=auth_headers)
+    assert response.status_code == 404
+
+
+def feed_data(message: bytes) -> dict:
+    event, data = message.decode().strip().split("\n")
+    assert event == "event: provinces"
+    return json.loads(data.removeprefix("data: "))
+
+
+async def test_feed_streams_batched_updates(client, test_provinces, auth_headers):
+    broadcaster = broadcast.get_broadcaster()
+    broadcaster.flush()
+    stream = province_router.stream_feed()
+    assert await anext(stream) == b"retry: 3000\n\n"
+    next_message = asyncio.ensure_future(anext(stream))
+    await asyncio.sleep(0)
+    assert len(broadcaster) == 1
+
+    krabi = test_provinces[2]
+    for _ in range(2):
+        response = await client.post(
+            "/v1/user-provinces/target-province",
+            headers=auth_headers,
+            json={"province_id": krabi.id},
+        )
+    response = await client.put(
+        f"/v1/provinces/{krabi.id}",
+        headers=auth_headers,
+        json={"name": "Krabi", "tax_reduction_rate": 0.5},
+    )
+    assert response.status_code == 200
+
+    # Nothing is sent until the tick
+    await asyncio.sleep(0)
+    assert not next_message.done()
+    assert broadcaster.flush() == 1
+    assert feed_data(await next_message) == {
+        "selections": {str(krabi.id): 1},
+        "catalog": [{"province_id": krabi.id, "change": "updated"}],
+    }
+
+    await stream.aclose()
+    assert len(broadcaster) == 0
+
+
+async def test_slow_feed_client_is_told_to_resync():
+    broadcaster = broadcast.Broadcaster(queue_size=2)
+    slow, fast = broadcaster.subscribe(), broadcaster.subscribe()
+    for province_id in range(3):
+        broadcaster.record_selection(province_id, 1)
+        broadcaster.flush()
+        await fast.get(timeout=1)
+
+    assert len(slow) == 1
+    assert await slow.get(timeout=1) == broadcast.RESYNC
+    assert await slow.get(timeout=0.01) is None
+
+
+async def test_feed_holds_10k_idle_subscribers():
+    broadcaster = broadcast.get_broadcaster()
+    broadcaster.flush()
+
+    async def consume(stream):
+        async for _ in stream:
+            pass
+
+    # asyncio debug mode keeps a creation traceback for every task
+    asyncio.get_running_loop().set_debug(False)
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        clients = [
+            asyncio.create_task(consume(province_router.stream_feed()))
+            for _ in range(10_000)
+        ]
+        await asyncio.sleep(0.1)
+        used, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert len(broadcaster) == 10_000
+    # Including each client's task, as the server would have one per connection
+    assert (used - before) / len(clients) < 4096
+
+    broadcaster.record_selection(1, 1)
+    assert broadcaster.flush() == 10_000
+
+    for task in clients:
+        task.cancel()
+    await asyncio.gather(*clients, return_exceptions=True)
+    assert len(broadcaster) == 0
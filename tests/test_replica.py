@@ -0,0 +1,78 @@
+import pytest
+from httpx import ASGITransport, AsyncClient
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from flasx import models
+from flasx.models import consistency
+from flasx.core import cache
+from flasx.core import response_cache
+from flasx.main import app
+
+
+@pytest.fixture
+async def replicated_db(tmp_path):
+    """Primary and replica as two database files; replication is done by hand."""
+    models.configure_engines(
+        f"sqlite+aiosqlite:///{tmp_path / 'primary.db'}",
+        f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}",
+    )
+    async with models.engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+
+    # The replica starts as a copy of the primary
+    replica_engine = models.create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}"
+    )
+    async with replica_engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+
+    for engine in (models.engine, replica_engine):
+        async with AsyncSession(engine) as session:
+            user = models.DBUser(
+                email="test@example.com",
+                citizen_id="1234567890123",
+                first_name="Test",
+                last_name="User",
+                phone_number="0801234567",
+                current_address="Bangkok",
+                password="",
+            )
+            await user.set_password("password123")
+            session.add(user)
+            session.add(models.DBProvince(name="Krabi", tax_reduction_rate=0.50))
+            await session.commit()
+
+    yield
+    await replica_engine.dispose()
+    await models.close_db()
+
+
+async def test_reads_follow_own_writes_then_replica(replicated_db):
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        response = await client.post(
+            "/v1/token",
+            data={"username": "1234567890123", "password": "password123"},
+        )
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        # The write lands on the primary only
+        response = await client.post(
+            "/v1/user-provinces/target-province",
+            headers=headers,
+            json={"province_id": 1},
+        )
+        assert response.status_code == 200
+
+        # Inside the read-your-writes window the primary answers
+        response = await client.get("/v1/user-provinces/my-provinces", headers=headers)
+        assert [p["name"] for p in response.json()] == ["Krabi"]
+
+        # Afterwards reads go to the lagging replica
+        await cache.get_cache().delete(f"{consistency.RECENT_WRITE_KEY_PREFIX}1")
+        # ...past the response cached in the window
+        response_cache.get_cache().clear()
+        response = await client.get("/v1/user-provinces/my-provinces", headers=headers)
+        assert response.json() == []
@@ -0,0 +1,268 @@
+import pytest
+from httpx import ASGITransport, AsyncClient
+from sqlmodel import select
+
+from flasx import models
+from flasx.core import deps
+from flasx.core import last_login
+from flasx.main import app
+
+SHARDS = 3
+
+
+def citizen_id_on(shard: int, start: int = 0) -> str:
+    """A citizen ID that registration places on ``shard``"""
+    number = start
+    while True:
+        citizen_id = f"{1100000000000 + number}"
+        if models.sharding.shard_for_citizen_id(citizen_id, SHARDS) == shard:
+            return citizen_id
+        number += 1
+
+
+@pytest.fixture
+async def sharded_db(tmp_path):
+    models.configure_engines(
+        f"sqlite+aiosqlite:///{tmp_path / 'shard0.db'}",
+        shard_urls=[
+            f"sqlite+aiosqlite:///{tmp_path / f'shard{index}.db'}"
+            for index in range(1, SHARDS)
+        ],
+    )
+    await models.create_db_and_tables()
+    for shard in models.shards:
+        async with shard.session() as session:
+            session.add(models.DBProvince(name="Krabi", tax_reduction_rate=0.50))
+            session.add(models.DBProvince(name="Lampang", tax_reduction_rate=0.25))
+            await session.commit()
+
+    yield
+    await models.close_db()
+
+
+@pytest.fixture
+async def sharded_client(sharded_db):
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        yield client
+
+
+async def register(client: AsyncClient, shard: int, number: int) -> dict:
+    response = await client.post(
+        "/v1/register",
+        json={
+            "citizen_id": citizen_id_on(shard, number * 100),
+            "email": f"user{number}@example.com",
+            "first_name": "User",
+            "last_name": str(number),
+            "phone_number": f"08000000{number:02d}",
+            "current_address": "Bangkok",
+            "password": "password123",
+        },
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+async def login(client: AsyncClient, username: str) -> dict:
+    response = await client.post(
+        "/v1/token", data={"username": username, "password": "password123"}
+    )
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def users_on(shard: int) -> list[int]:
+    async with models.shards[shard].session() as session:
+        result = await session.exec(select(models.DBUser.id))
+        return result.all()
+
+
+async def test_users_live_on_the_shard_of_their_id(sharded_client):
+    users = [await register(sharded_client, shard, shard) for shard in range(SHARDS)]
+
+    for shard, user in enumerate(users):
+        assert models.shard_for_user(user["id"]) == shard
+        assert await users_on(shard) == [user["id"]]
+
+    # Unique across shards, not just within one
+    response = await sharded_client.post(
+        "/v1/register",
+        json={
+            "citizen_id": citizen_id_on(0, 5000),
+            "email": users[2]["email"],
+            "first_name": "Other",
+            "last_name": "User",
+            "phone_number": "0899999999",
+            "current_address": "Bangkok",
+            "password": "password123",
+        },
+    )
+    assert response.status_code == 409
+
+
+def test_next_user_id_keeps_to_the_shard():
+    assert models.sharding.next_user_id(None, 1, SHARDS) == 2
+    # Ids from before sharding, or of other shards, are skipped over
+    next_ids = [models.sharding.next_user_id(5, shard, SHARDS) for shard in range(3)]
+    assert next_ids == [7, 8, 6]
+    assert models.sharding.next_user_id(4, 0, SHARDS) == 7
+
+
+async def test_registration_retries_a_taken_id(sharded_client, monkeypatch):
+    first = await register(sharded_client, 1, 1)
+
+    allocate = models.sharding.allocate_user_id
+    taken = [first["id"]]
+
+    async def allocate_once_taken(session, shard, shard_count):
+        # As if another registration had committed between max(id) and insert
+        if taken:
+            return taken.pop()
+        return await allocate(session, shard, shard_count)
+
+    monkeypatch.setattr(models.sharding, "allocate_user_id", allocate_once_taken)
+    second = await register(sharded_client, 1, 2)
+    assert second["id"] == first["id"] + SHARDS
+    assert await users_on(1) == [first["id"], second["id"]]
+
+
+async def test_refuses_to_start_over_misplaced_users(sharded_db):
+    async with models.shards[1].session() as session:
+        session.add(
+            models.DBUser(
+                id=1,
+                email="old@example.com",
+                citizen_id="1100000000000",
+                first_name="Old",
+                last_name="User",
+                phone_number="0800000000",
+                current_address="Bangkok",
+                password="",
+            )
+        )
+        await session.commit()
+
+    with pytest.raises(RuntimeError, match="shard 1"):
+        await models.check_user_placement()
+
+
+async def test_requests_follow_the_user_to_their_shard(sharded_client, monkeypatch):
+    first = await register(sharded_client, 1, 1)
+    second = await register(sharded_client, 2, 2)
+
+    # By citizen ID and by phone number
+    headers = await login(sharded_client, first["citizen_id"])
+    other_headers = await login(sharded_client, second["phone_number"])
+
+    response = await sharded_client.post(
+        "/v1/user-provinces/target-province",
+        headers=headers,
+        json={"province_id": 1},
+    )
+    assert response.status_code == 200
+    async with models.shards[1].session() as session:
+        result = await session.exec(select(models.DBUserProvince.user_id))
+        assert result.all() == [first["id"]]
+
+    response = await sharded_client.get(
+        "/v1/user-provinces/my-provinces", headers=headers
+    )
+    assert [p["name"] for p in response.json()] == ["Krabi"]
+    response = await sharded_client.get(
+        "/v1/user-provinces/my-provinces", headers=other_headers
+    )
+    assert response.json() == []
+
+    # A user on another shard, by id
+    response = await sharded_client.get(
+        f"/v1/users/{first['id']}", headers=other_headers
+    )
+    assert response.json()["citizen_id"] == first["citizen_id"]
+
+    monkeypatch.setattr(deps.settings, "ADMIN_USER_IDS", [second["id"]])
+    response = await sharded_client.post(
+        "/v1/user-provinces/batch",
+        headers=other_headers,
+        json={"user_ids": [second["id"], first["id"], 999]},
+    )
+    body = response.json()
+    assert [user["user_id"] for user in body["users"]] == [second["id"], first["id"]]
+    assert [p["name"] for p in body["users"][1]["provinces"]] == ["Krabi"]
+    assert body["missing_user_ids"] == [999]
+
+    # Login dates are written on each user's own shard
+    await last_login.buffer.flush_with_new_session()
+    for shard, user in ((1, first), (2, second)):
+        async with models.shards[shard].session() as session:
+            db_user = await session.get(models.DBUser, user["id"])
+            assert db_user.last_login_date is not None
+
+
+async def test_catalog_changes_reach_every_shard(sharded_client):
+    user = await register(sharded_client, 0, 0)
+    headers = await login(sharded_client, user["citizen_id"])
+
+    response = await sharded_client.put(
+        "/v1/provinces/2",
+        headers=headers,
+        json={"name": "Lampang", "tax_reduction_rate": 0.3},
+    )
+    assert response.status_code == 200
+
+    for shard in models.shards:
+        async with shard.session() as session:
+            province = await session.get(models.DBProvince, 2)
+            assert province.tax_reduction_rate == 0.3
+
+
+async def test_catalog_changes_are_all_or_nothing(sharded_client):
+    user = await register(sharded_client, 0, 0)
+    headers = await login(sharded_client, user["citizen_id"])
+    # Lampang is missing on the last shard only
+    async with models.shards[-1].session() as session:
+        await session.delete(await session.get(models.DBProvince, 2))
+        await session.commit()
+
+    response = await sharded_client.put(
+        "/v1/provinces/2",
+        headers=headers,
+        json={"name": "Lampang", "tax_reduction_rate": 0.3},
+    )
+    assert response.status_code == 404
+
+    for shard in models.shards[:-1]:
+        async with shard.session() as session:
+            province = await session.get(models.DBProvince, 2)
+            assert province.tax_reduction_rate == 0.25
+
+
+async def test_citizen_id_cannot_change_once_sharded(sharded_client):
+    user = await register(sharded_client, 1, 1)
+    headers = await login(sharded_client, user["citizen_id"])
+    update = {
+        key: user[key]
+        for key in (
+            "email",
+            "first_name",
+            "last_name",
+            "phone_number",
+            "current_address",
+        )
+    }
+
+    response = await sharded_client.put(
+        f"/v1/users/{user['id']}/update",
+        headers=headers,
+        json={**update, "citizen_id": citizen_id_on(2)},
+    )
+    assert response.status_code == 400
+
+    response = await sharded_client.put(
+        f"/v1/users/{user['id']}/update",
+        headers=headers,
+        json={**update, "citizen_id": user["citizen_id"], "first_name": "Renamed"},
+    )
+    assert response.status_code == 200
+    await login(sharded_client, user["citizen_id"])
@@ -0,0 +1,280 @@
+import asyncio
+
+import pytest
+
+from flasx import models
+from flasx.core import cache
+from flasx.core import quota
+from flasx.core import response_cache
+from flasx.core import singleflight
+
+
+async def test_provinces_get_tier_from_rate(test_provinces):
+    rules = quota.get_rules()
+    assert [p.tier for p in test_provinces] == [
+        rules.by_name["primary"].id,
+        rules.by_name["primary"].id,
+        rules.by_name["primary"].id,
+        rules.by_name["secondary"].id,
+        rules.by_name["secondary"].id,
+    ]
+
+
+async def test_tier_endpoints(client, test_provinces):
+    response = await client.get("/v1/provinces/secondary/")
+    assert response.status_code == 200
+    names = [p["name"] for p in response.json()["provinces"]]
+    assert names == ["Lamphun", "Lampang"]
+
+    response = await client.get("/v1/provinces/tier/unknown/")
+    assert response.status_code == 404
+
+
+async def test_add_target_province_enforces_tier_quota(
+    client, test_session, test_provinces, auth_headers
+):
+    # Only one more secondary province fits once the user holds one
+    lamphun, lampang = test_provinces[3], test_provinces[4]
+    extra = models.DBProvince(name="Nan", tax_reduction_rate=0.25)
+    test_session.add(extra)
+    await test_session.commit()
+
+    for province in (lamphun, lampang):
+        response = await client.post(
+            "/v1/user-provinces/target-province",
+            headers=auth_headers,
+            json={"province_id": province.id},
+        )
+        assert response.status_code == 200
+
+    response = await client.post(
+        "/v1/user-provinces/target-province",
+        headers=auth_headers,
+        json={"province_id": extra.id},
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Maximum secondary province quota of 2 reached"
+
+    response = await client.get("/v1/user-provinces/my-quota", headers=auth_headers)
+    body = response.json()
+    assert body["secondary_provinces"] == 2
+    assert body["remaining_secondary_quota"] == 0
+    assert body["remaining_total_quota"] == 3
+
+
+async def test_home_province_is_excluded(client, test_provinces, auth_headers):
+    response = await client.get(
+        "/v1/user-provinces/available-provinces", headers=auth_headers
+    )
+    body = response.json()
+    assert [p["name"] for p in body["excluded_provinces"]] == ["Bangkok"]
+    assert [p["name"] for p in body["available_provinces"]["primary"]] == [
+        "Chiang Mai",
+        "Krabi",
+    ]
+
+
+async def test_single_flight_shares_one_load():
+    group = singleflight.Group()
+    release = asyncio.Event()
+    loads = 0
+
+    async def load():
+        nonlocal loads
+        loads += 1
+        await release.wait()
+        return ("Krabi",)
+
+    callers = [
+        asyncio.create_task(group.do(("user-provinces", 1), load)) for _ in range(3)
+    ]
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await asyncio.gather(*callers) == [("Krabi",)] * 3
+    assert loads == 1
+    stats = group.stats()["user-provinces"]
+    assert (stats.calls, stats.loads, stats.coalesced) == (3, 1, 2)
+
+    # Nothing is kept once the load is done
+    await group.do(("user-provinces", 1), load)
+    assert loads == 2
+
+
+async def test_single_flight_errors_and_cancellation():
+    group = singleflight.Group()
+    release = asyncio.Event()
+
+    async def failing():
+        await release.wait()
+        raise ValueError("boom")
+
+    callers = [asyncio.create_task(group.do(("catalog", 0), failing)) for _ in range(2)]
+    await asyncio.sleep(0)
+    release.set()
+    for caller in callers:
+        with pytest.raises(ValueError):
+            await caller
+
+    # A waiter takes over when the caller running the load is cancelled
+    release.clear()
+
+    async def load():
+        await release.wait()
+        return "catalog"
+
+    leader = asyncio.create_task(group.do(("catalog", 0), load))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(group.do(("catalog", 0), load))
+    await asyncio.sleep(0)
+    leader.cancel()
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await waiter == "catalog"
+    assert leader.cancelled()
+
+
+async def test_user_province_reads_go_through_single_flight(
+    client, test_provinces, auth_headers
+):
+    group = singleflight.get_group()
+    group.reset_stats()
+
+    response = await client.post(
+        "/v1/user-provinces/target-province",
+        headers=auth_headers,
+        json={"province_id": test_provinces[2].id},
+    )
+    assert response.status_code == 200
+
+    response = await client.get("/v1/user-provinces/my-provinces", headers=auth_headers)
+    assert [p["name"] for p in response.json()] == ["Krabi"]
+    assert group.stats()["user-provinces"].loads == 1
+
+
+async def test_batch_user_provinces(
+    client, test_session, test_user, test_provinces, auth_headers
+):
+    for province in (test_provinces[1], test_provinces[3]):
+        test_session.add(
+            models.DBUserProvince(user_id=test_user.id, province_id=province.id)
+        )
+    await test_session.commit()
+
+    response = await client.post(
+        "/v1/user-provinces/batch",
+        headers=auth_headers,
+        json={"user_ids": [999, test_user.id, test_user.id]},
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert body["missing_user_ids"] == [999]
+    [user] = body["users"]
+    assert user["user_id"] == test_user.id
+    assert [p["name"] for p in user["provinces"]] == ["Chiang Mai", "Lamphun"]
+    assert user["quota"]["primary_provinces"] == 1
+    assert user["quota"]["remaining_total_quota"] == 3
+
+    response = await client.post(
+        "/v1/user-provinces/batch", headers=auth_headers, json={"user_ids": [999]}
+    )
+    assert response.json() == {"users": [], "missing_user_ids": [999]}
+
+    response = await client.post(
+        "/v1/user-provinces/batch",
+        headers=auth_headers,
+        json={"user_ids": list(range(models.MAX_BATCH_USERS + 1))},
+    )
+    assert response.status_code == 422
+
+
+async def test_responses_are_cached_until_selections_change(
+    client, test_provinces, auth_headers
+):
+    responses = response_cache.get_cache()
+    for _ in range(2):
+        response = await client.get(
+            "/v1/user-provinces/my-provinces", headers=auth_headers
+        )
+        assert response.json() == []
+        response = await client.get("/v1/user-provinces/my-quota", headers=auth_headers)
+        assert response.json()["total_provinces"] == 0
+    assert (responses.stats.hits, responses.stats.misses) == (2, 2)
+
+    response = await client.post(
+        "/v1/user-provinces/target-province",
+        headers=auth_headers,
+        json={"province_id": test_provinces[2].id},
+    )
+    assert response.status_code == 200
+
+    response = await client.get("/v1/user-provinces/my-provinces", headers=auth_headers)
+    [krabi] = response.json()
+    # Rendered through the response model, as an uncached response would be
+    assert set(krabi) == set(models.Province.model_fields)
+    response = await client.get("/v1/user-provinces/my-quota", headers=auth_headers)
+    assert response.json()["total_provinces"] == 1
+    response = await client.get(
+        "/v1/user-provinces/available-provinces", headers=auth_headers
+    )
+    assert response.json()["available_provinces"]["primary"][0]["name"] == "Chiang Mai"
+
+    response = await client.get("/v1/admin/response-cache", headers=auth_headers)
+    stats = response.json()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (2, 5, 5)
+    assert stats["hit_ratio"] == pytest.approx(2 / 7)
+
+
+async def test_catalog_changes_on_another_worker_reach_cached_responses(
+    client, test_provinces, auth_headers
+):
+    responses = response_cache.get_cache()
+    await client.get("/v1/user-provinces/available-provinces", headers=auth_headers)
+    await client.get("/v1/user-provinces/available-provinces", headers=auth_headers)
+    assert responses.stats.hits == 1
+
+    # Another worker changed the catalog: only the shared cache tells
+    await response_cache.bump_catalog_version()
+    await client.get("/v1/user-provinces/available-provinces", headers=auth_headers)
+    assert (responses.stats.hits, responses.stats.misses) == (1, 2)
+
+
+def test_response_cache_evicts_least_recently_used():
+    responses = response_cache.ResponseCache(max_entries=3, max_bytes=10)
+    responses.put("a", b"1234")
+    responses.put("b", b"1234")
+    assert responses.get("a") == b"1234"
+
+    # Over the byte bound, so "b" goes
+    responses.put("c", b"1234")
+    assert responses.get("b") is None
+    assert (len(responses), responses.size_bytes) == (2, 8)
+
+    # Larger than the whole cache: not stored
+    responses.put("d", b"x" * 11)
+    assert responses.get("d") is None
+    assert responses.stats.evictions == 1
+
+
+async def test_local_versions_survive_eviction():
+    shared = cache.LocalCache(max_entries=2)
+    await shared.incr("catalog-version")
+    await shared.incr("catalog-version")
+    for key in ("a", "b", "c", "d"):
+        await shared.set(key, "1", ttl=60)
+    assert await shared.get("catalog-version") == "2"
+    assert await shared.incr("catalog-version") == 3
+
+
+def test_response_cache_is_off_for_workers_without_a_shared_cache(monkeypatch):
+    monkeypatch.setattr(response_cache.settings, "REDIS_URL", None)
+    monkeypatch.setattr(response_cache.settings, "WORKERS", 4)
+    responses = response_cache.new_cache()
+    responses.put("a", b"1234")
+    assert responses.get("a") is None
+
+    monkeypatch.setattr(response_cache.settings, "WORKERS", 1)
+    responses = response_cache.new_cache()
+    responses.put("a", b"1234")
+    assert responses.get("a") == b"1234"
@@ -0,0 +1,64 @@
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from flasx import models
+from flasx.core import province_distances
+from flasx.core import province_search
+from flasx.core import warmup
+from flasx.main import app
+
+
+@pytest.fixture
+async def cold_db(tmp_path):
+    models.configure_engines(f"sqlite+aiosqlite:///{tmp_path / 'cold.db'}")
+    await models.create_db_and_tables()
+    async with models.shards[0].session() as session:
+        session.add(models.DBProvince(name="Krabi", tax_reduction_rate=0.50))
+        await session.commit()
+    # Start as cold as a fresh worker
+    await models.engine.dispose()
+    await models.read_engine.dispose()
+    warmup.reset()
+    province_search.set_index(None)
+    province_distances.set_distances(None)
+    app.openapi_schema = None
+
+    yield
+    warmup.reset()
+    province_search.set_index(None)
+    province_distances.set_distances(None)
+    await models.close_db()
+
+
+async def test_not_ready_until_warmed_up(cold_db):
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        response = await client.get("/ready")
+        assert response.status_code == 503
+
+        state = await warmup.warm_up(app)
+        assert state.failed_steps == []
+        assert list(state.steps) == [
+            "pools",
+            "hot_queries",
+            "catalog",
+            "openapi",
+            "requests",
+            "password_hash",
+        ]
+
+        response = await client.get("/ready")
+        assert response.status_code == 200
+        assert response.json()["status"] == "ready"
+
+    # One writer connection and a full read pool, already open
+    assert models.engine.sync_engine.pool.checkedin() == 1
+    assert models.read_engine.sync_engine.pool.checkedin() == min(
+        models.settings.WARMUP_POOL_CONNECTIONS, models.settings.SQLITE_READ_POOL_SIZE
+    )
+    # Every hot statement compiled on both engines
+    for stats in models.statements.compiled_cache_stats().values():
+        assert stats.entries >= len(warmup.HOT_QUERIES)
+    assert province_search.get_index() is not None
+    assert app.openapi_schema is not None